@@ -52,6 +52,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.instrumentacao.InstrumentacaoMiddleware',
+    'core.metricas.MetricasMiddleware',
+    'core.compressao.CompressaoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.perfis.PerfilMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -92,6 +96,21 @@ DATABASES = {
 }
 
 
+# Cache
+# 'compartilhado' é visto por todos os processos do servidor (gunicorn) sem depender
+# de serviço externo; é usado, por exemplo, na versão do catálogo de produtos.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'compartilhado': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -148,10 +167,88 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
 
+    # JSONRendererMedido mede o tempo de serialização para o Server-Timing
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.instrumentacao.JSONRendererMedido',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 15 # Define o número de itens por página
 }
 
+# Descontos progressivos por quantidade usados na cotação em lote (/api/cotacao/)
+# Ex: [{'quantidade_minima': 500, 'percentual': 5}, {'quantidade_minima': 1000, 'percentual': 10}]
+FAIXAS_DESCONTO_QUANTIDADE = []
+
+# Threads usadas para rodar em paralelo as consultas independentes dos relatórios
+# (cada thread mantém a sua conexão com o banco). 1 = tudo em sequência.
+RELATORIOS_THREADS = 4
+# Conexões das threads ociosas por mais tempo que isto são reabertas (abaixo do wait_timeout do MySQL)
+RELATORIOS_CONEXAO_OCIOSA_SEGUNDOS = 300
+
+# Instrumentação por requisição (core/instrumentacao.py): Server-Timing e log 'core.desempenho'.
+# O detector de N+1 acusa formatos de consulta repetidos 'limite_n_mais_um' vezes ou mais.
+# A linha de log de cada requisição sai em DEBUG; as que passam de 'log_lentas_ms' saem em INFO.
+INSTRUMENTACAO = {
+    'ativa': True,
+    'detectar_n_mais_um': DEBUG,
+    'limite_n_mais_um': 5,
+    'consultas_lentas': 3,
+    'log_lentas_ms': 1000,
+}
+
+# Métricas do Prometheus em /metrics (ver core/metricas.py). Cada processo grava os seus
+# valores em 'diretorio' (padrão: BASE_DIR / 'metricas'), que deve ser o mesmo para todos os workers
+# da máquina. O /metrics exige o 'token' (Bearer) ou o JWT de um usuário staff; 'publica' libera o acesso.
+METRICAS = {
+    'ativa': True,
+    'diretorio': os.environ.get('METRICAS_DIRETORIO') or None,
+    'intervalo_gravacao': 5,
+    'token': os.environ.get('METRICAS_TOKEN') or None,
+    'publica': False,
+}
+
+# Compressão Brotli/gzip das respostas, negociada pelo Accept-Encoding (ver core/compressao.py)
+COMPRESSAO = {
+    'ativa': True,
+    'tamanho_minimo': 1024,
+    'qualidade_brotli': 4,
+    'nivel_gzip': 6,
+}
+
+# Sincronização incremental dos tablets (/api/sincronizacao/, ver core/sincronizacao.py).
+# Marcas de exclusão mais antigas que a retenção: python manage.py limpar_exclusoes (agendar no cron)
+SINCRONIZACAO = {
+    'limite_padrao': 500,
+    'limite_maximo': 2000,
+    'margem_segundos': 10,
+    'retencao_exclusoes_dias': 90,
+}
+
+# Perfil sob demanda (cabeçalho X-Perfil ou ?perfil=, só para staff; ver core/perfis.py)
+PERFIS = {
+    'ativo': True,
+    'diretorio': None,
+    'maximo_perfis': 50,
+    'modo_padrao': 'cprofile',
+    'intervalo_amostragem_ms': 2,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.desempenho': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Intervalo (segundos) em que cada processo procura eventos novos para o stream SSE (/api/eventos/)
+EVENTOS_INTERVALO_SEGUNDOS = 1.0
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60), # Duração do token de acesso
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),    # Duração do token de atualização
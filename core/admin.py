@@ -8,16 +8,25 @@ from .models import (
     ItemOrcamento,
     Pedido,
     ItemPedido,
-    Despesa
+    Despesa,
+    ReajustePreco
 )
 
 # O comando admin.site.register() torna o modelo visível e gerenciável
 # na interface de administração do Django.
 
-admin.site.register(Cliente)
 admin.site.register(Produto)
 admin.site.register(Orcamento)
 admin.site.register(ItemOrcamento)
 admin.site.register(Pedido)
 admin.site.register(ItemPedido)
-admin.site.register(Despesa)
\ No newline at end of file
+admin.site.register(Despesa)
+admin.site.register(ReajustePreco)
+
+
+@admin.register(Cliente)
+class ClienteAdmin(admin.ModelAdmin):
+    # Clientes com documento recusado na normalização (migração 0005) aparecem no filtro de pendência
+    list_display = ('nome', 'cpf_cnpj', 'cpf_cnpj_pendente', 'cpf_cnpj_pendencia')
+    list_filter = ('cpf_cnpj_pendencia',)
+    search_fields = ('nome', 'cpf_cnpj', 'cpf_cnpj_pendente')
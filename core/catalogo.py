@@ -0,0 +1,106 @@
+# core/catalogo.py
+"""
+Cache em memória do catálogo de produtos.
+
+O catálogo é pequeno, muda pouco e é lido o tempo todo (cálculo de subtotal,
+serialização e validação dos itens). Cada processo mantém uma cópia de todos
+os produtos e só a recarrega quando a versão no cache compartilhado muda;
+a versão é trocada a cada gravação ou exclusão de Produto (ver core/signals.py).
+
+A versão compartilhada (um arquivo no FileBasedCache) é lida uma vez por
+requisição: serializar uma lista com N itens faz uma leitura, não N. Fora de
+requisições (comandos, shell) ela é lida a cada acesso. Uma troca de versão feita
+por outro processo no meio de uma requisição é vista na próxima; as gravações do
+próprio processo (invalidar) valem na hora.
+"""
+import contextvars
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+from .metricas import registrar_cache
+
+ALIAS_CACHE = 'compartilhado'
+CHAVE_VERSAO = 'catalogo_produtos:versao'
+
+# None fora de requisições; False no início de cada uma; True depois que a versão foi conferida
+_versao_conferida = contextvars.ContextVar('catalogo_versao_conferida', default=None)
+
+
+@receiver(request_started)
+def _nova_requisicao(sender, **kwargs):
+    _versao_conferida.set(False)
+
+
+class CatalogoProdutos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = None
+        self._produtos = {}
+
+    def _versao_compartilhada(self):
+        cache = caches[ALIAS_CACHE]
+        versao = cache.get(CHAVE_VERSAO)
+        if versao is None:
+            cache.add(CHAVE_VERSAO, uuid.uuid4().hex, None)
+            versao = cache.get(CHAVE_VERSAO)
+        return versao
+
+    def _carregar(self, versao):
+        from .models import Produto
+
+        self._produtos = {produto.id: produto for produto in Produto.objects.all()}
+        self._versao = versao
+
+    def produtos(self):
+        """ Dicionário {id: Produto} atualizado com a versão compartilhada. """
+        conferida = _versao_conferida.get()
+        if conferida and self._versao is not None:
+            return self._produtos
+        versao = self._versao_compartilhada()
+        if conferida is not None:
+            _versao_conferida.set(True)
+        registrar_cache('catalogo', versao == self._versao)
+        if versao != self._versao:
+            with self._lock:
+                if versao != self._versao:
+                    self._carregar(versao)
+        return self._produtos
+
+    def versao(self):
+        """ Versão compartilhada atual (muda a cada gravação de Produto), sem recarregar o catálogo. """
+        return self._versao_compartilhada()
+
+    def obter(self, produto_id):
+        """
+        Produto pelo id, sem consulta ao banco. Um id desconhecido (ex: criado em outro
+        processo antes da troca de versão chegar) é buscado uma única vez e guardado,
+        se o catálogo ainda estiver na versão em que a busca começou. O dicionário é
+        trocado por uma cópia, nunca alterado: quem lê sem o lock não o vê mudar.
+        """
+        if produto_id is None:
+            return None
+        produto = self.produtos().get(produto_id)
+        if produto is None:
+            from .models import Produto
+
+            versao = self._versao
+            produto = Produto.objects.filter(pk=produto_id).first()
+            if produto is not None:
+                with self._lock:
+                    if self._versao == versao and self._versao is not None:
+                        self._produtos = {**self._produtos, produto.id: produto}
+        return produto
+
+    def invalidar(self):
+        """ Descarta a cópia local e troca a versão, forçando a recarga em todos os processos. """
+        with self._lock:
+            self._versao = None
+            self._produtos = {}
+        caches[ALIAS_CACHE].set(CHAVE_VERSAO, uuid.uuid4().hex, None)
+
+
+catalogo = CatalogoProdutos()
@@ -0,0 +1,164 @@
+# core/compressao.py
+"""
+Compressão das respostas (Brotli ou gzip), negociada pelo Accept-Encoding.
+
+Listas com itens aninhados, relatórios e PDFs são grandes e os tablets estão
+em conexões lentas. O CompressaoMiddleware escolhe a codificação que o cliente
+aceita com o maior q (no empate, Brotli, que comprime melhor o JSON) e:
+- só comprime os tipos de 'tipos' (JSON, texto, PDF...) e respostas de pelo
+  menos 'tamanho_minimo' bytes; abaixo disso o cabeçalho custa mais que o ganho;
+- não mexe no que já tem Content-Encoding, nem em Cache-Control: no-transform;
+- em respostas em streaming (síncronas ou assíncronas) comprime pedaço a
+  pedaço; no text/event-stream cada evento é descarregado (flush) na hora,
+  para não segurar o evento no compressor.
+
+Fica depois do InstrumentacaoMiddleware e do MetricasMiddleware, para que o
+tempo de compressão entre no Server-Timing e nas métricas.
+
+Configuração (settings.COMPRESSAO): 'ativa', 'tamanho_minimo', 'tipos',
+'qualidade_brotli' (0-11) e 'nivel_gzip' (1-9). Medição do efeito em links
+lentos: python manage.py benchmark_compressao
+"""
+import zlib
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+CONFIGURACAO_PADRAO = {
+    'ativa': True,
+    'tamanho_minimo': 1024,
+    'tipos': [
+        'application/json', 'application/pdf', 'application/javascript', 'application/xml',
+        'image/svg+xml', 'text/',
+    ],
+    # Qualidade 4 e nível 6: bom ganho com pouco custo de CPU para conteúdo gerado a cada requisição
+    'qualidade_brotli': 4,
+    'nivel_gzip': 6,
+}
+
+BROTLI = 'br'
+GZIP = 'gzip'
+# Preferência do servidor quando o cliente aceita as duas com o mesmo q
+PREFERENCIA = (BROTLI, GZIP)
+
+
+def configuracao():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'COMPRESSAO', {})}
+
+
+def escolher_codificacao(accept_encoding):
+    """ 'br', 'gzip' ou None, conforme os valores de q do Accept-Encoding. """
+    aceitas = {}
+    for parte in accept_encoding.split(','):
+        nome, _, parametros = parte.strip().partition(';')
+        q = 1.0
+        for parametro in parametros.split(';'):
+            chave, _, valor = parametro.strip().partition('=')
+            if chave.strip().lower() == 'q':
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if nome:
+            aceitas[nome.strip().lower()] = q
+
+    def peso(codificacao):
+        return aceitas.get(codificacao, aceitas.get('*', 0.0))
+
+    melhor = max(PREFERENCIA, key=lambda codificacao: (peso(codificacao), -PREFERENCIA.index(codificacao)))
+    return melhor if peso(melhor) > 0 else None
+
+
+class Compressor:
+    """ Interface única para os compressores incrementais de Brotli e gzip. """
+
+    def __init__(self, codificacao, config):
+        self.codificacao = codificacao
+        if codificacao == BROTLI:
+            self._brotli = brotli.Compressor(quality=config['qualidade_brotli'])
+        else:
+            # wbits=31: formato gzip (cabeçalho e CRC), não o zlib puro
+            self._zlib = zlib.compressobj(config['nivel_gzip'], zlib.DEFLATED, 31)
+
+    def comprimir(self, dados, descarregar=False):
+        if self.codificacao == BROTLI:
+            saida = self._brotli.process(dados)
+            return saida + self._brotli.flush() if descarregar else saida
+        saida = self._zlib.compress(dados)
+        return saida + self._zlib.flush(zlib.Z_SYNC_FLUSH) if descarregar else saida
+
+    def finalizar(self):
+        return self._brotli.finish() if self.codificacao == BROTLI else self._zlib.flush()
+
+
+def comprimir(conteudo, codificacao, config=None):
+    compressor = Compressor(codificacao, config or configuracao())
+    return compressor.comprimir(conteudo) + compressor.finalizar()
+
+
+def _comprimir_fluxo(conteudo, compressor, descarregar):
+    for pedaco in conteudo:
+        saida = compressor.comprimir(pedaco, descarregar)
+        if saida:
+            yield saida
+    yield compressor.finalizar()
+
+
+async def _comprimir_fluxo_async(conteudo, compressor, descarregar):
+    async for pedaco in conteudo:
+        saida = compressor.comprimir(pedaco, descarregar)
+        if saida:
+            yield saida
+    yield compressor.finalizar()
+
+
+def _tipo_compressivel(response, tipos):
+    tipo = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return any(tipo.startswith(prefixo) if prefixo.endswith('/') else tipo == prefixo for prefixo in tipos)
+
+
+class CompressaoMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        config = configuracao()
+        if not config['ativa'] or request.method == 'HEAD' or response.status_code in (204, 304):
+            return response
+        if response.has_header('Content-Encoding') or not _tipo_compressivel(response, config['tipos']):
+            return response
+        if 'no-transform' in response.get('Cache-Control', '').lower():
+            return response
+        if not response.streaming and len(response.content) < config['tamanho_minimo']:
+            return response
+
+        # A resposta depende do Accept-Encoding mesmo quando este cliente não aceita compressão
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codificacao = escolher_codificacao(request.headers.get('Accept-Encoding', ''))
+        if codificacao is None:
+            return response
+
+        if response.streaming:
+            compressor = Compressor(codificacao, config)
+            descarregar = response.get('Content-Type', '').startswith('text/event-stream')
+            if response.is_async:
+                response.streaming_content = _comprimir_fluxo_async(response.streaming_content, compressor, descarregar)
+            else:
+                response.streaming_content = _comprimir_fluxo(response.streaming_content, compressor, descarregar)
+            del response.headers['Content-Length']
+        else:
+            comprimido = comprimir(response.content, codificacao, config)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response.headers['Content-Length'] = str(len(comprimido))
+
+        # O corpo mudou: uma ETag forte deixa de valer byte a byte (como no GZipMiddleware do Django)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = codificacao
+        return response
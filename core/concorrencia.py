@@ -0,0 +1,123 @@
+# core/concorrencia.py
+"""
+Execução concorrente de consultas independentes dos relatórios.
+
+Cada relatório monta um dicionário {nome: função}; as funções rodam em um pool
+fixo de threads e cada thread usa a sua própria conexão com o banco (o Django
+mantém uma conexão por thread). A conexão fica aberta entre as tarefas: abrir uma
+conexão (no MySQL, TCP + autenticação) a cada consulta custaria mais que o ganho
+do paralelismo. Ela é descartada e reaberta só quando fica ociosa mais que
+RELATORIOS_CONEXAO_OCIOSA_SEGUNDOS (antes do wait_timeout do servidor) ou quando
+deixa de responder depois de um erro, e é fechada quando o processo termina.
+
+O tempo de resposta passa a ser o da consulta mais lenta em vez da soma de todas.
+As tarefas rodam com uma cópia do contexto da requisição, e as consultas feitas
+nas threads entram na instrumentação da requisição (core/instrumentacao.py).
+Roda em sequência (na thread da requisição) quando há uma transação aberta, cujos
+dados as outras conexões não veriam, em bancos SQLite em memória (testes) e durante
+um perfil sob demanda (core/perfis.py), que só enxerga a thread da requisição.
+"""
+import atexit
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+
+from .instrumentacao import instrumentar_conexao
+from .perfis import perfilando
+
+OCIOSA_PADRAO_SEGUNDOS = 300
+
+_executor = None
+_trabalhadores = 0
+_lock = threading.Lock()
+_thread = threading.local()
+
+
+def _obter_executor():
+    global _executor, _trabalhadores
+    with _lock:
+        if _executor is None:
+            _trabalhadores = getattr(settings, 'RELATORIOS_THREADS', 4)
+            _executor = ThreadPoolExecutor(max_workers=_trabalhadores, thread_name_prefix='relatorios')
+        return _executor
+
+
+def _renovar_conexoes():
+    """ Descarta as conexões da thread que ficaram ociosas demais ou quebradas; as demais são reaproveitadas. """
+    ociosa = getattr(settings, 'RELATORIOS_CONEXAO_OCIOSA_SEGUNDOS', OCIOSA_PADRAO_SEGUNDOS)
+    expirou = time.monotonic() - getattr(_thread, 'ultimo_uso', 0) > ociosa
+    for conexao in connections.all(initialized_only=True):
+        if conexao.connection is None:
+            continue
+        if expirou:
+            conexao.close()
+        elif conexao.errors_occurred:
+            if conexao.is_usable():
+                conexao.errors_occurred = False
+            else:
+                conexao.close()
+
+
+def _executar_com_conexao_propria(funcao):
+    _renovar_conexoes()
+    try:
+        with instrumentar_conexao():
+            return funcao()
+    finally:
+        _thread.ultimo_uso = time.monotonic()
+
+
+def encerrar():
+    """ Fecha as conexões das threads do pool e o pool (chamado no fim do processo). """
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is None:
+        return
+    # Uma tarefa por thread: a barreira impede que uma thread pegue duas e deixe outra sem fechar
+    barreira = threading.Barrier(_trabalhadores, timeout=5)
+
+    def fechar():
+        try:
+            barreira.wait()
+        except threading.BrokenBarrierError:
+            pass
+        connections.close_all()
+
+    for _ in range(_trabalhadores):
+        executor.submit(fechar)
+    executor.shutdown(wait=True)
+
+
+atexit.register(encerrar)
+
+
+def pode_paralelizar():
+    if getattr(settings, 'RELATORIOS_THREADS', 4) <= 1:
+        return False
+    if connection.in_atomic_block or perfilando():
+        return False
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        return False
+    return True
+
+
+def executar_em_paralelo(tarefas):
+    """
+    Executa as funções de {nome: função} e devolve {nome: resultado}.
+    As funções devem devolver dados já avaliados (listas, números, serializer.data),
+    não QuerySets, para que a consulta aconteça dentro da thread.
+    """
+    if len(tarefas) <= 1 or not pode_paralelizar():
+        return {nome: funcao() for nome, funcao in tarefas.items()}
+
+    executor = _obter_executor()
+    futuros = {
+        nome: executor.submit(contextvars.copy_context().run, _executar_com_conexao_propria, funcao)
+        for nome, funcao in tarefas.items()
+    }
+    return {nome: futuro.result() for nome, futuro in futuros.items()}
@@ -0,0 +1,89 @@
+# core/condicional.py
+"""
+GET condicional (ETag e Last-Modified) para as listagens e os detalhes que as
+telas recarregam o tempo todo.
+
+Os validadores saem só das colunas 'atualizado_em', sem serializar nada:
+- detalhe: uma consulta com as colunas 'campos_versao' da linha;
+- listagem: Max() de cada coluna e Count() do queryset já filtrado (o Count
+  percebe as exclusões, que não deixam data).
+Com If-None-Match (ou If-Modified-Since) batendo, a resposta é 304 sem corpo.
+
+'campos_versao' inclui as colunas dos registros aninhados na resposta (ex:
+'cliente__atualizado_em'). Itens e pagamentos não têm coluna própria: gravá-los
+atualiza o 'atualizado_em' do orçamento ou do pedido (ver core/signals.py). O
+nome dos produtos dos itens vem do catálogo; com 'usa_catalogo' a versão dele
+entra na ETag.
+
+A ETag é o validador principal. Last-Modified só vai no detalhe: na listagem
+uma exclusão não muda o Max() e a data sozinha deixaria passar a mudança.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .catalogo import catalogo
+
+
+def calcular_etag(request, *partes):
+    """ ETag fraca a partir da URL, do formato da resposta e das versões dos dados. """
+    conteudo = '|'.join(
+        str(parte) for parte in (request.get_full_path(), getattr(request, 'accepted_media_type', ''), *partes)
+    )
+    return f'W/"{hashlib.sha1(conteudo.encode()).hexdigest()}"'
+
+
+def responder_condicional(request, etag, ultima_alteracao, gerar_resposta):
+    """
+    304 se as condições da requisição batem com os validadores; senão chama
+    gerar_resposta(). Os validadores vão nas duas respostas, com 'no-cache' para
+    que o navegador sempre revalide em vez de usar a cópia por heurística.
+    """
+    last_modified = int(ultima_alteracao.timestamp()) if ultima_alteracao else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = gerar_resposta()
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class GetCondicionalMixin:
+    """ list() e retrieve() de um ModelViewSet com GET condicional. """
+    campos_versao = ('atualizado_em',)
+    usa_catalogo = False
+
+    def _versoes_extras(self):
+        return (catalogo.versao(),) if self.usa_catalogo else ()
+
+    def list(self, request, *args, **kwargs):
+        versao = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+            total=Count('pk'), **{f'versao_{indice}': Max(campo) for indice, campo in enumerate(self.campos_versao)}
+        )
+        etag = calcular_etag(request, *versao.values(), *self._versoes_extras())
+        return responder_condicional(
+            request, etag, None, lambda: super(GetCondicionalMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        valor = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            linha = self.filter_queryset(self.get_queryset())\
+                .filter(**{self.lookup_field: valor}).values_list(*self.campos_versao).first()
+        except (TypeError, ValueError, ValidationError):
+            linha = None
+        if linha is None:
+            # Inexistente ou id inválido: o retrieve() padrão responde o 404
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = calcular_etag(request, *linha, *self._versoes_extras())
+        ultima_alteracao = max((data for data in linha if data is not None), default=None)
+        return responder_condicional(
+            request, etag, ultima_alteracao, lambda: super(GetCondicionalMixin, self).retrieve(request, *args, **kwargs)
+        )
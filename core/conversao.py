@@ -0,0 +1,125 @@
+# core/conversao.py
+"""
+Conversão de orçamentos em pedidos (um ou vários de uma vez).
+
+É o único caminho de conversão: usado por Orcamento.gerar_pedido, pela ação
+converter-para-pedido e pela conversão em lote. Os pedidos e todos os itens são
+criados com bulk_create e o valor_total vem direto da soma dos subtotais do
+orçamento (os preços do orçamento são mantidos; nada é salvo item a item).
+
+Como bulk_create não dispara sinais, as tabelas derivadas (estatísticas do
+cliente, vendas mensais) e os eventos de pedido novo são atualizados aqui.
+
+Conversões concorrentes do mesmo orçamento: as linhas dos orçamentos são lidas
+com select_for_update() dentro da transação (em ordem de id, para não haver
+deadlock entre lotes), então a segunda conversão espera a primeira terminar e
+então vê o pedido criado, recusando o orçamento com JA_CONVERTIDO.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .estatisticas import atualizar_estatisticas_clientes
+from .eventos import PEDIDO_CRIADO, publicar
+from .models import ItemPedido, Orcamento, Pedido
+from .vendas_mensais import marcar_para_atualizar
+
+STATUS_APROVADO = 'Aprovado'
+JA_CONVERTIDO = 'Este orçamento já foi convertido em um pedido.'
+SEM_ITENS = 'Este orçamento não possui itens para converter.'
+NAO_ENCONTRADO = 'Orçamento não encontrado.'
+
+
+def _atualizar_derivados(clientes, produtos, data_criacao):
+    atualizar_estatisticas_clientes(clientes)
+    for produto_id in produtos:
+        marcar_para_atualizar(produto_id, data_criacao)
+
+
+def converter_orcamentos(orcamento_ids):
+    """
+    Converte os orçamentos em pedidos numa única transação.
+    Retorna (pedidos criados, {orcamento_id: motivo} dos que não puderam ser convertidos).
+    """
+    orcamento_ids = list(dict.fromkeys(orcamento_ids))
+
+    with transaction.atomic():
+        # O bloqueio dos orçamentos serializa as conversões; itens e pedidos são lidos depois dele
+        orcamentos = {
+            orcamento.id: orcamento
+            for orcamento in Orcamento.objects.select_for_update().filter(id__in=orcamento_ids)
+            .order_by('id').prefetch_related('itens')
+        }
+        recusados = {orcamento_id: NAO_ENCONTRADO for orcamento_id in orcamento_ids if orcamento_id not in orcamentos}
+        ja_convertidos = set(
+            Pedido.objects.filter(orcamento_origem_id__in=list(orcamentos))
+            .values_list('orcamento_origem_id', flat=True)
+        )
+        validos = []
+        for orcamento_id in orcamento_ids:
+            orcamento = orcamentos.get(orcamento_id)
+            if orcamento is None:
+                continue
+            if orcamento_id in ja_convertidos:
+                recusados[orcamento_id] = JA_CONVERTIDO
+            elif not orcamento.itens.all():
+                recusados[orcamento_id] = SEM_ITENS
+            else:
+                validos.append(orcamento)
+        if not validos:
+            return [], recusados
+
+        agora = timezone.now()
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(
+                cliente_id=orcamento.cliente_id,
+                orcamento_origem=orcamento,
+                valor_total=sum((item.subtotal for item in orcamento.itens.all()), 0),
+                status_producao='Aguardando',
+                status_pagamento=Pedido.StatusPagamento.PENDENTE,
+                data_criacao=agora,
+            )
+            for orcamento in validos
+        ])
+        if any(pedido.pk is None for pedido in pedidos):
+            # Bancos sem RETURNING no INSERT em lote (MySQL): busca os ids pela origem
+            ids = dict(
+                Pedido.objects.filter(orcamento_origem__in=validos).values_list('orcamento_origem_id', 'id')
+            )
+            for pedido in pedidos:
+                pedido.pk = ids[pedido.orcamento_origem_id]
+
+        ItemPedido.objects.bulk_create([
+            ItemPedido(
+                pedido=pedido,
+                produto_id=item.produto_id,  # pode ser None se for item manual
+                quantidade=item.quantidade,
+                largura=item.largura,
+                altura=item.altura,
+                descricao_customizada=item.descricao_customizada,
+                subtotal=item.subtotal,
+            )
+            for pedido, orcamento in zip(pedidos, validos)
+            for item in orcamento.itens.all()
+        ], batch_size=1000)
+
+        Orcamento.objects.filter(id__in=[orcamento.id for orcamento in validos]).update(
+            status=STATUS_APROVADO, atualizado_em=agora
+        )
+        for orcamento in validos:
+            orcamento.status = STATUS_APROVADO
+
+        clientes = {pedido.cliente_id for pedido in pedidos}
+        produtos = {
+            item.produto_id for orcamento in validos for item in orcamento.itens.all() if item.produto_id
+        }
+        transaction.on_commit(lambda: _atualizar_derivados(clientes, produtos, agora))
+        for pedido in pedidos:
+            publicar(
+                PEDIDO_CRIADO,
+                pedido_id=pedido.id,
+                cliente_id=pedido.cliente_id,
+                status_producao=pedido.status_producao,
+                status_pagamento=pedido.status_pagamento,
+            )
+
+    return pedidos, recusados
@@ -0,0 +1,143 @@
+# core/dashboard.py
+"""
+Widgets do dashboard.
+
+Cada widget é uma função que recebe um ContextoDashboard e devolve os dados já
+avaliados (prontos para a resposta). As views individuais (dashboard-stats,
+vendas-recentes, ...) e o endpoint composto (/api/dashboard/) usam as mesmas
+funções; o contexto guarda o período e os querysets compartilhados entre widgets.
+"""
+import datetime
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Despesa, ItemPedido, Pagamento, Pedido
+from .serializers import PedidoSerializer
+
+
+class ContextoDashboard:
+    """ Período selecionado e querysets reaproveitados pelos widgets. """
+
+    def __init__(self, data_inicio=None, data_fim=None):
+        hoje = timezone.now().date()
+        self.data_inicio = data_inicio or hoje.replace(day=1)
+        self.data_fim = data_fim or hoje
+
+    @property
+    def pedidos_no_periodo(self):
+        return Pedido.objects.filter(data_criacao__date__range=[self.data_inicio, self.data_fim])
+
+    @property
+    def pedidos_nao_quitados(self):
+        return Pedido.objects.filter(Q(status_pagamento='PENDENTE') | Q(status_pagamento='PARCIAL'))
+
+
+def widget_stats(contexto):
+    # Faturamento e custo de produção do período saem da mesma agregação
+    totais_pedidos = contexto.pedidos_no_periodo.aggregate(
+        faturamento=Sum('valor_total'), custo_producao=Sum('custo_producao')
+    )
+    faturamento = totais_pedidos['faturamento'] or 0
+    custo_producao_pedidos = totais_pedidos['custo_producao'] or 0
+    despesas_operacionais = Despesa.objects.filter(
+        data__range=[contexto.data_inicio, contexto.data_fim]
+    ).aggregate(total=Sum('valor'))['total'] or 0
+    despesas_totais = despesas_operacionais + custo_producao_pedidos
+    lucro = faturamento - custo_producao_pedidos
+
+    # Valor a Receber continua sendo global, não depende do filtro de data
+    pedidos_nao_quitados = contexto.pedidos_nao_quitados
+    total_devido = pedidos_nao_quitados.aggregate(total=Sum('valor_total'))['total'] or 0
+    total_pago_parcialmente = Pagamento.objects.filter(pedido__in=pedidos_nao_quitados).aggregate(total=Sum('valor'))['total'] or 0
+    a_receber = total_devido - total_pago_parcialmente
+
+    return {'faturamento': faturamento, 'despesas': despesas_totais, 'lucro': lucro, 'valor_a_receber': a_receber}
+
+
+def widget_vendas_recentes(contexto):
+    """ Os 5 pedidos mais recentes. """
+    ultimos_pedidos = Pedido.objects.select_related('cliente')\
+        .prefetch_related('itens', 'pagamentos')\
+        .order_by('-data_criacao')[:5]
+    return PedidoSerializer(ultimos_pedidos, many=True).data
+
+
+def widget_faturamento_por_pagamento(contexto):
+    """ Pagamentos recebidos no período, agrupados por forma de pagamento. """
+    return list(
+        Pagamento.objects.filter(data__date__range=[contexto.data_inicio, contexto.data_fim])
+        .values('forma_pagamento')
+        .annotate(total=Sum('valor'))
+        .order_by('-total')
+    )
+
+
+def widget_evolucao_vendas(contexto):
+    """ Receita dos últimos 6 meses para o gráfico de evolução. """
+    seis_meses_atras = timezone.now().date().replace(day=1) - datetime.timedelta(days=30*5)
+    vendas = Pedido.objects.filter(
+        data_criacao__gte=seis_meses_atras,
+        status_pagamento='PAGO'
+    ).annotate(
+        mes=TruncMonth('data_criacao')  # Agrupa por mês
+    ).values('mes').annotate(
+        total=Sum('valor_total')  # Soma o total para cada mês
+    ).order_by('mes')
+    return [
+        {"name": item['mes'].strftime('%b/%y'), "Receita": item['total']}
+        for item in vendas
+    ]
+
+
+def widget_pedidos_por_status(contexto):
+    status_counts = Pedido.objects.values('status_producao').annotate(
+        value=Count('id')
+    ).order_by('-value')
+    return [
+        {"name": item['status_producao'], "value": item['value']}
+        for item in status_counts
+    ]
+
+
+def widget_produtos_mais_vendidos(contexto):
+    """ Os 5 produtos mais vendidos (em quantidade) no período. """
+    produtos = ItemPedido.objects.filter(
+        pedido__data_criacao__date__range=[contexto.data_inicio, contexto.data_fim]
+    ).values('produto__nome')\
+        .annotate(total_vendido=Sum('quantidade'))\
+        .order_by('-total_vendido')[:5]
+    return [
+        {"name": item['produto__nome'], "value": item['total_vendido']}
+        for item in produtos
+    ]
+
+
+def widget_clientes_mais_ativos(contexto):
+    """ Os 5 clientes que mais geraram faturamento (valor total em pedidos). """
+    clientes = Pedido.objects.values('cliente__nome')\
+        .annotate(
+            total_gasto=Sum('valor_total'),
+            total_pedidos=Count('id')
+        )\
+        .order_by('-total_gasto')[:5]
+    return [
+        {
+            "name": item['cliente__nome'],
+            "total_pedidos": item['total_pedidos'],
+            "total_gasto": item['total_gasto']
+        }
+        for item in clientes
+    ]
+
+
+WIDGETS = {
+    'stats': widget_stats,
+    'vendas_recentes': widget_vendas_recentes,
+    'faturamento_por_pagamento': widget_faturamento_por_pagamento,
+    'evolucao_vendas': widget_evolucao_vendas,
+    'pedidos_por_status': widget_pedidos_por_status,
+    'produtos_mais_vendidos': widget_produtos_mais_vendidos,
+    'clientes_mais_ativos': widget_clientes_mais_ativos,
+}
@@ -0,0 +1,18 @@
+# core/db.py
+"""
+Utilitários de gravação em lote compartilhados pelos módulos que mantêm tabelas
+(importação CSV, estatísticas de clientes, vendas mensais), independentes de
+qualquer um deles.
+"""
+from django.db import connection
+
+
+def bulk_upsert(model, objetos, unique_fields, update_fields):
+    """
+    bulk_create com update_conflicts. MySQL não aceita 'unique_fields'
+    (o ON DUPLICATE KEY UPDATE considera qualquer índice único).
+    """
+    opcoes = {'update_conflicts': True, 'update_fields': update_fields}
+    if connection.features.supports_update_conflicts_with_target:
+        opcoes['unique_fields'] = unique_fields
+    model.objects.bulk_create(objetos, **opcoes)
@@ -0,0 +1,142 @@
+# core/estatisticas.py
+"""
+Manutenção da tabela EstatisticaCliente (RFM: recência, frequência e valor monetário).
+
+A cada gravação de Pedido apenas o cliente afetado é recalculado (ver core/signals.py).
+A reconstrução completa refaz todos os clientes com uma única consulta agrupada e
+também atualiza os scores de recência, que mudam com o passar dos dias — por isso
+deve rodar diariamente (cron): python manage.py atualizar_estatisticas_clientes
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .db import bulk_upsert
+from .models import EstatisticaCliente, Pedido
+
+# Limites dos scores (score 1 abaixo do primeiro limite, 5 a partir do último)
+LIMITES_RECENCIA_DIAS = (30, 90, 180, 365)
+LIMITES_FREQUENCIA = (2, 4, 8, 15)
+LIMITES_MONETARIO = (Decimal('500'), Decimal('2000'), Decimal('5000'), Decimal('15000'))
+
+CAMPOS_ESTATISTICA = [
+    'primeiro_pedido', 'ultimo_pedido', 'total_pedidos', 'total_gasto', 'ticket_medio',
+    'score_recencia', 'score_frequencia', 'score_monetario', 'segmento', 'atualizado_em'
+]
+
+
+def score_recencia(dias):
+    if dias is None:
+        return 1
+    return 5 - sum(dias > limite for limite in LIMITES_RECENCIA_DIAS)
+
+
+def score_crescente(valor, limites):
+    return 1 + sum(valor >= limite for limite in limites)
+
+
+def classificar_segmento(recencia, frequencia):
+    Segmento = EstatisticaCliente.Segmento
+    if recencia >= 4 and frequencia >= 4:
+        return Segmento.CAMPEOES
+    if frequencia >= 4:
+        return Segmento.LEAIS
+    if recencia >= 4 and frequencia == 1:
+        return Segmento.NOVOS
+    if recencia <= 2 and frequencia >= 2:
+        return Segmento.EM_RISCO
+    if recencia <= 2:
+        return Segmento.HIBERNANDO
+    return Segmento.PROMISSORES
+
+
+def montar_estatistica(cliente_id, primeiro, ultimo, total_pedidos, total_gasto, hoje=None):
+    hoje = hoje or timezone.localdate()
+    total_gasto = total_gasto or Decimal('0')
+    dias = (hoje - timezone.localdate(ultimo)).days if ultimo else None
+    recencia = score_recencia(dias)
+    frequencia = score_crescente(total_pedidos, LIMITES_FREQUENCIA)
+    return EstatisticaCliente(
+        cliente_id=cliente_id,
+        primeiro_pedido=primeiro,
+        ultimo_pedido=ultimo,
+        total_pedidos=total_pedidos,
+        total_gasto=total_gasto,
+        ticket_medio=(total_gasto / total_pedidos).quantize(Decimal('0.01')) if total_pedidos else Decimal('0'),
+        score_recencia=recencia,
+        score_frequencia=frequencia,
+        score_monetario=score_crescente(total_gasto, LIMITES_MONETARIO),
+        segmento=classificar_segmento(recencia, frequencia),
+    )
+
+
+def atualizar_estatistica_cliente(cliente_id):
+    """ Recalcula as estatísticas de um único cliente (consulta indexada pelo cliente). """
+    if cliente_id is None:
+        return
+    agregado = Pedido.objects.filter(cliente_id=cliente_id).aggregate(
+        primeiro=Min('data_criacao'),
+        ultimo=Max('data_criacao'),
+        total_pedidos=Count('id'),
+        total_gasto=Sum('valor_total'),
+    )
+    if not agregado['total_pedidos']:
+        EstatisticaCliente.objects.filter(cliente_id=cliente_id).delete()
+        return
+    montar_estatistica(cliente_id, **agregado).save()
+
+
+def atualizar_estatisticas_clientes(cliente_ids):
+    """ Recalcula as estatísticas de vários clientes com uma única consulta agrupada. """
+    cliente_ids = {cliente_id for cliente_id in cliente_ids if cliente_id is not None}
+    if not cliente_ids:
+        return
+    agregados = (
+        Pedido.objects.filter(cliente_id__in=cliente_ids).order_by()
+        .values('cliente_id')
+        .annotate(
+            primeiro=Min('data_criacao'),
+            ultimo=Max('data_criacao'),
+            total_pedidos=Count('id'),
+            total_gasto=Sum('valor_total'),
+        )
+    )
+    estatisticas = [montar_estatistica(**agregado) for agregado in agregados]
+    if estatisticas:
+        bulk_upsert(EstatisticaCliente, estatisticas, ['cliente'], CAMPOS_ESTATISTICA)
+    sem_pedidos = cliente_ids - {estatistica.cliente_id for estatistica in estatisticas}
+    if sem_pedidos:
+        EstatisticaCliente.objects.filter(cliente_id__in=sem_pedidos).delete()
+
+
+def reconstruir_estatisticas(tamanho_lote=2000):
+    """ Refaz a tabela inteira. Retorna a quantidade de clientes com estatísticas. """
+    inicio = timezone.now()
+    hoje = timezone.localdate()
+    agregados = (
+        Pedido.objects.order_by()
+        .values('cliente_id')
+        .annotate(
+            primeiro=Min('data_criacao'),
+            ultimo=Max('data_criacao'),
+            total_pedidos=Count('id'),
+            total_gasto=Sum('valor_total'),
+        )
+    )
+
+    total = 0
+    lote = []
+    for agregado in agregados.iterator(chunk_size=tamanho_lote):
+        lote.append(montar_estatistica(hoje=hoje, **agregado))
+        if len(lote) >= tamanho_lote:
+            bulk_upsert(EstatisticaCliente, lote, ['cliente'], CAMPOS_ESTATISTICA)
+            total += len(lote)
+            lote = []
+    if lote:
+        bulk_upsert(EstatisticaCliente, lote, ['cliente'], CAMPOS_ESTATISTICA)
+        total += len(lote)
+
+    # Clientes que não têm mais pedidos
+    EstatisticaCliente.objects.filter(atualizado_em__lt=inicio).delete()
+    return total
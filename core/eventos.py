@@ -0,0 +1,162 @@
+# core/eventos.py
+"""
+Eventos em tempo real para o dashboard e o quadro de produção (Server-Sent Events).
+
+Publicação: os sinais chamam publicar(tipo, ...); os eventos de uma transação são
+gravados juntos na tabela EventoSistema depois do commit (eventos de transações
+desfeitas nunca são vistos).
+
+Entrega: cada processo tem um único Transmissor que consulta a tabela a cada
+EVENTOS_INTERVALO_SEGUNDOS (uma consulta por processo, não por tela aberta) e
+repassa os eventos novos às conexões abertas. Como a fila é o banco, funciona com
+vários processos e sem Redis. Quem reconecta com Last-Event-ID recebe o que perdeu.
+
+O endpoint é assíncrono e precisa de um servidor ASGI (app/asgi.py), por exemplo:
+    uvicorn app.asgi:application
+"""
+import asyncio
+import datetime
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EventoSistema
+
+PEDIDO_CRIADO = 'pedido_criado'
+PEDIDO_STATUS = 'pedido_status'
+PEDIDO_EXCLUIDO = 'pedido_excluido'
+PAGAMENTO_RECEBIDO = 'pagamento_recebido'
+
+# O que cada tela deve buscar de novo ao receber o evento
+ATUALIZAR = {
+    PEDIDO_CRIADO: ['dashboard', 'pedidos', 'producao'],
+    PEDIDO_STATUS: ['pedidos', 'producao'],
+    PEDIDO_EXCLUIDO: ['dashboard', 'pedidos', 'producao'],
+    PAGAMENTO_RECEBIDO: ['dashboard', 'pedidos', 'contas_a_receber'],
+}
+
+INTERVALO_PADRAO = 1.0
+BATIMENTO_SEGUNDOS = 15
+RECONEXAO_MS = 3000
+RETENCAO = datetime.timedelta(days=1)
+LIMPEZA_A_CADA = datetime.timedelta(hours=1)
+LOTE_MAXIMO = 500
+
+_pendentes = threading.local()
+
+
+def _gravar_pendentes():
+    eventos = getattr(_pendentes, 'eventos', [])
+    _pendentes.eventos = []
+    if eventos:
+        EventoSistema.objects.bulk_create(eventos)
+
+
+def publicar(tipo, atualizar=None, **dados):
+    """ Agenda o evento para ser gravado (e entregue) ao final da transação atual. """
+    dados['atualizar'] = atualizar or ATUALIZAR.get(tipo, [])
+    if not hasattr(_pendentes, 'eventos'):
+        _pendentes.eventos = []
+    _pendentes.eventos.append(EventoSistema(tipo=tipo, dados=dados))
+    transaction.on_commit(_gravar_pendentes)
+
+
+def formatar_sse(evento):
+    dados = json.dumps({'id': evento.id, 'tipo': evento.tipo, **evento.dados}, default=str)
+    return f'id: {evento.id}\nevent: {evento.tipo}\ndata: {dados}\n\n'
+
+
+async def eventos_depois_de(ultimo_id, limite=LOTE_MAXIMO):
+    return [evento async for evento in EventoSistema.objects.filter(id__gt=ultimo_id).order_by('id')[:limite]]
+
+
+class Transmissor:
+    """ Repassa os eventos novos da tabela para as filas das conexões abertas neste processo. """
+
+    def __init__(self):
+        self._filas = set()
+        self._tarefa = None
+        self._ultimo_id = None
+        self._ultima_limpeza = None
+
+    @property
+    def intervalo(self):
+        return getattr(settings, 'EVENTOS_INTERVALO_SEGUNDOS', INTERVALO_PADRAO)
+
+    def _parado(self):
+        return self._tarefa is None or self._tarefa.done()
+
+    async def assinar(self):
+        """ Registra uma conexão; devolve a fila e o id do último evento já visto. """
+        if self._parado():
+            # Parado, o transmissor não acompanhou a tabela: recomeça do evento mais recente,
+            # senão a nova conexão receberia tudo o que foi publicado desde a última que fechou
+            ultimo = await EventoSistema.objects.order_by('-id').values_list('id', flat=True).afirst()
+            if self._parado():
+                self._ultimo_id = ultimo or 0
+        fila = asyncio.Queue()
+        self._filas.add(fila)
+        if self._parado():
+            self._tarefa = asyncio.get_running_loop().create_task(self._consultar())
+        return fila, self._ultimo_id
+
+    def cancelar(self, fila):
+        self._filas.discard(fila)
+
+    async def _limpar_antigos(self):
+        agora = timezone.now()
+        if self._ultima_limpeza and agora - self._ultima_limpeza < LIMPEZA_A_CADA:
+            return
+        self._ultima_limpeza = agora
+        await EventoSistema.objects.filter(criado_em__lt=agora - RETENCAO).adelete()
+
+    async def _consultar(self):
+        # Para sozinho quando não há mais conexões; a próxima assinatura o reinicia
+        while self._filas:
+            eventos = await eventos_depois_de(self._ultimo_id)
+            for evento in eventos:
+                for fila in list(self._filas):
+                    fila.put_nowait(evento)
+                self._ultimo_id = evento.id
+            await self._limpar_antigos()
+            if len(eventos) < LOTE_MAXIMO:
+                await asyncio.sleep(self.intervalo)
+
+
+transmissor = Transmissor()
+
+
+async def fluxo_eventos(ultimo_id_cliente=None):
+    """
+    Gerador assíncrono do corpo SSE. Com ultimo_id_cliente (Last-Event-ID), envia
+    antes os eventos perdidos desde aquele id.
+    """
+    fila, ultimo_id = await transmissor.assinar()
+    try:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+        if ultimo_id_cliente is not None:
+            ultimo_id = ultimo_id_cliente
+            while True:
+                perdidos = await eventos_depois_de(ultimo_id)
+                for evento in perdidos:
+                    yield formatar_sse(evento)
+                    ultimo_id = evento.id
+                if len(perdidos) < LOTE_MAXIMO:
+                    break
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(fila.get(), timeout=BATIMENTO_SEGUNDOS)
+            except asyncio.TimeoutError:
+                # Comentário SSE: mantém a conexão viva através de proxies
+                yield ': ping\n\n'
+                continue
+            if evento.id <= ultimo_id:
+                continue
+            ultimo_id = evento.id
+            yield formatar_sse(evento)
+    finally:
+        transmissor.cancelar(fila)
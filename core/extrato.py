@@ -0,0 +1,148 @@
+# core/extrato.py
+"""
+Extrato do cliente: pedidos (débitos) e pagamentos (créditos) em ordem de data,
+com saldo acumulado calculado pelo banco (SUM(...) OVER (ORDER BY ...)).
+
+A paginação é por cursor (keyset): o cursor guarda a chave (data, ordem, id)
+da última linha entregue e o saldo até ela. A chave filtra as duas consultas da
+UNION e a janela soma só as linhas da página, a partir do saldo do cursor: as
+linhas anteriores ao cursor não são lidas, por mais páginas que tenham vindo antes.
+"""
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Pagamento, Pedido
+from .precificacao import arredondar
+
+# Em uma mesma data/hora, o pedido vem antes do pagamento
+ORDEM_PEDIDO = 0
+ORDEM_PAGAMENTO = 1
+
+ROTULOS_FORMA_PAGAMENTO = dict(Pagamento.FormaPagamento.choices)
+
+
+def _condicao_cursor(coluna_data, coluna_id, ordem):
+    """ Linhas de um dos lados da UNION que vêm depois do cursor na ordem (data, ordem, id). """
+    return (
+        f"({coluna_data} > %s OR ({coluna_data} = %s AND "
+        f"({ordem} > %s OR ({ordem} = %s AND {coluna_id} > %s))))"
+    )
+
+
+def _sql_movimentos(com_cursor, com_limite):
+    pedido = connection.ops.quote_name(Pedido._meta.db_table)
+    pagamento = connection.ops.quote_name(Pagamento._meta.db_table)
+    filtro_pedido = f"AND {_condicao_cursor('p.data_criacao', 'p.id', ORDEM_PEDIDO)}" if com_cursor else ''
+    filtro_pagamento = f"AND {_condicao_cursor('pg.data', 'pg.id', ORDEM_PAGAMENTO)}" if com_cursor else ''
+    limite = "LIMIT %s" if com_limite else ''
+    # O cursor filtra cada lado da UNION e o limite corta a página antes da janela:
+    # o SUM() OVER soma só as linhas da página, a partir do saldo guardado no cursor
+    return f"""
+        SELECT tipo, id, pedido_id, data, ordem, debito, credito, forma_pagamento,
+               SUM(debito - credito) OVER (ORDER BY data, ordem, id) AS saldo
+        FROM (
+            SELECT tipo, id, pedido_id, data, ordem, debito, credito, forma_pagamento
+            FROM (
+                SELECT 'PEDIDO' AS tipo, p.id AS id, p.id AS pedido_id, p.data_criacao AS data,
+                       {ORDEM_PEDIDO} AS ordem, p.valor_total AS debito, 0 AS credito,
+                       NULL AS forma_pagamento
+                FROM {pedido} p
+                WHERE p.cliente_id = %s {filtro_pedido}
+                UNION ALL
+                SELECT 'PAGAMENTO', pg.id, pg.pedido_id, pg.data,
+                       {ORDEM_PAGAMENTO}, 0, pg.valor, pg.forma_pagamento
+                FROM {pagamento} pg
+                INNER JOIN {pedido} p ON p.id = pg.pedido_id
+                WHERE p.cliente_id = %s {filtro_pagamento}
+            ) movimentos
+            ORDER BY data, ordem, id
+            {limite}
+        ) pagina
+        ORDER BY data, ordem, id
+    """
+
+
+def codificar_cursor(linha):
+    chave = [linha['data'].isoformat(), linha['ordem'], linha['id'], str(linha['saldo'])]
+    return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """ Retorna (data, ordem, id, saldo) ou levanta ValueError para cursores inválidos. """
+    try:
+        data_iso, ordem, ident, saldo = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        data = parse_datetime(data_iso)
+        saldo = Decimal(saldo)
+    except (TypeError, ValueError, ArithmeticError, json.JSONDecodeError) as exc:
+        raise ValueError("Cursor inválido.") from exc
+    if data is None or not saldo.is_finite():
+        raise ValueError("Cursor inválido.")
+    return data, int(ordem), int(ident), saldo
+
+
+def _para_datetime(valor):
+    # Em uma UNION o SQLite devolve a data como texto; outros bancos já devolvem datetime
+    if isinstance(valor, str):
+        valor = parse_datetime(valor)
+    if timezone.is_naive(valor):
+        valor = timezone.make_aware(valor, datetime.timezone.utc)
+    return valor
+
+
+def _para_decimal(valor):
+    return arredondar(Decimal(str(valor or 0)))
+
+
+def movimentos_cliente(cliente_id, cursor=None, limite=None):
+    """
+    Lista de movimentos do cliente a partir do cursor (exclusivo).
+    Retorna (linhas, proximo_cursor); proximo_cursor é None na última página.
+    """
+    saldo_anterior = Decimal('0.00')
+    if cursor is None:
+        parametros = [cliente_id, cliente_id]
+    else:
+        data, ordem, ident, saldo_anterior = decodificar_cursor(cursor)
+        data_db = connection.ops.adapt_datetimefield_value(data)
+        posicao = [data_db, data_db, ordem, ordem, ident]
+        parametros = [cliente_id, *posicao, cliente_id, *posicao]
+    if limite is not None:
+        # Busca uma linha a mais para saber se existe próxima página
+        parametros.append(limite + 1)
+
+    with connection.cursor() as db:
+        db.execute(_sql_movimentos(cursor is not None, limite is not None), parametros)
+        colunas = [coluna[0] for coluna in db.description]
+        brutas = [dict(zip(colunas, linha)) for linha in db.fetchall()]
+
+    linhas = []
+    for bruta in brutas[:limite] if limite is not None else brutas:
+        tipo = bruta['tipo']
+        linha = {
+            'tipo': tipo,
+            'id': bruta['id'],
+            'pedido_id': bruta['pedido_id'],
+            'data': _para_datetime(bruta['data']),
+            'ordem': bruta['ordem'],
+            'debito': _para_decimal(bruta['debito']),
+            'credito': _para_decimal(bruta['credito']),
+            'saldo': saldo_anterior + _para_decimal(bruta['saldo']),
+            'forma_pagamento': bruta['forma_pagamento'],
+        }
+        if tipo == 'PEDIDO':
+            linha['descricao'] = f"Pedido #{linha['pedido_id']}"
+        else:
+            forma = ROTULOS_FORMA_PAGAMENTO.get(linha['forma_pagamento'], linha['forma_pagamento'])
+            linha['descricao'] = f"Pagamento ({forma}) do Pedido #{linha['pedido_id']}"
+        linhas.append(linha)
+
+    proximo = None
+    if limite is not None and len(brutas) > limite and linhas:
+        proximo = codificar_cursor(linhas[-1])
+    return linhas, proximo
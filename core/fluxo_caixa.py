@@ -0,0 +1,184 @@
+# core/fluxo_caixa.py
+"""
+Projeção de fluxo de caixa dia a dia para os próximos N dias.
+
+Entradas: saldo em aberto dos pedidos PENDENTE/PARCIAL, esperado no previsto_entrega
+deslocado pelo atraso histórico de pagamento (mediana de dias entre a entrega
+prevista e a quitação dos pedidos pagos). Pedidos já vencidos caem no dia de hoje.
+
+Saídas: despesas recorrentes, detectadas pelo par (categoria, descrição) que aparece
+em vários meses recentes; cada uma é projetada no dia do mês em que costuma ocorrer.
+
+Todos os dados são carregados com poucas consultas e distribuídos em vetores
+indexados pelo dia da projeção (nenhuma consulta por dia). O resultado é guardado
+no cache compartilhado até o fim do dia.
+"""
+import calendar
+import datetime
+import statistics
+from collections import defaultdict
+from itertools import accumulate
+
+from django.core.cache import caches
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .metricas import registrar_cache
+from .models import Despesa, Pagamento, Pedido
+from .precificacao import ZERO, arredondar
+
+ALIAS_CACHE = 'compartilhado'
+DIAS_PADRAO = 30
+DIAS_MAXIMO = 180
+
+# Janela usada para aprender o atraso de pagamento e os padrões de despesa
+DIAS_HISTORICO_ATRASO = 180
+MESES_HISTORICO_DESPESAS = 6
+MESES_MINIMOS_RECORRENCIA = 3
+
+
+def atraso_medio_pagamento(hoje):
+    """
+    Mediana de dias entre o previsto_entrega e o último pagamento dos pedidos quitados
+    nos últimos DIAS_HISTORICO_ATRASO dias (0 sem histórico).
+    """
+    desde = hoje - datetime.timedelta(days=DIAS_HISTORICO_ATRASO)
+    quitados = (
+        Pedido.objects.filter(status_pagamento=Pedido.StatusPagamento.PAGO, previsto_entrega__gte=desde)
+        .annotate(quitado_em=Max('pagamentos__data'))
+        .filter(quitado_em__isnull=False)
+        .values_list('previsto_entrega', 'quitado_em')
+    )
+    atrasos = [(timezone.localdate(quitado_em) - previsto).days for previsto, quitado_em in quitados]
+    return int(statistics.median(atrasos)) if atrasos else 0
+
+
+def recebimentos_previstos(hoje, atraso):
+    """ [(data prevista, valor em aberto)] de cada pedido não quitado. """
+    pagos = (
+        Pagamento.objects.filter(pedido__status_pagamento__in=[Pedido.StatusPagamento.PENDENTE, Pedido.StatusPagamento.PARCIAL])
+        .values('pedido_id')
+        .annotate(total=Sum('valor'))
+        .values_list('pedido_id', 'total')
+    )
+    pagos = dict(pagos)
+    abertos = Pedido.objects.filter(
+        status_pagamento__in=[Pedido.StatusPagamento.PENDENTE, Pedido.StatusPagamento.PARCIAL]
+    ).values_list('id', 'valor_total', 'previsto_entrega', 'data_criacao')
+
+    recebimentos = []
+    for pedido_id, valor_total, previsto, criado_em in abertos:
+        saldo = valor_total - (pagos.get(pedido_id) or ZERO)
+        if saldo <= 0:
+            continue
+        base = previsto or timezone.localdate(criado_em)
+        recebimentos.append((max(base + datetime.timedelta(days=atraso), hoje), saldo))
+    return recebimentos
+
+
+def despesas_recorrentes(hoje):
+    """
+    Agrupa as despesas dos últimos meses por (categoria, descrição) e devolve as que
+    ocorreram em pelo menos MESES_MINIMOS_RECORRENCIA meses distintos, com o dia
+    típico do mês e o valor médio das três últimas ocorrências.
+    """
+    desde = (hoje.replace(day=1) - datetime.timedelta(days=31 * (MESES_HISTORICO_DESPESAS - 1))).replace(day=1)
+    ocorrencias = defaultdict(list)
+    for descricao, categoria, data, valor in (
+        Despesa.objects.filter(data__gte=desde, data__lte=hoje)
+        .order_by('data')
+        .values_list('descricao', 'categoria', 'data', 'valor')
+    ):
+        chave = ((categoria or '').strip().lower(), descricao.strip().lower())
+        ocorrencias[chave].append((data, valor, descricao, categoria))
+
+    padroes = []
+    for lista in ocorrencias.values():
+        meses = {(data.year, data.month) for data, *_ in lista}
+        if len(meses) < MESES_MINIMOS_RECORRENCIA:
+            continue
+        ultimas = [valor for _, valor, *_ in lista[-3:]]
+        _, _, descricao, categoria = lista[-1]
+        padroes.append({
+            'descricao': descricao,
+            'categoria': categoria,
+            'dia_do_mes': int(statistics.median(data.day for data, *_ in lista)),
+            'valor': arredondar(sum(ultimas) / len(ultimas)),
+            'meses_observados': len(meses),
+            'ultima_ocorrencia': lista[-1][0],
+        })
+    return sorted(padroes, key=lambda padrao: padrao['dia_do_mes'])
+
+
+def _ocorrencias_no_periodo(padrao, hoje, dias):
+    """ Datas em que a despesa recorrente cai dentro de [hoje, hoje + dias). """
+    fim = hoje + datetime.timedelta(days=dias)
+    ano, mes = hoje.year, hoje.month
+    while True:
+        dia = min(padrao['dia_do_mes'], calendar.monthrange(ano, mes)[1])
+        data = datetime.date(ano, mes, dia)
+        if data >= fim:
+            return
+        # Não repete a despesa se a deste mês já foi lançada
+        if data >= hoje and (padrao['ultima_ocorrencia'].year, padrao['ultima_ocorrencia'].month) != (ano, mes):
+            yield data
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+def calcular_projecao(dias=DIAS_PADRAO, hoje=None):
+    hoje = hoje or timezone.localdate()
+    atraso = atraso_medio_pagamento(hoje)
+    recebimentos = recebimentos_previstos(hoje, atraso)
+    padroes = despesas_recorrentes(hoje)
+
+    entradas = [ZERO] * dias
+    saidas = [ZERO] * dias
+    for data, valor in recebimentos:
+        indice = (data - hoje).days
+        if indice < dias:
+            entradas[indice] += valor
+    for padrao in padroes:
+        for data in _ocorrencias_no_periodo(padrao, hoje, dias):
+            saidas[(data - hoje).days] += padrao['valor']
+
+    liquido = [entrada - saida for entrada, saida in zip(entradas, saidas)]
+    acumulado = list(accumulate(liquido))
+    datas = [hoje + datetime.timedelta(days=indice) for indice in range(dias)]
+
+    return {
+        'data_base': hoje,
+        'dias': dias,
+        'atraso_medio_pagamento_dias': atraso,
+        'total_entradas': sum(entradas, ZERO),
+        'total_saidas': sum(saidas, ZERO),
+        'saldo_projetado': acumulado[-1] if acumulado else ZERO,
+        'recebimentos_fora_do_periodo': sum(
+            (valor for data, valor in recebimentos if (data - hoje).days >= dias), ZERO
+        ),
+        'despesas_recorrentes': padroes,
+        'projecao': [
+            {'data': data, 'entradas': entrada, 'saidas': saida, 'liquido': liq, 'acumulado': acc}
+            for data, entrada, saida, liq, acc in zip(datas, entradas, saidas, liquido, acumulado)
+        ],
+    }
+
+
+def _segundos_ate_meia_noite():
+    agora = timezone.localtime()
+    amanha = datetime.datetime.combine(agora.date() + datetime.timedelta(days=1), datetime.time.min)
+    return max(int((timezone.make_aware(amanha) - agora).total_seconds()), 1)
+
+
+def projecao_fluxo_caixa(dias=DIAS_PADRAO, recalcular=False):
+    """ Projeção do dia, calculada uma vez por dia e horizonte e guardada no cache. """
+    hoje = timezone.localdate()
+    chave = f'fluxo_caixa:{hoje.isoformat()}:{dias}'
+    cache = caches[ALIAS_CACHE]
+    if not recalcular:
+        projecao = cache.get(chave)
+        registrar_cache('fluxo_caixa', projecao is not None)
+        if projecao is not None:
+            return projecao
+    projecao = calcular_projecao(dias, hoje)
+    cache.set(chave, projecao, _segundos_ate_meia_noite())
+    return projecao
@@ -0,0 +1,270 @@
+# core/importacao.py
+"""
+Importação em massa de clientes e produtos a partir de arquivos CSV.
+
+O arquivo é lido em streaming e processado em lotes: cada lote é validado
+em memória, tem os CPF/CNPJ (ou ids de produto) resolvidos com uma única
+consulta e é gravado com um único bulk_create (upsert). Antes do primeiro lote
+o arquivo é percorrido uma vez só decodificando e separando as colunas: um erro
+de codificação ou uma linha malformada no meio do arquivo recusa a importação
+inteira (ArquivoIlegivel) sem nada gravado. Linhas com dados inválidos não
+interrompem a importação: vão para o relatório de erros por linha.
+
+O upsert só grava as colunas que estão no cabeçalho do arquivo: um CSV parcial
+(ex: 'id,preco' ou 'nome,cpf_cnpj,telefone') atualiza essas colunas e preserva
+as demais. Uma célula vazia numa coluna presente grava o valor padrão do campo.
+Os campos obrigatórios só são exigidos para cadastrar registros novos (e nas
+linhas que trazem a coluna).
+"""
+import csv
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .catalogo import catalogo
+from .db import bulk_upsert
+from .models import Cliente, Produto, normalizar_cpf_cnpj
+from .serializers import ClienteImportacaoSerializer, ProdutoImportacaoSerializer
+
+TAMANHO_LOTE_PADRAO = 2000
+CAMPOS_DECIMAIS = ('preco', 'custo')
+
+
+class ArquivoIlegivel(Exception):
+    """ O CSV não pode ser lido até o fim (codificação errada ou linha malformada). """
+
+
+class ResultadoImportacao:
+    """ Acumula os totais e o relatório de erros (por linha do CSV) de uma importação. """
+
+    def __init__(self):
+        self.criados = 0
+        self.atualizados = 0
+        self.erros = []
+
+    def adicionar_erro(self, linha, erros):
+        self.erros.append({'linha': linha, 'erros': erros})
+
+    def como_dict(self):
+        return {
+            'criados': self.criados,
+            'atualizados': self.atualizados,
+            'total_erros': len(self.erros),
+            'erros': sorted(self.erros, key=lambda erro: erro['linha']),
+        }
+
+
+def ler_csv(arquivo_texto):
+    """
+    Lê o cabeçalho e devolve (colunas, linhas): o conjunto de colunas do arquivo e um
+    gerador de (numero_da_linha, dict) para cada linha, sem carregar o arquivo inteiro.
+    Aceita ',' ou ';' como separador (detectado pelo cabeçalho).
+    """
+    cabecalho = arquivo_texto.readline()
+    delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    nomes_campos = [nome.strip().lower() for nome in next(csv.reader([cabecalho], delimiter=delimitador))]
+
+    def linhas():
+        leitor = csv.DictReader(arquivo_texto, fieldnames=nomes_campos, delimiter=delimitador)
+        for linha in leitor:
+            # Células vazias são tratadas como ausentes (o campo fica com o valor padrão)
+            dados = {
+                campo: valor.strip()
+                for campo, valor in linha.items()
+                if campo and isinstance(valor, str) and valor.strip()
+            }
+            if dados:
+                # +1 porque o cabeçalho foi lido fora do DictReader
+                yield leitor.line_num + 1, dados
+
+    return {nome for nome in nomes_campos if nome}, linhas()
+
+
+def conferir_arquivo(arquivo_texto):
+    """
+    Percorre o arquivo (que precisa aceitar seek) só decodificando e separando as
+    colunas, e volta ao início. Levanta ArquivoIlegivel se ele não puder ser lido até o fim.
+    """
+    ultima = 1
+    try:
+        _, linhas = ler_csv(arquivo_texto)
+        for ultima, _ in linhas:
+            pass
+    except UnicodeDecodeError as exc:
+        # A decodificação é feita em blocos: a linha do erro não é conhecida
+        raise ArquivoIlegivel("O arquivo deve estar codificado em UTF-8.") from exc
+    except csv.Error as exc:
+        raise ArquivoIlegivel(f"CSV malformado após a linha {ultima}: {exc}") from exc
+    arquivo_texto.seek(0)
+
+
+def _em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+def _validar_lote(serializer, lote, resultado):
+    """ Valida cada linha com uma única instância do serializer (os campos são montados uma vez). """
+    validas = []
+    for numero_linha, dados in lote:
+        try:
+            validas.append((numero_linha, serializer.run_validation(dados)))
+        except serializers.ValidationError as exc:
+            resultado.adicionar_erro(numero_linha, exc.detail)
+    return validas
+
+
+def _campos_do_arquivo(serializer_class, colunas, extras):
+    """ Colunas gravadas pelo upsert: as do serializer que vieram no arquivo, mais as mantidas pelo código. """
+    return [campo for campo in serializer_class.Meta.fields if campo in colunas and campo != 'id'] + extras
+
+
+def _obrigatorios(serializer_class):
+    return [nome for nome, campo in serializer_class().fields.items() if campo.required]
+
+
+def _obrigatorios_ausentes(obrigatorios, dados, colunas, criando):
+    """
+    A validação é parcial (partial=True): os campos obrigatórios são conferidos aqui, todos
+    para um registro novo e, para um existente, só os das colunas presentes no arquivo.
+    """
+    return {
+        campo: ["Este campo é obrigatório."]
+        for campo in obrigatorios
+        if campo not in dados and (criando or campo in colunas)
+    }
+
+
+def importar_clientes(arquivo_texto, tamanho_lote=TAMANHO_LOTE_PADRAO, atualizar_existentes=True):
+    """
+    Importa clientes, usando o CPF/CNPJ normalizado como chave.
+    Com atualizar_existentes=False, documentos já cadastrados viram erro da linha.
+    """
+    conferir_arquivo(arquivo_texto)
+    resultado = ResultadoImportacao()
+    serializer = ClienteImportacaoSerializer(partial=True)
+    obrigatorios = _obrigatorios(ClienteImportacaoSerializer)
+    colunas, linhas = ler_csv(arquivo_texto)
+    campos_atualizaveis = _campos_do_arquivo(
+        ClienteImportacaoSerializer, colunas, ['cpf_cnpj_normalizado', 'atualizado_em']
+    )
+    documentos_no_arquivo = {}
+
+    for lote in _em_lotes(linhas, tamanho_lote):
+        validas = []
+        for numero_linha, dados in _validar_lote(serializer, lote, resultado):
+            documento = normalizar_cpf_cnpj(dados.get('cpf_cnpj'))
+            if documento:
+                if documento in documentos_no_arquivo:
+                    resultado.adicionar_erro(numero_linha, {
+                        'cpf_cnpj': [f"CPF/CNPJ repetido no arquivo (linha {documentos_no_arquivo[documento]})."]
+                    })
+                    continue
+                documentos_no_arquivo[documento] = numero_linha
+            validas.append((numero_linha, documento, dados))
+
+        # Uma única consulta (pelo índice único) resolve os documentos do lote inteiro
+        documentos_lote = [documento for _, documento, _ in validas if documento]
+        existentes = set(
+            Cliente.objects.filter(cpf_cnpj_normalizado__in=documentos_lote)
+            .values_list('cpf_cnpj_normalizado', flat=True)
+        ) if documentos_lote else set()
+
+        objetos = []
+        for numero_linha, documento, dados in validas:
+            existente = documento in existentes
+            if existente and not atualizar_existentes:
+                resultado.adicionar_erro(numero_linha, {
+                    'cpf_cnpj': ["Já existe um cliente cadastrado com este CPF/CNPJ."]
+                })
+                continue
+            ausentes = _obrigatorios_ausentes(obrigatorios, dados, colunas, criando=not existente)
+            if ausentes:
+                resultado.adicionar_erro(numero_linha, ausentes)
+                continue
+            if existente:
+                resultado.atualizados += 1
+            else:
+                resultado.criados += 1
+            # bulk_create não chama save(): a coluna normalizada é preenchida aqui
+            objetos.append(Cliente(cpf_cnpj_normalizado=documento, **dados))
+
+        if objetos:
+            with transaction.atomic():
+                bulk_upsert(Cliente, objetos, ['cpf_cnpj_normalizado'], campos_atualizaveis)
+
+    return resultado
+
+
+def importar_produtos(arquivo_texto, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """
+    Importa o catálogo de produtos. Linhas com 'id' atualizam o produto
+    existente (ou o criam com esse id); linhas sem 'id' são inseridas.
+    """
+    conferir_arquivo(arquivo_texto)
+    resultado = ResultadoImportacao()
+    serializer = ProdutoImportacaoSerializer(partial=True)
+    obrigatorios = _obrigatorios(ProdutoImportacaoSerializer)
+    colunas, linhas = ler_csv(arquivo_texto)
+    campos_atualizaveis = _campos_do_arquivo(ProdutoImportacaoSerializer, colunas, ['atualizado_em'])
+    ids_no_arquivo = {}
+
+    for lote in _em_lotes(linhas, tamanho_lote):
+        for _, dados in lote:
+            # Aceita o formato brasileiro "12,50"
+            for campo in CAMPOS_DECIMAIS:
+                if campo in dados and ',' in dados[campo] and '.' not in dados[campo]:
+                    dados[campo] = dados[campo].replace(',', '.')
+
+        validas = []
+        for numero_linha, dados in _validar_lote(serializer, lote, resultado):
+            produto_id = dados.pop('id', None)
+            if produto_id is not None:
+                if produto_id in ids_no_arquivo:
+                    resultado.adicionar_erro(numero_linha, {
+                        'id': [f"Produto repetido no arquivo (linha {ids_no_arquivo[produto_id]})."]
+                    })
+                    continue
+                ids_no_arquivo[produto_id] = numero_linha
+            validas.append((numero_linha, produto_id, dados))
+
+        ids_lote = [produto_id for _, produto_id, _ in validas if produto_id is not None]
+        existentes = set(
+            Produto.objects.filter(id__in=ids_lote).values_list('id', flat=True)
+        ) if ids_lote else set()
+
+        com_id, sem_id = [], []
+        for numero_linha, produto_id, dados in validas:
+            ausentes = _obrigatorios_ausentes(obrigatorios, dados, colunas, criando=produto_id not in existentes)
+            if ausentes:
+                resultado.adicionar_erro(numero_linha, ausentes)
+                continue
+            if produto_id is None:
+                sem_id.append(Produto(**dados))
+            else:
+                com_id.append(Produto(id=produto_id, **dados))
+            if produto_id in existentes:
+                resultado.atualizados += 1
+            else:
+                resultado.criados += 1
+
+        with transaction.atomic():
+            if com_id:
+                bulk_upsert(Produto, com_id, ['id'], campos_atualizaveis)
+            if sem_id:
+                Produto.objects.bulk_create(sem_id)
+            # bulk_create não dispara post_save: invalida o catálogo manualmente
+            transaction.on_commit(catalogo.invalidar)
+
+    return resultado
+
+
+IMPORTADORES = {
+    'clientes': importar_clientes,
+    'produtos': importar_produtos,
+}
@@ -0,0 +1,218 @@
+# core/instrumentacao.py
+"""
+Instrumentação por requisição: número de consultas, tempo no banco, consultas mais
+lentas com o ponto do código que as disparou, e tempos de trechos marcados com
+medir() (serialização JSON, renderização de template, geração de PDF).
+
+O resultado vai no cabeçalho Server-Timing (visível na aba Network do navegador)
+e numa linha de log estruturada (logger 'core.desempenho'), em DEBUG, ou em INFO
+quando a requisição passa de 'log_lentas_ms'. O detector de N+1 aponta formatos
+de consulta repetidos muitas vezes na mesma requisição.
+
+Percorrer a pilha para achar o ponto do código custa caro se feito a cada
+consulta: com o detector de N+1 desligado, só as consultas que entram entre as
+'consultas_lentas' mais lentas até o momento têm o local calculado.
+
+Configuração (settings.INSTRUMENTACAO): 'ativa', 'detectar_n_mais_um',
+'limite_n_mais_um' (repetições para acusar), 'consultas_lentas' (quantas listar)
+e 'log_lentas_ms'.
+"""
+import contextlib
+import contextvars
+import heapq
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger('core.desempenho')
+
+_coletor_atual = contextvars.ContextVar('coletor_instrumentacao', default=None)
+
+CONFIGURACAO_PADRAO = {
+    'ativa': True,
+    'detectar_n_mais_um': False,
+    'limite_n_mais_um': 5,
+    'consultas_lentas': 3,
+    'log_lentas_ms': 1000,
+}
+
+_LISTA_IN = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def configuracao():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'INSTRUMENTACAO', {})}
+
+
+def coletor_atual():
+    """ Coletor da requisição em andamento (None fora de uma requisição instrumentada). """
+    return _coletor_atual.get()
+
+
+def formato_consulta(sql):
+    """ Formato da consulta, sem depender do tamanho das listas IN (...). """
+    return _LISTA_IN.sub('IN (...)', sql)
+
+
+def local_da_chamada():
+    """ Primeiro ponto do código do projeto (fora das bibliotecas) na pilha atual. """
+    raiz = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        arquivo = frame.f_code.co_filename
+        if arquivo.startswith(raiz) and 'site-packages' not in arquivo and arquivo != __file__:
+            return f'{arquivo[len(raiz) + 1:]}:{frame.f_lineno} em {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class ColetorRequisicao:
+    """
+    execute_wrapper que registra as consultas de uma requisição (seguro entre threads).
+    O local é calculado para todas as consultas com 'locais_de_todas' (detector de N+1);
+    senão, só para as que entram entre as 'consultas_lentas' mais lentas até o momento,
+    o que basta para mais_lentas(): quem termina entre elas também entrou ao ser gravada.
+    """
+
+    def __init__(self, consultas_lentas=3, locais_de_todas=False):
+        self._lock = threading.Lock()
+        self.consultas = []
+        self.segmentos = defaultdict(float)
+        self._quantidade_lentas = consultas_lentas
+        self._locais_de_todas = locais_de_todas
+        self._lentas = []  # heap mínimo com as durações das mais lentas até agora
+
+    def _precisa_local(self, duracao):
+        if self._locais_de_todas:
+            return True
+        lentas = self._lentas
+        return bool(self._quantidade_lentas) and (len(lentas) < self._quantidade_lentas or duracao > lentas[0])
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            local = local_da_chamada() if self._precisa_local(duracao) else None
+            with self._lock:
+                self.consultas.append((sql, duracao, local))
+                if self._quantidade_lentas:
+                    if len(self._lentas) < self._quantidade_lentas:
+                        heapq.heappush(self._lentas, duracao)
+                    elif duracao > self._lentas[0]:
+                        heapq.heapreplace(self._lentas, duracao)
+
+    def adicionar_segmento(self, nome, duracao):
+        with self._lock:
+            self.segmentos[nome] += duracao
+
+    @property
+    def tempo_banco(self):
+        return sum(duracao for _, duracao, _ in self.consultas)
+
+    def mais_lentas(self, quantidade):
+        return [
+            {'sql': sql[:300], 'ms': round(duracao * 1000, 2), 'local': local}
+            for sql, duracao, local in sorted(self.consultas, key=lambda consulta: -consulta[1])[:quantidade]
+        ]
+
+    def n_mais_um(self, limite):
+        """ Formatos de consulta repetidos pelo menos 'limite' vezes. """
+        contagem = Counter(formato_consulta(sql) for sql, _, _ in self.consultas)
+        locais = {}
+        for sql, _, local in self.consultas:
+            locais.setdefault(formato_consulta(sql), local)
+        return [
+            {'sql': formato[:300], 'repeticoes': total, 'local': locais[formato]}
+            for formato, total in contagem.most_common() if total >= limite
+        ]
+
+
+@contextlib.contextmanager
+def medir(nome):
+    """ Soma o tempo do bloco ao segmento 'nome' da requisição atual (se houver). """
+    coletor = _coletor_atual.get()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if coletor is not None:
+            coletor.adicionar_segmento(nome, time.perf_counter() - inicio)
+
+
+def instrumentar_conexao():
+    """
+    Liga o coletor da requisição à conexão da thread atual. Usado pelas threads
+    de core/concorrencia.py, que têm conexões próprias.
+    """
+    coletor = _coletor_atual.get()
+    if coletor is None:
+        return contextlib.nullcontext()
+    return connection.execute_wrapper(coletor)
+
+
+class JSONRendererMedido(JSONRenderer):
+    """ JSONRenderer que mede o tempo de serialização da resposta. """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with medir('serializacao'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class InstrumentacaoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = configuracao()
+        if not config['ativa']:
+            return self.get_response(request)
+
+        coletor = ColetorRequisicao(config['consultas_lentas'], locais_de_todas=config['detectar_n_mais_um'])
+        token = _coletor_atual.set(coletor)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(coletor):
+                response = self.get_response(request)
+        finally:
+            _coletor_atual.reset(token)
+        total = time.perf_counter() - inicio
+
+        tempo_banco = coletor.tempo_banco
+        metricas = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={tempo_banco * 1000:.1f};desc="{len(coletor.consultas)} consultas"',
+        ]
+        metricas += [f'{nome};dur={duracao * 1000:.1f}' for nome, duracao in coletor.segmentos.items()]
+        existente = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join(([existente] if existente else []) + metricas)
+
+        registro = {
+            'metodo': request.method,
+            'caminho': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'consultas': len(coletor.consultas),
+            'banco_ms': round(tempo_banco * 1000, 1),
+            'segmentos_ms': {nome: round(duracao * 1000, 1) for nome, duracao in coletor.segmentos.items()},
+            'mais_lentas': coletor.mais_lentas(config['consultas_lentas']),
+        }
+        if config['detectar_n_mais_um']:
+            suspeitas = coletor.n_mais_um(config['limite_n_mais_um'])
+            if suspeitas:
+                registro['n_mais_um'] = suspeitas
+                response['X-N-Mais-Um'] = str(len(suspeitas))
+                logger.warning(json.dumps({'n_mais_um': suspeitas, 'caminho': request.path}, ensure_ascii=False))
+        # Uma linha por requisição só em DEBUG; as lentas sobem para INFO
+        nivel = logging.INFO if total * 1000 >= config['log_lentas_ms'] else logging.DEBUG
+        if logger.isEnabledFor(nivel):
+            logger.log(nivel, json.dumps(registro, ensure_ascii=False))
+        return response
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.estatisticas import reconstruir_estatisticas
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói a tabela de estatísticas (RFM) dos clientes a partir dos pedidos. "
+        "Rode diariamente para manter os scores de recência em dia."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = reconstruir_estatisticas()
+        self.stdout.write(self.style.SUCCESS(f"Estatísticas atualizadas para {total} cliente(s)."))
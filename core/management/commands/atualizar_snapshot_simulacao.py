@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.simulacao import snapshot_itens
+
+
+class Command(BaseCommand):
+    help = (
+        "Troca a versão do snapshot usado na simulação de preços, fazendo todos os "
+        "processos recarregarem os itens vendidos no próximo uso. Rode pelo cron."
+    )
+
+    def handle(self, *args, **options):
+        snapshot_itens.invalidar()
+        snapshot = snapshot_itens.obter()
+        self.stdout.write(self.style.SUCCESS(f"Snapshot da simulação recarregado com {len(snapshot)} item(ns)."))
@@ -0,0 +1,223 @@
+import json
+import re
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+BASELINE_PADRAO = Path(settings.BASE_DIR) / 'core' / 'planos_baseline.json'
+
+# Listagens e relatórios auditados (com as buscas e filtros que o front usa)
+ROTAS = [
+    '/api/clientes/', '/api/clientes/?search=Silva',
+    '/api/produtos/', '/api/produtos/?search=Banner', '/api/produtos/reajustes/',
+    '/api/orcamentos/', '/api/orcamentos/?search=Silva',
+    '/api/itens-orcamento/',
+    '/api/pedidos/', '/api/pedidos/?search=Silva', '/api/pedidos/producao/',
+    '/api/itens-pedido/',
+    '/api/pagamentos/',
+    '/api/despesas-gerais/', '/api/despesas-gerais/?search=Energia', '/api/despesas/',
+    '/api/dashboard/', '/api/dashboard-stats/', '/api/vendas-recentes/', '/api/faturamento-por-pagamento/',
+    '/api/fluxo-caixa/projecao/?dias=90',
+    '/api/relatorios/evolucao-vendas/', '/api/relatorios/pedidos-por-status/',
+    '/api/relatorios/produtos-mais-vendidos/', '/api/relatorios/clientes-mais-ativos/',
+    '/api/relatorios/faturamento/?data_inicio=2000-01-01&data_fim=2100-12-31',
+    '/api/relatorios/clientes/', '/api/relatorios/clientes/segmentos/', '/api/relatorios/clientes/segmentos/?search=Silva',
+    '/api/relatorios/pedidos/', '/api/relatorios/contas-a-receber/',
+    '/api/relatorios/orcamentos/', '/api/relatorios/produtos/',
+    '/api/simulacao/precos/',
+    '/api/sincronizacao/?limite=500',
+]
+
+# Predicados que aplicam função sobre a coluna (o índice não é usado), por banco
+NAO_SARGAVEIS = [
+    ('data_convertida', re.compile(r'django_datetime_cast_date\(|DATE\(CONVERT_TZ\(|CAST\([^)]* AS date\)', re.I)),
+    ('funcao_na_coluna', re.compile(r'django_(?:datetime|date)_(?:extract|trunc)\(|\b(?:EXTRACT|UPPER|LOWER)\(', re.I)),
+]
+TABELA_COM_ALIAS = re.compile(r'(?:FROM|JOIN)\s+[`"](\w+)[`"](?:\s+(?:AS\s+)?[`"]?([A-Z]\d+)[`"]?)?', re.I)
+COLUNA_LIKE = re.compile(r'([`"]?\w+[`"]?\.[`"]?\w+[`"]?)\s+LIKE\s+%s', re.I)
+FIM_DO_WHERE = re.compile(r'\s(?:GROUP BY|ORDER BY|HAVING|LIMIT)\s', re.I)
+
+
+def trecho_where(sql):
+    """ Texto depois do primeiro WHERE até GROUP BY/ORDER BY/HAVING/LIMIT (aproximação suficiente). """
+    posicao = sql.upper().find(' WHERE ')
+    if posicao < 0:
+        return ''
+    trecho = sql[posicao + 7:]
+    fim = FIM_DO_WHERE.search(trecho)
+    return trecho[:fim.start()] if fim else trecho
+
+
+def aliases(sql):
+    mapa = {}
+    for tabela, alias in TABELA_COM_ALIAS.findall(sql):
+        mapa[tabela] = tabela
+        if alias:
+            mapa[alias] = tabela
+    return mapa
+
+
+def tabela_principal(sql):
+    encontrada = TABELA_COM_ALIAS.search(sql)
+    return encontrada.group(1) if encontrada else None
+
+
+def achados_sqlite(sql, plano, tamanhos, minimo):
+    mapa = aliases(sql)
+    for _, _, _, detalhe in plano:
+        if detalhe.startswith('SCAN ') and ' USING ' not in detalhe:
+            tabela = mapa.get(detalhe.split()[1])
+            if tabela and tamanhos.get(tabela, 0) >= minimo:
+                yield 'varredura_completa', tabela
+        elif detalhe.startswith('USE TEMP B-TREE'):
+            tabela = tabela_principal(sql)
+            if tabela and tamanhos.get(tabela, 0) >= minimo:
+                yield f"btree_temporaria ({detalhe.rsplit('FOR ', 1)[-1]})", tabela
+
+
+def achados_mysql(plano, tamanhos, minimo):
+    def percorrer(no):
+        if isinstance(no, dict):
+            tabela = no.get('table_name')
+            if tabela and tamanhos.get(tabela, 0) >= minimo and no.get('access_type') == 'ALL':
+                yield 'varredura_completa', tabela
+            if no.get('using_temporary_table') or no.get('using_filesort'):
+                tipo = 'filesort' if no.get('using_filesort') else 'tabela_temporaria'
+                alvo = tabela or next(iter(_tabelas(no)), None)
+                if alvo and tamanhos.get(alvo, 0) >= minimo:
+                    yield tipo, alvo
+            for valor in no.values():
+                yield from percorrer(valor)
+        elif isinstance(no, list):
+            for valor in no:
+                yield from percorrer(valor)
+
+    def _tabelas(no):
+        if isinstance(no, dict):
+            if 'table_name' in no:
+                yield no['table_name']
+            for valor in no.values():
+                yield from _tabelas(valor)
+        elif isinstance(no, list):
+            for valor in no:
+                yield from _tabelas(valor)
+
+    yield from percorrer(json.loads(plano[0][0]))
+
+
+def achados_predicados(sql, params):
+    where = trecho_where(sql)
+    for tipo, padrao in NAO_SARGAVEIS:
+        if padrao.search(where):
+            yield tipo, tabela_principal(sql)
+    # LIKE com curinga no início (icontains/search): nenhum índice B-tree ajuda
+    if any(isinstance(valor, str) and valor.startswith('%') for valor in params or ()):
+        for coluna in COLUNA_LIKE.findall(where):
+            yield 'like_curinga_inicial', coluna.replace('"', '').replace('`', '')
+
+
+class Command(BaseCommand):
+    help = (
+        "Roda as listagens e os relatórios da API, guarda o SQL de cada um e analisa o plano "
+        "(EXPLAIN QUERY PLAN no SQLite, EXPLAIN FORMAT=JSON no MySQL). Aponta varreduras completas, "
+        "B-trees/tabelas temporárias e filesort em tabelas grandes, e predicados não sargáveis "
+        "(data__date, LIKE '%...'). Sai com erro se aparecer achado que não está no baseline. "
+        "O baseline versionado foi gerado numa base SQLite com 'gerar_dados_sinteticos --clientes 500 "
+        "--orcamentos 4000 --pedidos-avulsos 1000 --despesas 300'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=str(BASELINE_PADRAO))
+        parser.add_argument('--atualizar-baseline', action='store_true',
+                            help="Grava os achados atuais como o novo baseline deste banco")
+        parser.add_argument('--linhas-minimas', type=int, default=1000,
+                            help="Tabelas com menos linhas não são consideradas grandes")
+        parser.add_argument('--detalhes', action='store_true', help="Mostra o SQL e o plano de cada achado")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f"Banco '{vendor}' não suportado (só SQLite e MySQL).")
+        usuario = User.objects.filter(is_active=True).first()
+        if usuario is None:
+            raise CommandError("É preciso ao menos um usuário cadastrado.")
+
+        tamanhos = {model._meta.db_table: model.objects.count() for model in apps.get_models()}
+        prefixo_explain = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN FORMAT=JSON '
+
+        achados = {}
+        fabrica = APIRequestFactory()
+        # Caches vazios e em memória: toda consulta do relatório acontece, sem tocar o cache real
+        caches_locais = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auditoria'},
+            'compartilhado': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auditoria-c'},
+        }
+        for rota in ROTAS:
+            consultas = {}
+
+            def guardar(execute, sql, params, many, context):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    consultas.setdefault(sql, params)
+                return execute(sql, params, many, context)
+
+            with override_settings(CACHES=caches_locais, ALLOWED_HOSTS=['testserver']), transaction.atomic():
+                correspondencia = resolve(urlsplit(rota).path)
+                request = fabrica.get(rota)
+                force_authenticate(request, user=usuario)
+                with connection.execute_wrapper(guardar):
+                    resposta = correspondencia.func(request, *correspondencia.args, **correspondencia.kwargs)
+                    if hasattr(resposta, 'render'):
+                        resposta.render()
+                transaction.set_rollback(True)
+            if resposta.status_code >= 400:
+                self.stderr.write(f"{rota}: status {resposta.status_code}, consultas parciais")
+
+            with connection.cursor() as cursor:
+                for sql, params in consultas.items():
+                    cursor.execute(prefixo_explain + sql, params)
+                    plano = cursor.fetchall()
+                    if vendor == 'sqlite':
+                        encontrados = achados_sqlite(sql, plano, tamanhos, options['linhas_minimas'])
+                    else:
+                        encontrados = achados_mysql(plano, tamanhos, options['linhas_minimas'])
+                    for tipo, alvo in [*encontrados, *achados_predicados(sql, params)]:
+                        chave = f'{urlsplit(rota).path} | {tipo} | {alvo}'
+                        achados.setdefault(chave, (sql, plano))
+
+        caminho = Path(options['baseline'])
+        baseline = json.loads(caminho.read_text(encoding='utf-8')) if caminho.exists() else {}
+        if options['atualizar_baseline']:
+            baseline[vendor] = sorted(achados)
+            caminho.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f"Baseline de {vendor} gravado com {len(achados)} achado(s) em {caminho}."))
+            return
+
+        conhecidos = set(baseline.get(vendor, []))
+        novos = sorted(set(achados) - conhecidos)
+        resolvidos = sorted(conhecidos - set(achados))
+        for chave in sorted(achados):
+            marcador = 'NOVO ' if chave in novos else '     '
+            self.stdout.write(f'{marcador}{chave}')
+            if options['detalhes'] or chave in novos:
+                sql, plano = achados[chave]
+                self.stdout.write(f'        SQL: {sql[:500]}')
+                self.stdout.write(f'        Plano: {plano}')
+        for chave in resolvidos:
+            self.stdout.write(self.style.SUCCESS(f'RESOLVIDO {chave}'))
+
+        if novos:
+            raise CommandError(
+                f"{len(novos)} regressão(ões) de plano em relação a {caminho}. Corrija a consulta ou, "
+                f"se for aceitável, rode com --atualizar-baseline e versione o arquivo."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(achados)} achado(s) conhecido(s), nenhum novo ({len(resolvidos)} resolvido(s))."
+        ))
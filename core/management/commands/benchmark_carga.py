@@ -0,0 +1,281 @@
+import datetime
+import http.client
+import json
+import math
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import Cliente, Despesa, ItemOrcamento, ItemPedido, Orcamento, Pagamento, Pedido, Produto
+
+# Quantos registros diferentes cada rota de detalhe percorre (evita medir só um registro quente)
+AMOSTRA_IDS = 20
+
+
+def percentil(valores_ordenados, p):
+    """ Percentil pelo método nearest-rank (valores já ordenados). """
+    if not valores_ordenados:
+        return None
+    indice = max(math.ceil(p / 100 * len(valores_ordenados)) - 1, 0)
+    return valores_ordenados[indice]
+
+
+def amostra(model, **exclusoes):
+    ids = list(model.objects.exclude(**exclusoes).order_by('-pk').values_list('pk', flat=True)[:AMOSTRA_IDS])
+    if not ids:
+        raise CommandError(f"Não há {model._meta.verbose_name_plural} no banco: rode gerar_dados_sinteticos antes.")
+    return ids
+
+
+def montar_rotas(incluir_pdf, incluir_escrita):
+    """
+    (nome, método, [caminhos], corpo) de cada rota. As rotas de detalhe alternam entre
+    AMOSTRA_IDS registros. O stream SSE (/api/eventos/) fica de fora: não tem latência de resposta.
+    """
+    hoje = timezone.localdate()
+    periodo = f'data_inicio={hoje - datetime.timedelta(days=365)}&data_fim={hoje}'
+    clientes = list(
+        Cliente.objects.annotate(n=Count('pedidos')).order_by('-n').values_list('pk', flat=True)[:AMOSTRA_IDS]
+    )
+    produtos = amostra(Produto)
+    # A listagem de orçamentos não mostra os aprovados (já viraram pedido)
+    orcamentos = amostra(Orcamento, status='Aprovado')
+    pedidos = amostra(Pedido)
+
+    def detalhe(prefixo, ids, sufixo=''):
+        return [f'{prefixo}{pk}/{sufixo}' for pk in ids]
+
+    rotas = [
+        ('clientes', 'GET', ['/api/clientes/'], None),
+        ('clientes-busca', 'GET', ['/api/clientes/?search=Silva'], None),
+        ('cliente', 'GET', detalhe('/api/clientes/', clientes), None),
+        ('cliente-extrato', 'GET', detalhe('/api/clientes/', clientes, 'extrato/'), None),
+        ('produtos', 'GET', ['/api/produtos/'], None),
+        ('produto', 'GET', detalhe('/api/produtos/', produtos), None),
+        ('produtos-reajustes', 'GET', ['/api/produtos/reajustes/'], None),
+        ('orcamentos', 'GET', ['/api/orcamentos/'], None),
+        ('orcamento', 'GET', detalhe('/api/orcamentos/', orcamentos), None),
+        ('itens-orcamento', 'GET', ['/api/itens-orcamento/'], None),
+        ('item-orcamento', 'GET', detalhe('/api/itens-orcamento/', amostra(ItemOrcamento)), None),
+        ('pedidos', 'GET', ['/api/pedidos/'], None),
+        ('pedido', 'GET', detalhe('/api/pedidos/', pedidos), None),
+        ('pedidos-producao', 'GET', ['/api/pedidos/producao/'], None),
+        ('itens-pedido', 'GET', ['/api/itens-pedido/'], None),
+        ('item-pedido', 'GET', detalhe('/api/itens-pedido/', amostra(ItemPedido)), None),
+        ('pagamentos', 'GET', ['/api/pagamentos/'], None),
+        ('pagamento', 'GET', detalhe('/api/pagamentos/', amostra(Pagamento)), None),
+        ('despesas-gerais', 'GET', ['/api/despesas-gerais/'], None),
+        ('despesa', 'GET', detalhe('/api/despesas-gerais/', amostra(Despesa)), None),
+        ('despesas-consolidadas', 'GET', ['/api/despesas/'], None),
+        ('empresa-publica', 'GET', ['/api/public/empresa/'], None),
+        ('empresa-settings', 'GET', ['/api/empresa-settings/'], None),
+        ('perfil', 'GET', ['/api/profile/'], None),
+        ('dashboard', 'GET', [f'/api/dashboard/?{periodo}'], None),
+        ('dashboard-stats', 'GET', [f'/api/dashboard-stats/?{periodo}'], None),
+        ('fluxo-caixa', 'GET', ['/api/fluxo-caixa/projecao/?dias=90'], None),
+        ('vendas-recentes', 'GET', ['/api/vendas-recentes/'], None),
+        ('faturamento-por-pagamento', 'GET', [f'/api/faturamento-por-pagamento/?{periodo}'], None),
+        ('evolucao-vendas', 'GET', ['/api/relatorios/evolucao-vendas/'], None),
+        ('pedidos-por-status', 'GET', ['/api/relatorios/pedidos-por-status/'], None),
+        ('produtos-mais-vendidos', 'GET', [f'/api/relatorios/produtos-mais-vendidos/?{periodo}'], None),
+        ('clientes-mais-ativos', 'GET', ['/api/relatorios/clientes-mais-ativos/'], None),
+        ('relatorio-faturamento', 'GET', [f'/api/relatorios/faturamento/?{periodo}'], None),
+        ('relatorio-clientes', 'GET', [f'/api/relatorios/clientes/?{periodo}'], None),
+        ('segmentacao-clientes', 'GET', ['/api/relatorios/clientes/segmentos/'], None),
+        ('relatorio-pedidos', 'GET', [f'/api/relatorios/pedidos/?{periodo}'], None),
+        ('contas-a-receber', 'GET', ['/api/relatorios/contas-a-receber/'], None),
+        ('relatorio-orcamentos', 'GET', [f'/api/relatorios/orcamentos/?{periodo}'], None),
+        ('relatorio-produtos', 'GET', [f'/api/relatorios/produtos/?{periodo}'], None),
+        ('simulacao-base', 'GET', ['/api/simulacao/precos/'], None),
+        ('simulacao', 'POST', ['/api/simulacao/precos/'], {'cenarios': [
+            {'nome': 'Reajuste', 'ajuste_preco_m2': 8, 'ajuste_preco_unidade': 5, 'elasticidade': '1.2'},
+            {'nome': 'Promoção', 'ajuste_preco_m2': -10, 'ajuste_preco_unidade': -10, 'elasticidade': '1.5'},
+        ]}),
+        ('cotacao', 'POST', ['/api/cotacao/'], {'linhas': [
+            {'produto': pk, 'quantidade': 100, 'largura': '1.50', 'altura': '0.90'} for pk in produtos
+        ]}),
+    ]
+    if incluir_pdf:
+        rotas += [
+            ('orcamento-pdf', 'GET', detalhe('/api/orcamentos/', orcamentos, 'pdf/'), None),
+            ('pedido-pdf', 'GET', detalhe('/api/pedidos/', pedidos, 'pdf/'), None),
+            ('extrato-pdf', 'GET', detalhe('/api/clientes/', clientes, 'extrato/pdf/'), None),
+        ]
+    if incluir_escrita:
+        # Acrescenta registros ao banco: use só numa base descartável
+        item = {'produto': produtos[0], 'quantidade': 2, 'largura': '1.00', 'altura': '1.00'}
+        rotas += [
+            ('criar-orcamento', 'POST', ['/api/orcamentos/'], {'cliente_id': clientes[0], 'itens_write': [item] * 3}),
+            ('criar-pedido', 'POST', ['/api/pedidos/'], {'cliente_id': clientes[0], 'itens_write': [item] * 3}),
+        ]
+    return rotas
+
+
+class ClienteHTTP:
+    """ Uma conexão keep-alive por thread, como um navegador faria. """
+
+    def __init__(self, url_base, cabecalhos):
+        partes = urlsplit(url_base)
+        self._classe = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self._endereco = partes.netloc
+        self._cabecalhos = cabecalhos
+        self._local = threading.local()
+
+    def _conexao(self):
+        if getattr(self._local, 'conexao', None) is None:
+            self._local.conexao = self._classe(self._endereco, timeout=120)
+        return self._local.conexao
+
+    def requisitar(self, metodo, caminho, corpo=None):
+        """ Retorna (status, corpo da resposta, segundos). Reabre a conexão uma vez se o servidor a fechou. """
+        dados = json.dumps(corpo).encode() if corpo is not None else None
+        cabecalhos = dict(self._cabecalhos, **({'Content-Type': 'application/json'} if dados else {}))
+        for tentativa in range(2):
+            conexao = self._conexao()
+            inicio = time.perf_counter()
+            try:
+                conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+                resposta = conexao.getresponse()
+                conteudo = resposta.read()
+                return resposta.status, conteudo, time.perf_counter() - inicio
+            except (http.client.HTTPException, ConnectionError):
+                conexao.close()
+                self._local.conexao = None
+                if tentativa:
+                    raise
+
+
+def obter_token(url_base, usuario, senha):
+    status, conteudo, _ = ClienteHTTP(url_base, {}).requisitar(
+        'POST', f'{urlsplit(url_base).path}/api/token/', {'username': usuario, 'password': senha}
+    )
+    if status != 200:
+        raise CommandError(f"Falha ao obter o token ({status}): {conteudo[:200]!r}")
+    return json.loads(conteudo)['access']
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga contra um servidor local: dispara --requisicoes em cada rota da API "
+        "(incluindo os PDFs) com --concorrencia clientes simultâneos e imprime um JSON com "
+        "vazão e latências p50/p95/p99 por rota. Os ids usados vêm do banco configurado, que "
+        "deve ser o mesmo do servidor. --comparar mostra a variação contra um resultado anterior."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--usuario', required=True)
+        parser.add_argument('--senha', required=True)
+        parser.add_argument('--concorrencia', type=int, default=8)
+        parser.add_argument('--requisicoes', type=int, default=100, help="Requisições medidas por rota")
+        parser.add_argument('--aquecimento', type=int, default=2, help="Requisições por rota antes de medir")
+        parser.add_argument('--rotas', nargs='*', help="Mede só as rotas com estes nomes")
+        parser.add_argument('--sem-pdf', action='store_true')
+        parser.add_argument('--escrita', action='store_true', help="Inclui criação de orçamentos e pedidos")
+        parser.add_argument('--saida', help="Grava o JSON neste arquivo")
+        parser.add_argument('--comparar', help="JSON de uma execução anterior")
+
+    def handle(self, *args, **options):
+        if options['concorrencia'] < 1 or options['requisicoes'] < 1:
+            raise CommandError("--concorrencia e --requisicoes devem ser maiores que zero.")
+
+        rotas = montar_rotas(not options['sem_pdf'], options['escrita'])
+        if options['rotas']:
+            rotas = [rota for rota in rotas if rota[0] in options['rotas']]
+            if not rotas:
+                raise CommandError("Nenhuma rota com esses nomes.")
+
+        url = options['url'].rstrip('/')
+        prefixo = urlsplit(url).path
+        token = obter_token(url, options['usuario'], options['senha'])
+        cliente = ClienteHTTP(url, {'Authorization': f'Bearer {token}', 'Accept': 'application/json'})
+
+        resultado = {
+            'commit': commit_atual(),
+            'data': timezone.now().isoformat(timespec='seconds'),
+            'url': url,
+            'concorrencia': options['concorrencia'],
+            'requisicoes_por_rota': options['requisicoes'],
+            'rotas': {},
+        }
+        todas_latencias = []
+        inicio_total = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concorrencia']) as executor:
+            for nome, metodo, caminhos, corpo in rotas:
+                def disparar(indice):
+                    status, conteudo, segundos = cliente.requisitar(
+                        metodo, prefixo + caminhos[indice % len(caminhos)], corpo
+                    )
+                    return status, len(conteudo), segundos
+
+                list(executor.map(disparar, range(options['aquecimento'])))
+                inicio = time.perf_counter()
+                respostas = list(executor.map(disparar, range(options['requisicoes'])))
+                duracao = time.perf_counter() - inicio
+
+                latencias = sorted(segundos * 1000 for _, _, segundos in respostas)
+                status = defaultdict(int)
+                for codigo, _, _ in respostas:
+                    status[codigo] += 1
+                todas_latencias += latencias
+                resultado['rotas'][nome] = {
+                    'metodo': metodo,
+                    'requisicoes': len(respostas),
+                    'erros': sum(total for codigo, total in status.items() if codigo >= 400),
+                    'status': dict(sorted(status.items())),
+                    'vazao_rps': round(len(respostas) / duracao, 1),
+                    'p50_ms': round(percentil(latencias, 50), 1),
+                    'p95_ms': round(percentil(latencias, 95), 1),
+                    'p99_ms': round(percentil(latencias, 99), 1),
+                    'max_ms': round(latencias[-1], 1),
+                    'bytes_medio': round(sum(tamanho for _, tamanho, _ in respostas) / len(respostas)),
+                }
+                self.stderr.write(f"{nome}: p95 {resultado['rotas'][nome]['p95_ms']} ms")
+
+        todas_latencias.sort()
+        resultado['total'] = {
+            'requisicoes': len(todas_latencias),
+            'erros': sum(rota['erros'] for rota in resultado['rotas'].values()),
+            'vazao_rps': round(len(todas_latencias) / (time.perf_counter() - inicio_total), 1),
+            'p50_ms': round(percentil(todas_latencias, 50), 1),
+            'p95_ms': round(percentil(todas_latencias, 95), 1),
+            'p99_ms': round(percentil(todas_latencias, 99), 1),
+        }
+
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+            resultado['comparacao'] = {'commit': anterior.get('commit'), 'rotas': {}}
+            for nome, atual in resultado['rotas'].items():
+                antes = anterior.get('rotas', {}).get(nome)
+                if not antes:
+                    continue
+                resultado['comparacao']['rotas'][nome] = {
+                    # Variação percentual: negativo na latência e positivo na vazão é melhora
+                    campo: round((atual[campo] / antes[campo] - 1) * 100, 1) if antes[campo] else None
+                    for campo in ('p50_ms', 'p95_ms', 'p99_ms', 'vazao_rps')
+                }
+
+        saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(saida)
+        self.stdout.write(saida)
@@ -0,0 +1,109 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import Pedido
+
+ROTAS = [
+    '/api/pedidos/', '/api/orcamentos/', '/api/clientes/', '/api/despesas/',
+    '/api/relatorios/clientes/', '/api/relatorios/pedidos/', '/api/sincronizacao/?limite=500',
+]
+CODIFICACOES = ('identity', 'gzip', 'br')
+
+# Nome -> (banda em Mbit/s, RTT em ms)
+PERFIS_PADRAO = {'3g': (1.6, 300), '4g-fraco': (4, 150), 'wifi-loja': (10, 40)}
+# Janela inicial do TCP: 10 segmentos (RFC 6928), dobrando a cada ida e volta no slow start
+SEGMENTO = 1460
+JANELA_INICIAL = 10
+
+
+def tempo_de_transferencia(tamanho, banda_mbps, rtt_ms):
+    """ Estimativa em ms: um RTT da requisição, um por rodada do slow start e o tempo na banda. """
+    rodadas, janela, enviados = 0, JANELA_INICIAL * SEGMENTO, 0
+    while enviados < tamanho:
+        enviados += janela
+        janela *= 2
+        rodadas += 1
+    return rtt_ms * (1 + rodadas) + tamanho * 8 / (banda_mbps * 1000)
+
+
+def ler_perfis(texto):
+    """ 'nome=mbps:rtt_ms,...' -> {nome: (mbps, rtt_ms)} """
+    perfis = {}
+    for parte in texto.split(','):
+        try:
+            nome, valores = parte.split('=')
+            banda, rtt = valores.split(':')
+            perfis[nome.strip()] = (float(banda), float(rtt))
+        except ValueError as exc:
+            raise CommandError(f"Perfil inválido: '{parte}' (use nome=mbps:rtt_ms).") from exc
+    return perfis
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o efeito da compressão (core/compressao.py) nas listagens, relatórios e PDFs: bytes "
+        "enviados e tempo no servidor (mediana) sem compressão, com gzip e com Brotli, e estima o "
+        "tempo de transferência em links lentos (banda, RTT e slow start do TCP)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--rotas', help="Rotas separadas por vírgula (padrão: listagens, relatórios e um PDF)")
+        parser.add_argument('--perfis', help="Links no formato nome=mbps:rtt_ms,... (padrão: 3g, 4g-fraco, wifi-loja)")
+        parser.add_argument('--saida', help="Grava o resultado em JSON neste arquivo")
+
+    def handle(self, *args, **options):
+        usuario = User.objects.filter(is_active=True).first()
+        if usuario is None:
+            raise CommandError("É preciso ao menos um usuário cadastrado.")
+        perfis = ler_perfis(options['perfis']) if options['perfis'] else PERFIS_PADRAO
+        if options['rotas']:
+            rotas = [rota.strip() for rota in options['rotas'].split(',')]
+        else:
+            rotas = list(ROTAS)
+            pedido = Pedido.objects.order_by('-id').values_list('id', flat=True).first()
+            if pedido is not None:
+                rotas.append(f'/api/pedidos/{pedido}/pdf/')
+
+        # Cliente de teste: a requisição passa por toda a lista de middlewares, inclusive a compressão
+        cliente = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(usuario)}')
+        resultado = {'perfis': {nome: {'mbps': banda, 'rtt_ms': rtt} for nome, (banda, rtt) in perfis.items()}, 'rotas': {}}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for rota in rotas:
+                medidas = {}
+                for codificacao in CODIFICACOES:
+                    tempos = []
+                    for _ in range(max(options['repeticoes'], 1)):
+                        inicio = time.perf_counter()
+                        resposta = cliente.get(rota, HTTP_ACCEPT_ENCODING=codificacao)
+                        corpo = b''.join(resposta.streaming_content) if resposta.streaming else resposta.content
+                        tempos.append(time.perf_counter() - inicio)
+                    if resposta.status_code != 200:
+                        self.stderr.write(f"{rota}: status {resposta.status_code}")
+                        break
+                    medidas[codificacao] = {
+                        'content_encoding': resposta.get('Content-Encoding', 'identity'),
+                        'bytes': len(corpo),
+                        'servidor_ms': round(statistics.median(tempos) * 1000, 1),
+                        'transferencia_ms': {
+                            nome: round(tempo_de_transferencia(len(corpo), banda, rtt), 1)
+                            for nome, (banda, rtt) in perfis.items()
+                        },
+                    }
+                if medidas:
+                    original = medidas['identity']['bytes'] or 1
+                    for medida in medidas.values():
+                        medida['razao'] = round(medida['bytes'] / original, 3)
+                    resultado['rotas'][rota] = medidas
+
+        texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto + '\n')
+        self.stdout.write(texto)
@@ -0,0 +1,88 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from core.models import Produto
+from core.precificacao import (
+    PrecoProduto, calcular_subtotal, carregar_tabela_precos, precificar_linhas
+)
+
+FAIXAS_EXEMPLO = [
+    {'quantidade_minima': 500, 'percentual': 5},
+    {'quantidade_minima': 1000, 'percentual': 10},
+]
+
+
+def gerar_linhas(ids, total, semente=42):
+    aleatorio = random.Random(semente)
+    return [
+        {
+            'produto': aleatorio.choice(ids),
+            'quantidade': aleatorio.choice([1, 10, 100, 500, 1000, 5000]),
+            'largura': Decimal(aleatorio.randint(20, 500)) / 100,
+            'altura': Decimal(aleatorio.randint(20, 300)) / 100,
+        }
+        for _ in range(total)
+    ]
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o motor de precificação: cotação em lote a partir da tabela em memória "
+        "versus o caminho antigo (uma consulta de Produto por linha)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=5000)
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        total, repeticoes = options['linhas'], options['repeticoes']
+        resultado = {'linhas': total}
+
+        # 1. Motor puro, com uma tabela sintética (não depende do banco)
+        tabela_sintetica = {
+            indice: PrecoProduto(indice, f'Produto {indice}', 'M2' if indice % 2 else 'UNICO',
+                                 Decimal('35.90'), Decimal('12.00'))
+            for indice in range(1, 201)
+        }
+        linhas = gerar_linhas(list(tabela_sintetica), total)
+        segundos = medir(lambda: precificar_linhas(linhas, tabela_sintetica, FAIXAS_EXEMPLO), repeticoes)
+        resultado['motor_em_memoria'] = {'segundos': round(segundos, 4), 'linhas_por_segundo': int(total / segundos)}
+
+        # 2. Comparação com o banco, se houver produtos cadastrados
+        ids = list(Produto.objects.values_list('id', flat=True)[:200])
+        if ids:
+            linhas = gerar_linhas(ids, total)
+
+            def por_linha():
+                for linha in linhas:
+                    produto = Produto.objects.get(pk=linha['produto'])
+                    calcular_subtotal(produto.tipo_precificacao, produto.preco, linha['quantidade'],
+                                      linha['largura'], linha['altura'])
+
+            def em_lote():
+                tabela = carregar_tabela_precos(ids=[linha['produto'] for linha in linhas])
+                precificar_linhas(linhas, tabela)
+
+            antigo = medir(por_linha, 1)
+            novo = medir(em_lote, repeticoes)
+            resultado['consulta_por_linha'] = {'segundos': round(antigo, 4)}
+            resultado['tabela_em_lote'] = {'segundos': round(novo, 4)}
+            resultado['ganho'] = round(antigo / novo, 1)
+        else:
+            self.stderr.write("Nenhum produto cadastrado: comparação com o banco ignorada.")
+
+        self.stdout.write(json.dumps(resultado, indent=2))
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.concorrencia import encerrar, pode_paralelizar
+from core.views import (
+    RelatorioClientesView, RelatorioOrcamentosView, RelatorioPedidosView, RelatorioProdutosView
+)
+
+RELATORIOS = {
+    'clientes': RelatorioClientesView,
+    'pedidos': RelatorioPedidosView,
+    'orcamentos': RelatorioOrcamentosView,
+    'produtos': RelatorioProdutosView,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo de resposta dos relatórios com as consultas em sequência e em paralelo. "
+        "--latencia-ms soma um atraso a cada consulta para simular a ida e volta até um banco remoto. "
+        "O atraso não é aplicado à abertura de conexões: 'conexao_ms' é o custo real de abrir uma "
+        "conexão neste banco. As threads do pool mantêm as conexões abertas, então só a primeira "
+        "requisição (e a primeira depois de um período ocioso) paga esse custo, uma vez por thread; "
+        "a medição usa o menor tempo das repetições, sem esse aquecimento."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--latencia-ms', type=float, default=0)
+
+    def medir_conexao(self):
+        """ Tempo para abrir uma conexão nova com o banco, numa thread sem conexão. """
+        tempos = []
+
+        def abrir():
+            inicio = time.perf_counter()
+            connection.ensure_connection()
+            tempos.append(time.perf_counter() - inicio)
+            connection.close()
+
+        for _ in range(3):
+            thread = threading.Thread(target=abrir)
+            thread.start()
+            thread.join()
+        return min(tempos)
+
+    def handle(self, *args, **options):
+        usuario = User.objects.filter(is_active=True).first()
+        if usuario is None:
+            raise CommandError("É preciso ao menos um usuário cadastrado.")
+        if not pode_paralelizar():
+            self.stderr.write("Este banco não permite consultas paralelas: as duas medições serão sequenciais.")
+
+        latencia = options['latencia_ms'] / 1000
+
+        def atrasar(execute, sql, params, many, context):
+            time.sleep(latencia)
+            return execute(sql, params, many, context)
+
+        def instalar_atraso(sender, connection, **kwargs):
+            # O wrapper da thread sobrevive ao fechamento da conexão: instala uma vez só
+            if atrasar not in connection.execute_wrappers:
+                connection.execute_wrappers.append(atrasar)
+
+        if latencia:
+            # Cada thread abre a sua conexão; o sinal instala o atraso em todas elas
+            connections.close_all()
+            connection_created.connect(instalar_atraso)
+
+        fabrica = APIRequestFactory()
+        resultado = {
+            'latencia_ms': options['latencia_ms'],
+            'conexao_ms': round(self.medir_conexao() * 1000, 2),
+            'relatorios': {},
+        }
+        try:
+            for nome, view_class in RELATORIOS.items():
+                view = view_class.as_view()
+
+                def medir(threads):
+                    tempos = []
+                    with override_settings(RELATORIOS_THREADS=threads, ALLOWED_HOSTS=['testserver']):
+                        for _ in range(options['repeticoes']):
+                            request = fabrica.get(f'/api/relatorios/{nome}/')
+                            force_authenticate(request, user=usuario)
+                            inicio = time.perf_counter()
+                            view(request).render()
+                            tempos.append(time.perf_counter() - inicio)
+                    return min(tempos)
+
+                sequencial = medir(1)
+                paralelo = medir(4)
+                resultado['relatorios'][nome] = {
+                    'sequencial_ms': round(sequencial * 1000, 1),
+                    'paralelo_ms': round(paralelo * 1000, 1),
+                    'ganho': round(sequencial / paralelo, 2),
+                }
+        finally:
+            connection_created.disconnect(instalar_atraso)
+            encerrar()
+
+        self.stdout.write(json.dumps(resultado, indent=2))
@@ -0,0 +1,378 @@
+import calendar
+import datetime
+import random
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.catalogo import catalogo
+from core.estatisticas import reconstruir_estatisticas
+from core.models import (
+    Cliente, Despesa, ItemOrcamento, ItemPedido, Orcamento, Pagamento, Pedido, Produto, normalizar_cpf_cnpj
+)
+from core.precificacao import arredondar, calcular_subtotal
+from core.simulacao import snapshot_itens
+from core.vendas_mensais import reconstruir_vendas_produtos
+
+NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sabrina', 'Thiago', 'Vanessa', 'Wagner',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Rodrigues', 'Almeida', 'Nascimento',
+    'Carvalho', 'Gomes', 'Martins', 'Araújo', 'Ribeiro', 'Barbosa', 'Rocha', 'Dias', 'Teixeira', 'Moreira',
+]
+RAMOS = ['Padaria', 'Auto Peças', 'Clínica', 'Restaurante', 'Academia', 'Imobiliária', 'Pet Shop', 'Escola', 'Farmácia', 'Mercado']
+CIDADES = [('São Paulo', 'SP'), ('Campinas', 'SP'), ('Rio de Janeiro', 'RJ'), ('Belo Horizonte', 'MG'), ('Curitiba', 'PR')]
+
+# (nome, tipo, faixa de preço, margem típica)
+PRODUTOS_BASE = [
+    ('Cartão de Visita', 'UNICO', (0.10, 0.40), 0.35),
+    ('Panfleto A5', 'UNICO', (0.08, 0.30), 0.40),
+    ('Adesivo Redondo', 'UNICO', (0.15, 0.80), 0.35),
+    ('Caneca Personalizada', 'UNICO', (18, 45), 0.45),
+    ('Camiseta Estampada', 'UNICO', (25, 60), 0.50),
+    ('Placa PVC', 'UNICO', (30, 150), 0.45),
+    ('Banner em Lona', 'M2', (45, 90), 0.40),
+    ('Adesivo Vinil', 'M2', (40, 110), 0.40),
+    ('Placa ACM', 'M2', (180, 350), 0.50),
+    ('Fachada em Lona', 'M2', (60, 120), 0.45),
+]
+VARIACOES = ['', ' Premium', ' Econômico', ' Fosco', ' Brilho', ' Verniz Localizado', ' Couchê 300g', ' Reciclado']
+
+# Impressos baratos saem em tiragens; brindes e placas, em poucas unidades
+TIRAGENS = [50, 100, 250, 500, 1000, 2000, 5000]
+PESOS_TIRAGENS = [6, 14, 10, 25, 25, 12, 8]
+UNIDADES = [1, 2, 5, 10, 20, 50]
+PESOS_UNIDADES = [30, 20, 20, 15, 10, 5]
+
+DESPESAS_FIXAS = [
+    ('Aluguel', 'Fixas', 5, (3500, 3500)),
+    ('Energia Elétrica', 'Fixas', 10, (900, 1800)),
+    ('Internet', 'Fixas', 15, (200, 200)),
+    ('Folha de Pagamento', 'Salários', 5, (12000, 14000)),
+    ('Simples Nacional', 'Impostos', 20, (2000, 5000)),
+]
+DESPESAS_VARIAVEIS = [
+    ('Compra de Lona', 'Fornecedores', (300, 4000)),
+    ('Compra de Papel', 'Fornecedores', (200, 3000)),
+    ('Tinta e Solvente', 'Fornecedores', (150, 1500)),
+    ('Manutenção da Impressora', 'Manutenção', (150, 2500)),
+    ('Frete', 'Logística', (40, 600)),
+    ('Material de Escritório', 'Administrativas', (30, 400)),
+]
+
+# Sazonalidade de uma gráfica: pico no fim do ano e nas eleições/volta às aulas, janeiro fraco
+PESO_MES = {1: 0.6, 2: 0.8, 3: 1.0, 4: 0.9, 5: 1.0, 6: 0.9, 7: 1.0, 8: 1.2, 9: 1.1, 10: 1.2, 11: 1.4, 12: 1.5}
+PESO_DIA_SEMANA = [1.0, 1.1, 1.1, 1.0, 0.9, 0.35, 0.05]
+
+
+def dinheiro(valor):
+    return arredondar(Decimal(str(valor)))
+
+
+def proximo_id(model):
+    # Os ids são atribuídos aqui: no MySQL o bulk_create não devolve as chaves geradas
+    return (model.objects.aggregate(maior=Max('pk'))['maior'] or 0) + 1
+
+
+class Gerador:
+    """ Monta os registros em memória, com uma semente fixa para que as massas sejam reproduzíveis. """
+
+    def __init__(self, semente, anos, hoje):
+        self.aleatorio = random.Random(semente)
+        self.hoje = hoje
+        inicio = hoje - datetime.timedelta(days=365 * anos)
+        self.dias = [inicio + datetime.timedelta(days=n) for n in range((hoje - inicio).days + 1)]
+        # Crescimento de ~25% ao ano sobre a sazonalidade mensal e semanal
+        total_dias = len(self.dias)
+        pesos = [
+            PESO_MES[dia.month] * PESO_DIA_SEMANA[dia.weekday()] * (1 + 0.25 * anos * indice / total_dias)
+            for indice, dia in enumerate(self.dias)
+        ]
+        self._pesos_dias = list(accumulate(pesos))
+
+    def dia(self):
+        return self.aleatorio.choices(self.dias, cum_weights=self._pesos_dias)[0]
+
+    def momento(self, dia):
+        hora = datetime.time(self.aleatorio.randint(8, 18), self.aleatorio.randint(0, 59))
+        return timezone.make_aware(datetime.datetime.combine(dia, hora))
+
+    def pesos_cauda_longa(self, quantidade, dispersao):
+        """ Pesos acumulados log-normais: poucos registros concentram boa parte do movimento. """
+        return list(accumulate(self.aleatorio.lognormvariate(0, dispersao) for _ in range(quantidade)))
+
+    def clientes(self, quantidade, primeiro_id):
+        clientes = []
+        for indice in range(quantidade):
+            cidade, estado = self.aleatorio.choice(CIDADES)
+            pessoa_juridica = self.aleatorio.random() < 0.45
+            if pessoa_juridica:
+                nome = f'{self.aleatorio.choice(RAMOS)} {self.aleatorio.choice(SOBRENOMES)} Ltda'
+                documento = f'{primeiro_id + indice:014d}'
+                cpf_cnpj = f'{documento[:2]}.{documento[2:5]}.{documento[5:8]}/{documento[8:12]}-{documento[12:]}'
+            else:
+                nome = f'{self.aleatorio.choice(NOMES)} {self.aleatorio.choice(SOBRENOMES)} {self.aleatorio.choice(SOBRENOMES)}'
+                documento = f'{primeiro_id + indice:011d}'
+                cpf_cnpj = f'{documento[:3]}.{documento[3:6]}.{documento[6:9]}-{documento[9:]}'
+            clientes.append(Cliente(
+                id=primeiro_id + indice,
+                nome=nome,
+                email=f'cliente{primeiro_id + indice}@exemplo.com.br' if self.aleatorio.random() < 0.7 else None,
+                telefone=f'119{self.aleatorio.randint(10000000, 99999999)}',
+                cpf_cnpj=cpf_cnpj if self.aleatorio.random() < 0.8 else None,
+                cidade=cidade,
+                estado=estado,
+                data_cadastro=self.momento(self.dia()),
+            ))
+            # O bulk_create não passa pelo save(), que é quem preenche a coluna normalizada
+            clientes[-1].cpf_cnpj_normalizado = normalizar_cpf_cnpj(clientes[-1].cpf_cnpj)
+        return clientes
+
+    def produtos(self, quantidade, primeiro_id):
+        produtos = []
+        for indice in range(quantidade):
+            nome, tipo, (minimo, maximo), margem = PRODUTOS_BASE[indice % len(PRODUTOS_BASE)]
+            variacao = VARIACOES[(indice // len(PRODUTOS_BASE)) % len(VARIACOES)]
+            preco = dinheiro(self.aleatorio.uniform(minimo, maximo))
+            produtos.append(Produto(
+                id=primeiro_id + indice,
+                nome=f'{nome}{variacao}' + (f' {indice // (len(PRODUTOS_BASE) * len(VARIACOES)) + 1}'
+                                            if indice >= len(PRODUTOS_BASE) * len(VARIACOES) else ''),
+                tipo_precificacao=tipo,
+                preco=preco,
+                custo=dinheiro(float(preco) * (1 - self.aleatorio.uniform(margem - 0.15, margem + 0.15))),
+                estoque_atual=self.aleatorio.randint(0, 500) if tipo == 'UNICO' else None,
+                estoque_minimo=50 if tipo == 'UNICO' else None,
+            ))
+        return produtos
+
+    def itens(self, modelo, produtos, pesos_produtos, maximo, **pai):
+        """ Itens de um orçamento/pedido (quantidade geométrica: a maioria tem 1 ou 2). """
+        total = 1
+        while total < maximo and self.aleatorio.random() < 0.45:
+            total += 1
+        itens = []
+        for _ in range(total):
+            if self.aleatorio.random() < 0.05:
+                itens.append(modelo(
+                    descricao_customizada='Criação de arte', quantidade=1,
+                    subtotal=dinheiro(self.aleatorio.choice([50, 80, 120, 200])), **pai
+                ))
+                continue
+            produto = self.aleatorio.choices(produtos, cum_weights=pesos_produtos)[0]
+            if produto.tipo_precificacao == 'M2':
+                quantidade = self.aleatorio.choices([1, 2, 3, 4], weights=[70, 18, 8, 4])[0]
+                largura = dinheiro(self.aleatorio.choice([0.5, 0.8, 1, 1.2, 1.5, 2, 3, 4]))
+                altura = dinheiro(self.aleatorio.choice([0.5, 0.6, 0.9, 1, 1.5, 2]))
+            else:
+                if produto.preco < 1:
+                    quantidade = self.aleatorio.choices(TIRAGENS, weights=PESOS_TIRAGENS)[0]
+                else:
+                    quantidade = self.aleatorio.choices(UNIDADES, weights=PESOS_UNIDADES)[0]
+                largura = altura = None
+            subtotal = calcular_subtotal(produto.tipo_precificacao, produto.preco, quantidade, largura, altura)
+            itens.append(modelo(
+                produto=produto, quantidade=quantidade, largura=largura, altura=altura, subtotal=subtotal, **pai
+            ))
+        return itens
+
+    def custo_itens(self, itens):
+        custo = Decimal('0')
+        for item in itens:
+            if item.produto is not None:
+                custo += calcular_subtotal(
+                    item.produto.tipo_precificacao, item.produto.custo, item.quantidade, item.largura, item.altura
+                )
+        return arredondar(custo)
+
+    def pagamentos(self, pedido, primeiro_id):
+        """ Pagamentos de um pedido; quanto mais antigo, mais provável que esteja quitado. """
+        idade = (self.hoje - pedido.data_criacao.date()).days
+        sorteio = self.aleatorio.random()
+        if idade > 60:
+            situacao = 'PAGO' if sorteio < 0.93 else ('PARCIAL' if sorteio < 0.98 else 'PENDENTE')
+        elif idade > 15:
+            situacao = 'PAGO' if sorteio < 0.6 else ('PARCIAL' if sorteio < 0.85 else 'PENDENTE')
+        else:
+            situacao = 'PAGO' if sorteio < 0.25 else ('PARCIAL' if sorteio < 0.6 else 'PENDENTE')
+        pedido.status_pagamento = situacao
+        if situacao == 'PENDENTE' or not pedido.valor_total:
+            pedido.status_pagamento = 'PENDENTE' if pedido.valor_total else 'PAGO'
+            return []
+
+        # Sinal de 50% na aprovação e o restante na entrega, ou pagamento único
+        if situacao == 'PARCIAL' or self.aleatorio.random() < 0.5:
+            parcelas = [arredondar(pedido.valor_total / 2)]
+            if situacao == 'PAGO':
+                parcelas.append(pedido.valor_total - parcelas[0])
+        else:
+            parcelas = [pedido.valor_total]
+        formas = [forma for forma, _ in Pagamento.FormaPagamento.choices]
+        pagamentos = []
+        data = pedido.data_criacao
+        for indice, valor in enumerate(parcelas):
+            if indice:
+                data = self.momento(min(pedido.previsto_entrega + datetime.timedelta(days=self.aleatorio.randint(0, 20)), self.hoje))
+            pagamentos.append(Pagamento(
+                id=primeiro_id + indice, pedido=pedido, valor=valor, data=data,
+                forma_pagamento=self.aleatorio.choices(formas, weights=[55, 10, 20, 15])[0],
+            ))
+        return pagamentos
+
+    def status_producao(self, dia):
+        idade = (self.hoje - dia).days
+        if idade > 20:
+            return Pedido.STATUS_FINALIZADO
+        return self.aleatorio.choices(Pedido.STATUS_PRODUCAO, weights=[3, 2, 3, 2 + idade])[0]
+
+    def despesas(self, quantidade_variaveis):
+        despesas = []
+        mes = self.dias[0].replace(day=1)
+        while mes <= self.hoje:
+            for descricao, categoria, dia, (minimo, maximo) in DESPESAS_FIXAS:
+                data = mes.replace(day=min(dia, calendar.monthrange(mes.year, mes.month)[1]))
+                if data <= self.hoje:
+                    despesas.append(Despesa(
+                        descricao=descricao, categoria=categoria, data=data,
+                        valor=dinheiro(self.aleatorio.uniform(minimo, maximo)),
+                    ))
+            mes = (mes + datetime.timedelta(days=32)).replace(day=1)
+        for _ in range(quantidade_variaveis):
+            descricao, categoria, (minimo, maximo) = self.aleatorio.choice(DESPESAS_VARIAVEIS)
+            despesas.append(Despesa(
+                descricao=descricao, categoria=categoria, data=self.dia(),
+                valor=dinheiro(self.aleatorio.lognormvariate(0, 0.6) * (minimo + maximo) / 2),
+            ))
+        return despesas
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera uma massa sintética de clientes, produtos (UNICO e M2), orçamentos com itens, pedidos, "
+        "pagamentos e despesas distribuídos em vários anos, com sazonalidade e clientes de cauda longa. "
+        "Acrescenta aos dados existentes e reconstrói as tabelas analíticas no final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=2000)
+        parser.add_argument('--produtos', type=int, default=120)
+        parser.add_argument('--orcamentos', type=int, default=30000,
+                            help="Total de orçamentos; os aprovados viram pedidos")
+        parser.add_argument('--pedidos-avulsos', type=int, default=8000,
+                            help="Pedidos lançados sem orçamento de origem")
+        parser.add_argument('--despesas', type=int, default=3000, help="Despesas variáveis (as fixas são mensais)")
+        parser.add_argument('--anos', type=int, default=3)
+        parser.add_argument('--itens-maximo', type=int, default=8)
+        parser.add_argument('--taxa-aprovacao', type=float, default=0.6)
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['anos'] < 1 or options['clientes'] < 1 or options['produtos'] < 1:
+            raise CommandError("--anos, --clientes e --produtos devem ser maiores que zero.")
+
+        hoje = timezone.localdate()
+        gerador = Gerador(options['semente'], options['anos'], hoje)
+        lote = options['lote']
+
+        with transaction.atomic():
+            clientes = gerador.clientes(options['clientes'], proximo_id(Cliente))
+            Cliente.objects.bulk_create(clientes, batch_size=lote)
+            # O auto_now_add do bulk_create sobrescreve a data: grava a data sorteada depois
+            Cliente.objects.bulk_update(clientes, ['data_cadastro'], batch_size=lote)
+
+            produtos = gerador.produtos(options['produtos'], proximo_id(Produto))
+            Produto.objects.bulk_create(produtos, batch_size=lote)
+
+            pesos_clientes = gerador.pesos_cauda_longa(len(clientes), 1.2)
+            pesos_produtos = gerador.pesos_cauda_longa(len(produtos), 1.0)
+            ids = {model: proximo_id(model) for model in (Orcamento, ItemOrcamento, Pedido, ItemPedido, Pagamento)}
+            totais = dict.fromkeys(('orcamentos', 'pedidos', 'itens', 'pagamentos'), 0)
+
+            def novo_id(model):
+                ids[model] += 1
+                return ids[model] - 1
+
+            # Orçamentos (e os pedidos dos aprovados) e pedidos avulsos, gravados em lotes
+            total_registros = options['orcamentos'] + options['pedidos_avulsos']
+            for inicio in range(0, total_registros, lote):
+                orcamentos, itens_orcamento, pedidos, itens_pedido, pagamentos = [], [], [], [], []
+                for indice in range(inicio, min(inicio + lote, total_registros)):
+                    cliente = gerador.aleatorio.choices(clientes, cum_weights=pesos_clientes)[0]
+                    dia = gerador.dia()
+                    orcamento = None
+                    if indice < options['orcamentos']:
+                        orcamento = Orcamento(id=novo_id(Orcamento), cliente=cliente, data_criacao=gerador.momento(dia))
+                        itens = gerador.itens(ItemOrcamento, produtos, pesos_produtos, options['itens_maximo'], orcamento=orcamento)
+                        for item in itens:
+                            item.id = novo_id(ItemOrcamento)
+                        orcamento.valor_total = sum((item.subtotal for item in itens), Decimal('0'))
+                        recente = (hoje - dia).days < 15
+                        aprovado = gerador.aleatorio.random() < options['taxa_aprovacao']
+                        orcamento.status = 'Aprovado' if aprovado else ('Em Aberto' if recente else 'Rejeitado')
+                        orcamentos.append(orcamento)
+                        itens_orcamento += itens
+                        if not aprovado:
+                            continue
+                        dia = min(dia + datetime.timedelta(days=gerador.aleatorio.randint(0, 5)), hoje)
+
+                    pedido = Pedido(
+                        id=novo_id(Pedido), cliente=cliente, orcamento_origem=orcamento,
+                        data_criacao=gerador.momento(dia), status_producao=gerador.status_producao(dia),
+                        previsto_entrega=dia + datetime.timedelta(days=gerador.aleatorio.randint(3, 15)),
+                    )
+                    if orcamento is not None:
+                        itens = [
+                            ItemPedido(
+                                id=novo_id(ItemPedido), pedido=pedido, produto=item.produto, quantidade=item.quantidade,
+                                largura=item.largura, altura=item.altura, subtotal=item.subtotal,
+                                descricao_customizada=item.descricao_customizada,
+                            )
+                            for item in itens
+                        ]
+                    else:
+                        itens = gerador.itens(ItemPedido, produtos, pesos_produtos, options['itens_maximo'], pedido=pedido)
+                        for item in itens:
+                            item.id = novo_id(ItemPedido)
+                    pedido.valor_total = sum((item.subtotal for item in itens), Decimal('0'))
+                    pedido.custo_producao = gerador.custo_itens(itens)
+                    if pedido.status_producao == Pedido.STATUS_FINALIZADO:
+                        pedido.data_producao = min(pedido.previsto_entrega, hoje)
+                    novos_pagamentos = gerador.pagamentos(pedido, ids[Pagamento])
+                    ids[Pagamento] += len(novos_pagamentos)
+                    pedidos.append(pedido)
+                    itens_pedido += itens
+                    pagamentos += novos_pagamentos
+
+                Orcamento.objects.bulk_create(orcamentos, batch_size=lote)
+                ItemOrcamento.objects.bulk_create(itens_orcamento, batch_size=lote)
+                Pedido.objects.bulk_create(pedidos, batch_size=lote)
+                ItemPedido.objects.bulk_create(itens_pedido, batch_size=lote)
+                Pagamento.objects.bulk_create(pagamentos, batch_size=lote)
+                totais['orcamentos'] += len(orcamentos)
+                totais['pedidos'] += len(pedidos)
+                totais['itens'] += len(itens_orcamento) + len(itens_pedido)
+                totais['pagamentos'] += len(pagamentos)
+                self.stdout.write(f"{min(inicio + lote, total_registros)}/{total_registros} orçamentos e pedidos...")
+
+            despesas = gerador.despesas(options['despesas'])
+            Despesa.objects.bulk_create(despesas, batch_size=lote)
+
+            # O bulk_create não dispara os sinais: as tabelas analíticas são refeitas de uma vez
+            estatisticas = reconstruir_estatisticas()
+            celulas = reconstruir_vendas_produtos()
+
+        catalogo.invalidar()
+        snapshot_itens.invalidar()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(clientes)} cliente(s), {len(produtos)} produto(s), {totais['orcamentos']} orçamento(s), "
+            f"{totais['pedidos']} pedido(s), {totais['itens']} item(ns), {totais['pagamentos']} pagamento(s) e "
+            f"{len(despesas)} despesa(s) gerados; {estatisticas} estatística(s) de cliente e "
+            f"{celulas} célula(s) produto × mês reconstruídas."
+        ))
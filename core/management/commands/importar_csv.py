@@ -0,0 +1,53 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import IMPORTADORES, TAMANHO_LOTE_PADRAO, ArquivoIlegivel, importar_clientes
+
+
+class Command(BaseCommand):
+    help = "Importa clientes ou produtos de um arquivo CSV, em lotes, gerando um relatório de erros por linha."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(IMPORTADORES))
+        parser.add_argument('arquivo', help="Caminho do arquivo CSV (UTF-8, separado por ',' ou ';')")
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_PADRAO, help="Linhas por lote")
+        parser.add_argument(
+            '--somente-novos', action='store_true',
+            help="Clientes: não atualiza CPF/CNPJ já cadastrados (reporta como erro)"
+        )
+        parser.add_argument('--relatorio', help="Grava o relatório de erros neste CSV (linha;campo;mensagem)")
+
+    def handle(self, *args, **options):
+        importador = IMPORTADORES[options['tipo']]
+        kwargs = {'tamanho_lote': options['lote']}
+        if importador is importar_clientes:
+            kwargs['atualizar_existentes'] = not options['somente_novos']
+
+        try:
+            with open(options['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+                resultado = importador(arquivo, **kwargs)
+        except OSError as exc:
+            raise CommandError(f"Não foi possível ler o arquivo: {exc}")
+        except ArquivoIlegivel as exc:
+            raise CommandError(f"{exc} Nada foi importado.")
+
+        linhas_relatorio = [
+            (erro['linha'], campo, str(mensagem))
+            for erro in resultado.como_dict()['erros']
+            for campo, mensagens in erro['erros'].items()
+            for mensagem in mensagens
+        ]
+        if options['relatorio']:
+            with open(options['relatorio'], 'w', encoding='utf-8', newline='') as saida:
+                escritor = csv.writer(saida, delimiter=';')
+                escritor.writerow(['linha', 'campo', 'mensagem'])
+                escritor.writerows(linhas_relatorio)
+        else:
+            for linha, campo, mensagem in linhas_relatorio:
+                self.stderr.write(f"Linha {linha} - {campo}: {mensagem}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.criados} criado(s), {resultado.atualizados} atualizado(s), "
+            f"{len(resultado.erros)} linha(s) com erro."
+        ))
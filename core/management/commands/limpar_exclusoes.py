@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.sincronizacao import configuracao, limpar_exclusoes
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga as marcas de exclusão da sincronização incremental mais antigas que "
+        "SINCRONIZACAO['retencao_exclusoes_dias']. Rode diariamente."
+    )
+
+    def handle(self, *args, **options):
+        apagadas = limpar_exclusoes()
+        dias = configuracao()['retencao_exclusoes_dias']
+        self.stdout.write(self.style.SUCCESS(f"{apagadas} marca(s) de exclusão com mais de {dias} dia(s) apagada(s)."))
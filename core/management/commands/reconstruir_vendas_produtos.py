@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.vendas_mensais import reconstruir_vendas_produtos
+
+
+class Command(BaseCommand):
+    help = "Reconstrói a tabela fato de vendas por produto e mês a partir dos itens de pedido."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = reconstruir_vendas_produtos()
+        self.stdout.write(self.style.SUCCESS(f"{total} registro(s) produto × mês gerado(s)."))
@@ -0,0 +1,401 @@
+# core/metricas.py
+"""
+Métricas no formato texto do Prometheus, expostas em /metrics.
+
+Cada processo acumula contadores e histogramas em memória e grava um arquivo
+JSON próprio (<diretorio>/<pid>.json) no máximo a cada 'intervalo_gravacao'
+segundos; o /metrics grava o do processo atual e soma os arquivos de todos os
+processos. Assim, sob o gunicorn com vários workers, qualquer worker que atender
+o scrape devolve o total, sem depender de um serviço externo.
+
+O arquivo de um processo que já terminou (pid sem processo vivo) é somado a
+ARQUIVO_ENCERRADOS e apagado no próximo /metrics: o diretório não cresce com os
+workers reciclados e os contadores do total não diminuem. Por usar pids, o
+diretório é local à máquina. Um worker reiniciado com o mesmo pid recomeça os
+seus contadores, o que o Prometheus trata como um reset (rate() e increase()
+continuam corretos).
+
+Configuração (settings.METRICAS): 'ativa', 'diretorio', 'intervalo_gravacao',
+'token' e 'publica'. O /metrics aceita 'Authorization: Bearer <token>' (se o
+token estiver definido) ou o JWT de um usuário staff; 'publica': True dispensa
+a autenticação.
+"""
+import contextlib
+import functools
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .instrumentacao import coletor_atual
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem limpeza dos arquivos de processos encerrados
+    fcntl = None
+
+logger = logging.getLogger('core.desempenho')
+
+CONFIGURACAO_PADRAO = {
+    'ativa': True,
+    'diretorio': None,
+    'intervalo_gravacao': 5,
+    'token': None,
+    'publica': False,
+}
+
+ARQUIVO_ENCERRADOS = 'encerrados.json'
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+BUCKETS_BYTES = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000)
+
+
+def configuracao():
+    config = {**CONFIGURACAO_PADRAO, **getattr(settings, 'METRICAS', {})}
+    config['diretorio'] = Path(config['diretorio'] or settings.BASE_DIR / 'metricas')
+    return config
+
+
+def _chave(rotulos):
+    return tuple(sorted(rotulos.items()))
+
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ''
+    texto = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for nome, valor in pares
+    )
+    return '{' + texto + '}'
+
+
+def _formatar_numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+
+    def vazio(self):
+        return 0
+
+    def somar(self, acumulado, valor):
+        return acumulado + valor
+
+    def linhas(self, series):
+        for rotulos, valor in sorted(series.items()):
+            yield f'{self.nome}{_formatar_rotulos(rotulos)} {_formatar_numero(valor)}'
+
+
+class Histograma:
+    """ Guarda as contagens por bucket (não acumuladas), a soma e o total de observações. """
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, buckets):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = tuple(buckets)
+
+    def vazio(self):
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def somar(self, acumulado, valor):
+        contagens = [a + b for a, b in zip(acumulado[0], valor[0])]
+        return [contagens, acumulado[1] + valor[1], acumulado[2] + valor[2]]
+
+    def linhas(self, series):
+        for rotulos, (contagens, soma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + ('+Inf',), contagens):
+                acumulado += contagem
+                yield f'{self.nome}_bucket{_formatar_rotulos(rotulos, [("le", limite)])} {acumulado}'
+            yield f'{self.nome}_sum{_formatar_rotulos(rotulos)} {_formatar_numero(soma)}'
+            yield f'{self.nome}_count{_formatar_rotulos(rotulos)} {total}'
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Existe, mas é de outro usuário
+        return True
+    return True
+
+
+def _ler_json(arquivo):
+    try:
+        return json.loads(arquivo.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+class RegistroMetricas:
+    """ Valores do processo atual, por métrica e conjunto de rótulos (seguro entre threads). """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metricas = {}
+        self._valores = {}
+        self._pid = os.getpid()
+        self._gravado_em = 0.0
+
+    def registrar(self, metrica):
+        self.metricas[metrica.nome] = metrica
+        return metrica
+
+    def _valores_do_processo(self):
+        # Depois de um fork (gunicorn --preload) o filho começa do zero, com o seu próprio arquivo
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._valores = {}
+            self._gravado_em = 0.0
+        return self._valores
+
+    def incrementar(self, contador, valor=1, **rotulos):
+        with self._lock:
+            series = self._valores_do_processo().setdefault(contador.nome, {})
+            chave = _chave(rotulos)
+            series[chave] = series.get(chave, 0) + valor
+
+    def observar(self, histograma, valor, **rotulos):
+        with self._lock:
+            series = self._valores_do_processo().setdefault(histograma.nome, {})
+            chave = _chave(rotulos)
+            atual = series.get(chave)
+            if atual is None:
+                atual = series[chave] = histograma.vazio()
+            indice = next(
+                (posicao for posicao, limite in enumerate(histograma.buckets) if valor <= limite),
+                len(histograma.buckets),
+            )
+            atual[0][indice] += 1
+            atual[1] += valor
+            atual[2] += 1
+
+    # ---------- Persistência por processo ----------
+    def gravar(self, diretorio):
+        with self._lock:
+            valores = self._valores_do_processo()
+            conteudo = {
+                nome: [[list(map(list, chave)), valor] for chave, valor in series.items()]
+                for nome, series in valores.items()
+            }
+            self._gravado_em = time.monotonic()
+        diretorio.mkdir(parents=True, exist_ok=True)
+        arquivo = diretorio / f'{self._pid}.json'
+        temporario = arquivo.with_suffix(f'.{threading.get_ident()}.tmp')
+        temporario.write_text(json.dumps(conteudo), encoding='utf-8')
+        os.replace(temporario, arquivo)
+
+    def gravar_se_preciso(self, config):
+        if time.monotonic() - self._gravado_em >= config['intervalo_gravacao']:
+            try:
+                self.gravar(config['diretorio'])
+            except OSError:
+                logger.exception("Não foi possível gravar as métricas do processo")
+
+    def _acumular(self, total, conteudo):
+        for nome, series in conteudo.items():
+            metrica = self.metricas.get(nome)
+            if metrica is None:
+                continue
+            destino = total.setdefault(nome, {})
+            for chave, valor in series:
+                chave = tuple(map(tuple, chave))
+                destino[chave] = metrica.somar(destino.get(chave, metrica.vazio()), valor)
+        return total
+
+    def arquivar_encerrados(self, diretorio):
+        """
+        Soma os arquivos de processos que já terminaram a ARQUIVO_ENCERRADOS e os apaga.
+        Um lock de arquivo impede que dois workers arquivem o mesmo processo duas vezes.
+        """
+        if fcntl is None:
+            return
+        mortos = [arquivo for arquivo in diretorio.glob('*.json')
+                  if arquivo.stem.isdigit() and not _processo_vivo(int(arquivo.stem))]
+        if not mortos:
+            return
+        with open(diretorio / '.lock', 'w') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            encerrados = diretorio / ARQUIVO_ENCERRADOS
+            total = self._acumular({}, _ler_json(encerrados) or {})
+            arquivados = []
+            for arquivo in mortos:
+                conteudo = _ler_json(arquivo)  # None: outro worker já arquivou
+                if conteudo is not None:
+                    self._acumular(total, conteudo)
+                    arquivados.append(arquivo)
+            if not arquivados:
+                return
+            temporario = encerrados.with_suffix(f'.{os.getpid()}.tmp')
+            temporario.write_text(json.dumps({
+                nome: [[list(map(list, chave)), valor] for chave, valor in series.items()]
+                for nome, series in total.items()
+            }), encoding='utf-8')
+            os.replace(temporario, encerrados)
+            for arquivo in arquivados:
+                arquivo.unlink(missing_ok=True)
+
+    def somar_processos(self, diretorio):
+        """ {nome: {rótulos: valor}} com a soma dos arquivos de todos os processos. """
+        total = {}
+        for arquivo in sorted(diretorio.glob('*.json')):
+            conteudo = _ler_json(arquivo)
+            if conteudo is not None:
+                self._acumular(total, conteudo)
+        return total
+
+    def exportar(self, diretorio):
+        """ Texto no formato de exposição do Prometheus (versão 0.0.4). """
+        self.gravar(diretorio)
+        try:
+            self.arquivar_encerrados(diretorio)
+        except OSError:
+            logger.exception("Não foi possível arquivar as métricas de processos encerrados")
+        valores = self.somar_processos(diretorio)
+        linhas = []
+        for nome, metrica in self.metricas.items():
+            linhas += [f'# HELP {nome} {metrica.ajuda}', f'# TYPE {nome} {metrica.tipo}']
+            linhas += metrica.linhas(valores.get(nome, {}))
+
+        # Taxa de acerto derivada dos contadores, já somados entre os processos
+        linhas += [
+            f'# HELP {CACHE_TAXA_ACERTO} Fração das consultas ao cache atendidas sem recarregar.',
+            f'# TYPE {CACHE_TAXA_ACERTO} gauge',
+        ]
+        por_cache = {}
+        for chave, total in valores.get(CACHE_CONSULTAS.nome, {}).items():
+            rotulos = dict(chave)
+            contagem = por_cache.setdefault(rotulos['cache'], [0, 0])
+            contagem[0] += total if rotulos['resultado'] == 'acerto' else 0
+            contagem[1] += total
+        for cache, (acertos, total) in sorted(por_cache.items()):
+            linhas.append(f'{CACHE_TAXA_ACERTO}{_formatar_rotulos([("cache", cache)])} {acertos / total if total else 0.0!r}')
+        return '\n'.join(linhas) + '\n'
+
+
+registro = RegistroMetricas()
+
+REQUISICAO_DURACAO = registro.registrar(Histograma(
+    'http_requisicao_duracao_segundos', 'Tempo de resposta por rota, método e status.', BUCKETS_SEGUNDOS
+))
+REQUISICAO_CONSULTAS = registro.registrar(Histograma(
+    'http_requisicao_consultas_sql', 'Consultas SQL por requisição, por rota.', BUCKETS_CONSULTAS
+))
+PDF_DURACAO = registro.registrar(Histograma(
+    'pdf_renderizacao_duracao_segundos', 'Tempo do WeasyPrint por tipo de documento.', BUCKETS_SEGUNDOS
+))
+PDF_TAMANHO = registro.registrar(Histograma(
+    'pdf_tamanho_bytes', 'Tamanho do PDF gerado por tipo de documento.', BUCKETS_BYTES
+))
+RELATORIO_DURACAO = registro.registrar(Histograma(
+    'relatorio_calculo_duracao_segundos', 'Tempo de cálculo de cada relatório (sem a renderização).',
+    BUCKETS_SEGUNDOS
+))
+CACHE_CONSULTAS = registro.registrar(Contador(
+    'cache_consultas_total', 'Consultas aos caches da aplicação, por resultado (acerto ou falha).'
+))
+CACHE_TAXA_ACERTO = 'cache_taxa_acerto'
+
+
+def registrar_cache(cache, acerto):
+    registro.incrementar(CACHE_CONSULTAS, cache=cache, resultado='acerto' if acerto else 'falha')
+
+
+def registrar_pdf(documento, segundos, tamanho):
+    registro.observar(PDF_DURACAO, segundos, documento=documento)
+    registro.observar(PDF_TAMANHO, tamanho, documento=documento)
+
+
+@contextlib.contextmanager
+def cronometrar(histograma, **rotulos):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro.observar(histograma, time.perf_counter() - inicio, **rotulos)
+
+
+def medir_relatorio(nome):
+    """ Decorador do get() de uma view de relatório: observa o tempo de cálculo do relatório. """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with cronometrar(RELATORIO_DURACAO, relatorio=nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+
+class MetricasMiddleware:
+    """
+    Observa duração e consultas SQL de cada requisição, pela rota (nome da URL, para
+    não criar uma série por id). Fica depois do InstrumentacaoMiddleware, de quem
+    lê a contagem de consultas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = configuracao()
+        if not config['ativa']:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        correspondencia = getattr(request, 'resolver_match', None)
+        rota = correspondencia.view_name if correspondencia else 'nao_encontrada'
+        registro.observar(
+            REQUISICAO_DURACAO, duracao, rota=rota, metodo=request.method, status=response.status_code
+        )
+        coletor = coletor_atual()
+        if coletor is not None:
+            registro.observar(REQUISICAO_CONSULTAS, len(coletor.consultas), rota=rota)
+        registro.gravar_se_preciso(config)
+        return response
+
+
+def _autorizar(request, config):
+    """ None se pode ver as métricas; senão o status da recusa (401 ou 403). """
+    if config['publica']:
+        return None
+    autorizacao = request.headers.get('Authorization', '')
+    if config['token'] and hmac.compare_digest(autorizacao.encode(), f"Bearer {config['token']}".encode()):
+        return None
+    try:
+        autenticado = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return 401
+    if autenticado is None:
+        return 401
+    return None if autenticado[0].is_staff else 403
+
+
+def metricas_view(request):
+    config = configuracao()
+    recusa = _autorizar(request, config)
+    if recusa:
+        return HttpResponse(status=recusa)
+    return HttpResponse(
+        registro.exportar(config['diretorio']), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,103 @@
+import logging
+import re
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+TAMANHOS_VALIDOS = (11, 14)  # CPF e CNPJ
+
+
+def preencher_cpf_cnpj_normalizado(apps, schema_editor):
+    """
+    Preenche a coluna normalizada dos clientes existentes.
+
+    Documentos que não podem entrar no índice único não ficam em cpf_cnpj: o valor
+    original vai para cpf_cnpj_pendente, com o motivo em cpf_cnpj_pendencia, e o
+    cliente aparece no filtro do admin para correção. Assim uma gravação posterior
+    (admin, importação) não recalcula um valor duplicado nem maior que a coluna.
+      - INVALIDO: não tem 11 nem 14 dígitos;
+      - DUPLICADO: repete o documento de um cliente mais antigo, que fica com ele.
+    O relatório vai para o log (logger desta migração).
+    """
+    Cliente = apps.get_model('core', 'Cliente')
+    vistos = {}
+    pendencias = []
+    para_atualizar = []
+
+    clientes = (
+        Cliente.objects
+        .exclude(cpf_cnpj__isnull=True)
+        .exclude(cpf_cnpj='')
+        .only('id', 'cpf_cnpj')
+        .order_by('id')
+    )
+    for cliente in clientes.iterator(chunk_size=2000):
+        digitos = re.sub(r'\D', '', cliente.cpf_cnpj)
+        if not digitos:
+            continue
+        if len(digitos) not in TAMANHOS_VALIDOS:
+            motivo, detalhe = 'INVALIDO', f"{len(digitos)} dígitos"
+        elif digitos in vistos:
+            motivo, detalhe = 'DUPLICADO', f"duplica o cliente #{vistos[digitos]}"
+        else:
+            vistos[digitos] = cliente.id
+            cliente.cpf_cnpj_normalizado = digitos
+            para_atualizar.append(cliente)
+            continue
+        pendencias.append((cliente.id, cliente.cpf_cnpj, motivo, detalhe))
+        cliente.cpf_cnpj_pendente, cliente.cpf_cnpj_pendencia = cliente.cpf_cnpj, motivo
+        cliente.cpf_cnpj = None
+        para_atualizar.append(cliente)
+
+    Cliente.objects.bulk_update(
+        para_atualizar, ['cpf_cnpj', 'cpf_cnpj_normalizado', 'cpf_cnpj_pendente', 'cpf_cnpj_pendencia'],
+        batch_size=1000
+    )
+
+    if pendencias:
+        logger.warning(
+            "%d cliente(s) com CPF/CNPJ duplicado ou inválido ficaram sem documento; "
+            "o valor original está em cpf_cnpj_pendente (filtre por cpf_cnpj_pendencia no admin).",
+            len(pendencias)
+        )
+        for cliente_id, cpf_cnpj, motivo, detalhe in pendencias:
+            logger.warning("Cliente #%d: %s %s (%s)", cliente_id, motivo, cpf_cnpj, detalhe)
+
+
+def restaurar_cpf_cnpj(apps, schema_editor):
+    """ Volta os documentos pendentes para cpf_cnpj antes de remover as colunas. """
+    Cliente = apps.get_model('core', 'Cliente')
+    for cliente in Cliente.objects.filter(cpf_cnpj_pendente__isnull=False).only('id', 'cpf_cnpj_pendente'):
+        Cliente.objects.filter(pk=cliente.pk).update(cpf_cnpj=cliente.cpf_cnpj_pendente)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_produto_custo_produto_estoque_atual_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_cnpj_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_cnpj_pendente',
+            field=models.CharField(blank=True, max_length=18, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_cnpj_pendencia',
+            field=models.CharField(blank=True, choices=[('DUPLICADO', 'Duplica o documento de outro cliente'), ('INVALIDO', 'Não é um CPF nem um CNPJ')], max_length=10, null=True),
+        ),
+        migrations.RunPython(preencher_cpf_cnpj_normalizado, restaurar_cpf_cnpj),
+        migrations.AlterField(
+            model_name='cliente',
+            name='cpf_cnpj_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=14, null=True, unique=True),
+        ),
+    ]
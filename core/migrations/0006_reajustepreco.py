@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_cliente_cpf_cnpj_normalizado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReajustePreco',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField(default=django.utils.timezone.now)),
+                ('modo', models.CharField(choices=[('PERCENTUAL', 'Percentual'), ('VALOR', 'Valor Absoluto')], default='PERCENTUAL', max_length=10)),
+                ('ajuste_preco', models.DecimalField(decimal_places=2, default=0, help_text='Percentual ou valor somado ao preço', max_digits=10)),
+                ('ajuste_custo', models.DecimalField(decimal_places=2, default=0, help_text='Percentual ou valor somado ao custo', max_digits=10)),
+                ('tipo_precificacao', models.CharField(blank=True, choices=[('UNICO', 'Preço por Unidade'), ('M2', 'Preço por Metro Quadrado')], max_length=5, null=True)),
+                ('produtos_filtrados', models.JSONField(blank=True, default=list, help_text='IDs informados no filtro (vazio = todos)')),
+                ('produtos_afetados', models.PositiveIntegerField(default=0)),
+                ('motivo', models.CharField(blank=True, max_length=255, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reajuste de Preço',
+                'verbose_name_plural': 'Reajustes de Preços',
+                'ordering': ['-data'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_reajustepreco'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estatistica', serialize=False, to='core.cliente')),
+                ('primeiro_pedido', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_pedido', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('total_pedidos', models.PositiveIntegerField(default=0)),
+                ('total_gasto', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12)),
+                ('ticket_medio', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('score_recencia', models.PositiveSmallIntegerField(default=1, help_text='1 (compra antiga) a 5 (compra recente)')),
+                ('score_frequencia', models.PositiveSmallIntegerField(default=1, help_text='1 (poucos pedidos) a 5 (muitos pedidos)')),
+                ('score_monetario', models.PositiveSmallIntegerField(default=1, help_text='1 (gasta pouco) a 5 (gasta muito)')),
+                ('segmento', models.CharField(choices=[('CAMPEOES', 'Campeões'), ('LEAIS', 'Leais'), ('NOVOS', 'Novos'), ('PROMISSORES', 'Promissores'), ('EM_RISCO', 'Em Risco'), ('HIBERNANDO', 'Hibernando')], db_index=True, default='HIBERNANDO', max_length=15)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estatística de Cliente',
+                'verbose_name_plural': 'Estatísticas de Clientes',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_estatisticacliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaProdutoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês')),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('metros_quadrados', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('custo', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('ultima_venda', models.DateField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendas_mensais', to='core.produto')),
+            ],
+            options={
+                'verbose_name': 'Venda Mensal de Produto',
+                'verbose_name_plural': 'Vendas Mensais de Produtos',
+                'indexes': [models.Index(fields=['mes'], name='venda_produto_mensal_mes')],
+                'constraints': [models.UniqueConstraint(fields=('produto', 'mes'), name='venda_produto_mensal_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_vendaprodutomensal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['status_pagamento', 'cliente'], name='pedido_status_pgto_cliente'),
+        ),
+    ]
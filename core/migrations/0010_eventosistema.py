@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_pedido_status_pgto_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoSistema',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('dados', models.JSONField(blank=True, default=dict)),
+                ('criado_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Evento do Sistema',
+                'verbose_name_plural': 'Eventos do Sistema',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExclusaoRegistro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(help_text='Nome do conjunto na sincronização (ex: pedidos)', max_length=20)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('excluido_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Exclusão de Registro',
+                'verbose_name_plural': 'Exclusões de Registros',
+                'indexes': [models.Index(fields=['excluido_em', 'id'], name='exclusao_registro_cursor')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:04
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_exclusaoregistro'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cliente',
+            name='cpf_cnpj',
+            field=models.CharField(blank=True, default=None, max_length=18, null=True, validators=[core.models.validar_cpf_cnpj]),
+        ),
+    ]
@@ -1,16 +1,51 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .precificacao import subtotal_item
+
+
+def normalizar_cpf_cnpj(valor):
+    """
+    Remove pontuação de um CPF/CNPJ, mantendo apenas os dígitos.
+    Retorna None para valores vazios, para que o índice único ignore o registro.
+    """
+    if not valor:
+        return None
+    digitos = re.sub(r'\D', '', str(valor))
+    return digitos or None
+
+
+def validar_cpf_cnpj(valor):
+    """ Aceita vazio, CPF (11 dígitos) ou CNPJ (14 dígitos), com ou sem pontuação. """
+    if valor and str(valor).strip() and len(normalizar_cpf_cnpj(valor) or '') not in (11, 14):
+        raise ValidationError("Informe um CPF com 11 dígitos ou um CNPJ com 14 dígitos.", code='cpf_cnpj_invalido')
+
 
 # ----------------------------
 # Modelos de Entidades Base
 # ----------------------------
 
 class Cliente(models.Model):
+    class PendenciaCpfCnpj(models.TextChoices):
+        DUPLICADO = 'DUPLICADO', 'Duplica o documento de outro cliente'
+        INVALIDO = 'INVALIDO', 'Não é um CPF nem um CNPJ'
+
     nome = models.CharField(max_length=200)  # Pode ser Nome ou Razão Social
     email = models.EmailField(blank=True, null=True)
     telefone = models.CharField(max_length=20, blank=True, null=True)
-    cpf_cnpj = models.CharField(max_length=18, blank=True, null=True, default=None)
+    cpf_cnpj = models.CharField(max_length=18, blank=True, null=True, default=None, validators=[validar_cpf_cnpj])
+    # Apenas dígitos; é a coluna indexada usada para detectar duplicidade
+    cpf_cnpj_normalizado = models.CharField(max_length=14, unique=True, blank=True, null=True, editable=False)
+    # Documento legado recusado na normalização (migração 0005), guardado fora de cpf_cnpj para
+    # não violar o índice único nas próximas gravações; sai daqui quando um novo CPF/CNPJ é informado
+    cpf_cnpj_pendente = models.CharField(max_length=18, blank=True, null=True)
+    cpf_cnpj_pendencia = models.CharField(max_length=10, choices=PendenciaCpfCnpj.choices, blank=True, null=True)
     data_cadastro = models.DateTimeField(auto_now_add=True, null=True)
 
     # --- NOVOS CAMPOS (Exemplo) ---
@@ -22,6 +57,27 @@ class Cliente(models.Model):
     cidade = models.CharField(max_length=100, blank=True, null=True)
     estado = models.CharField(max_length=2, blank=True, null=True)
 
+    # Muda a cada gravação: validador do GET condicional (ETag/Last-Modified, ver core/condicional.py)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    def clean(self):
+        # Formulários do admin: a duplicidade vira erro do campo em vez de IntegrityError
+        normalizado = normalizar_cpf_cnpj(self.cpf_cnpj)
+        if normalizado and Cliente.objects.filter(cpf_cnpj_normalizado=normalizado).exclude(pk=self.pk).exists():
+            raise ValidationError({'cpf_cnpj': "Já existe um cliente cadastrado com este CPF/CNPJ."})
+
+    def save(self, *args, **kwargs):
+        self.cpf_cnpj_normalizado = normalizar_cpf_cnpj(self.cpf_cnpj)
+        if self.cpf_cnpj_normalizado and self.cpf_cnpj_pendencia:
+            self.cpf_cnpj_pendente = self.cpf_cnpj_pendencia = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            # auto_now só é gravado se estiver em update_fields
+            kwargs['update_fields'] = set(update_fields) | {'atualizado_em'}
+            if 'cpf_cnpj' in update_fields:
+                kwargs['update_fields'] |= {'cpf_cnpj_normalizado', 'cpf_cnpj_pendente', 'cpf_cnpj_pendencia'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.nome
 
@@ -67,6 +123,7 @@ class Produto(models.Model):
         blank=True, 
         help_text="Nível de alerta para o estoque"
     )
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f'{self.nome} ({self.get_tipo_precificacao_display()})'
@@ -76,6 +133,31 @@ class Produto(models.Model):
         verbose_name_plural = "Produtos"
 
 
+class ReajustePreco(models.Model):
+    """Registro de auditoria de um reajuste de preços em massa (um por lote aplicado)."""
+    class Modo(models.TextChoices):
+        PERCENTUAL = 'PERCENTUAL', 'Percentual'
+        VALOR = 'VALOR', 'Valor Absoluto'
+
+    data = models.DateTimeField(default=timezone.now)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    modo = models.CharField(max_length=10, choices=Modo.choices, default=Modo.PERCENTUAL)
+    ajuste_preco = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Percentual ou valor somado ao preço")
+    ajuste_custo = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Percentual ou valor somado ao custo")
+    tipo_precificacao = models.CharField(max_length=5, choices=Produto.TipoPrecificacao.choices, blank=True, null=True)
+    produtos_filtrados = models.JSONField(default=list, blank=True, help_text="IDs informados no filtro (vazio = todos)")
+    produtos_afetados = models.PositiveIntegerField(default=0)
+    motivo = models.CharField(max_length=255, blank=True, null=True)
+
+    def __str__(self):
+        return f'Reajuste #{self.id} ({self.get_modo_display()}) em {self.data.strftime("%d/%m/%Y")}'
+
+    class Meta:
+        verbose_name = "Reajuste de Preço"
+        verbose_name_plural = "Reajustes de Preços"
+        ordering = ['-data']
+
+
 # -------------------------------------
 # Modelos de Transações e Fluxo de Trabalho
 # -------------------------------------
@@ -85,13 +167,25 @@ class Orcamento(models.Model):
     data_criacao = models.DateTimeField(default=timezone.now)
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=50, default='Em Aberto', help_text="Ex: Em Aberto, Aprovado, Rejeitado")
+    # Também muda quando os itens mudam (recalcular_totais)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def recalcular_total(self):
         total = self.itens.all().aggregate(
             total_calculado=models.Sum('subtotal')
         )['total_calculado']
         self.valor_total = total if total is not None else 0
-        self.save(update_fields=['valor_total'])
+        self.save(update_fields=['valor_total', 'atualizado_em'])
+
+    @classmethod
+    def recalcular_totais(cls, ids):
+        """ Recalcula o valor_total de vários orçamentos com um único UPDATE. """
+        soma_itens = ItemOrcamento.objects.filter(orcamento=OuterRef('pk')).order_by()\
+            .values('orcamento').annotate(total=Sum('subtotal')).values('total')
+        cls.objects.filter(id__in=ids).update(
+            valor_total=Coalesce(Subquery(soma_itens), Value(0), output_field=models.DecimalField()),
+            atualizado_em=timezone.now(),
+        )
 
     def __str__(self):
         return f'Orçamento #{self.id} - {self.cliente.nome}'
@@ -105,30 +199,15 @@ class Orcamento(models.Model):
         """
         Cria um Pedido com base neste orçamento, copiando os itens
         (incluindo descricao_customizada e subtotal).
-        Retorna o Pedido criado.
+        Retorna o Pedido criado; levanta ValueError se não for possível converter.
         """
-        pedido = Pedido.objects.create(
-            cliente=self.cliente,
-            orcamento_origem=self,
-            valor_total=0,  # recalculado abaixo
-            status_producao='Aguardando',
-            status_pagamento=Pedido.StatusPagamento.PENDENTE,
-            data_criacao=timezone.now()
-        )
-        # Copia os itens do orçamento
-        itens_orc = list(self.itens.all())
-        for io in itens_orc:
-            ItemPedido.objects.create(
-                pedido=pedido,
-                produto=io.produto if io.produto_id else None,  # ✅ segurança extra
-                quantidade=io.quantidade,
-                largura=io.largura,
-                altura=io.altura,
-                descricao_customizada=io.descricao_customizada,
-                subtotal=io.subtotal
-            )
-        pedido.recalcular_total()
-        return pedido
+        from .conversao import STATUS_APROVADO, converter_orcamentos
+
+        pedidos, recusados = converter_orcamentos([self.id])
+        if recusados:
+            raise ValueError(recusados[self.id])
+        self.status = STATUS_APROVADO
+        return pedidos[0]
 
 
 class ItemOrcamento(models.Model):
@@ -140,15 +219,13 @@ class ItemOrcamento(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     descricao_customizada = models.CharField(max_length=255, blank=True, null=True)
 
-    def save(self, *args, **kwargs):
-        # Calcula subtotal se não informado
+    def preencher_subtotal(self):
+        # Calcula subtotal se não informado (no orçamento, m² exige medidas)
         if not self.subtotal:
-            if self.produto.tipo_precificacao == 'M2':
-                if not self.largura or not self.altura:
-                    raise ValueError("Largura e Altura são obrigatórias para produtos por m²")
-                self.subtotal = self.produto.preco * self.largura * self.altura * self.quantidade
-            else:  # 'UNICO'
-                self.subtotal = self.produto.preco * self.quantidade
+            self.subtotal = subtotal_item(self, exigir_medidas=True)
+
+    def save(self, *args, **kwargs):
+        self.preencher_subtotal()
         super().save(*args, **kwargs)
 
     @property
@@ -171,6 +248,10 @@ class Pedido(models.Model):
         PARCIAL = 'PARCIAL', 'Parcial'
         PAGO = 'PAGO', 'Pago'
 
+    # Colunas do quadro de produção, na ordem do fluxo
+    STATUS_PRODUCAO = ('Aguardando', 'Aguardando Arte', 'Em Produção', 'Finalizado')
+    STATUS_FINALIZADO = 'Finalizado'
+
     cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, related_name="pedidos")
     orcamento_origem = models.OneToOneField(Orcamento, on_delete=models.SET_NULL, null=True, blank=True)
     data_criacao = models.DateTimeField(default=timezone.now)
@@ -183,21 +264,40 @@ class Pedido(models.Model):
     forma_envio = models.CharField(max_length=100, blank=True, null=True)
     codigo_rastreio = models.CharField(max_length=100, blank=True, null=True)
     link_fornecedor = models.URLField(max_length=255, blank=True, null=True)
+    # Também muda quando itens ou pagamentos mudam (ver core/signals.py)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda cliente e data originais para atualizar as tabelas analíticas se eles mudarem
+        instance._cliente_id_original = instance.__dict__.get('cliente_id')
+        instance._data_criacao_original = instance.__dict__.get('data_criacao')
+        # ... e os status originais, para publicar o evento de mudança de status
+        instance._status_producao_original = instance.__dict__.get('status_producao')
+        instance._status_pagamento_original = instance.__dict__.get('status_pagamento')
+        return instance
 
     def __str__(self):
         return f'Pedido #{self.id} - {self.cliente.nome}'
     
     def recalcular_total(self):
-        # Recalcula cada item conforme tipo de precificação
-        for item in self.itens.all():
-            item.save()
-        total = self.itens.aggregate(total_calculado=Sum('subtotal'))['total_calculado']
-        self.valor_total = total if total is not None else 0
-        self.save(update_fields=['valor_total'])
+        # Recalcula conforme o tipo de precificação só os itens sem subtotal (ver ItemPedido.save);
+        # os demais já estão gravados e entram direto na soma
+        itens = list(self.itens.all())
+        for item in itens:
+            if not item.subtotal:
+                item.save()
+        self.valor_total = sum((item.subtotal for item in itens), 0)
+        self.save(update_fields=['valor_total', 'atualizado_em'])
 
     class Meta:
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
+        indexes = [
+            # Contas a receber: pedidos em aberto agrupados por cliente
+            models.Index(fields=['status_pagamento', 'cliente'], name='pedido_status_pgto_cliente'),
+        ]
 
 
 class ItemPedido(models.Model):
@@ -210,24 +310,25 @@ class ItemPedido(models.Model):
     descricao_customizada = models.CharField(max_length=255, blank=True, null=True)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda pedido e produto originais: se mudarem, a célula antiga de VendaProdutoMensal também muda
+        instance._pedido_id_original = instance.__dict__.get('pedido_id')
+        instance._produto_id_original = instance.__dict__.get('produto_id')
+        return instance
+
     def __str__(self):
         base = self.descricao_customizada or (self.produto.nome if self.produto else "Item Manual")
         return f'{self.quantidade}x {base} (Pedido #{self.pedido.id})'
     
-    def save(self, *args, **kwargs):
-        # Calcula subtotal apenas se não informado
+    def preencher_subtotal(self):
+        # Calcula subtotal apenas se não informado (item manual ou m² sem medidas = 0)
         if not self.subtotal:
-            if self.produto:
-                if self.produto.tipo_precificacao == 'M2':
-                    if not self.largura or not self.altura:
-                        self.subtotal = 0
-                    else:
-                        self.subtotal = self.produto.preco * self.largura * self.altura * self.quantidade
-                else:  # 'UNICO'
-                    self.subtotal = self.produto.preco * self.quantidade
-            else:
-                # Item manual sem produto vinculado
-                self.subtotal = 0
+            self.subtotal = subtotal_item(self)
+
+    def save(self, *args, **kwargs):
+        self.preencher_subtotal()
         super().save(*args, **kwargs)
 
     class Meta:
@@ -265,6 +366,7 @@ class Pagamento(models.Model):
     valor = models.DecimalField(max_digits=10, decimal_places=2)
     data = models.DateTimeField(default=timezone.now)
     forma_pagamento = models.CharField(max_length=50, choices=FormaPagamento.choices, default=FormaPagamento.PIX)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f'Pagamento de R$ {self.valor} ({self.get_forma_pagamento_display()}) para o Pedido #{self.pedido.id}'
@@ -290,6 +392,7 @@ class Empresa(models.Model):
     logo_grande_dashboard = models.ImageField(upload_to='logos/', blank=True, null=True)
     logo_pequena_dashboard = models.ImageField(upload_to='logos/', blank=True, null=True)
     logo_orcamento_pdf = models.ImageField(upload_to='logos/', blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nome_empresa or "Configurações da Empresa"
@@ -300,3 +403,111 @@ class Empresa(models.Model):
 
     class Meta:
         verbose_name_plural = "Empresa"
+
+
+# ----------------------------
+# Tabelas Analíticas (derivadas, mantidas por sinais)
+# ----------------------------
+
+class EstatisticaCliente(models.Model):
+    """
+    Resumo de compras de um cliente (RFM), atualizado a cada gravação de Pedido.
+    Pode ser reconstruído com: python manage.py atualizar_estatisticas_clientes
+    """
+    class Segmento(models.TextChoices):
+        CAMPEOES = 'CAMPEOES', 'Campeões'
+        LEAIS = 'LEAIS', 'Leais'
+        NOVOS = 'NOVOS', 'Novos'
+        PROMISSORES = 'PROMISSORES', 'Promissores'
+        EM_RISCO = 'EM_RISCO', 'Em Risco'
+        HIBERNANDO = 'HIBERNANDO', 'Hibernando'
+
+    cliente = models.OneToOneField(Cliente, on_delete=models.CASCADE, primary_key=True, related_name='estatistica')
+    primeiro_pedido = models.DateTimeField(blank=True, null=True)
+    ultimo_pedido = models.DateTimeField(blank=True, null=True, db_index=True)
+    total_pedidos = models.PositiveIntegerField(default=0)
+    total_gasto = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
+    ticket_medio = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    score_recencia = models.PositiveSmallIntegerField(default=1, help_text="1 (compra antiga) a 5 (compra recente)")
+    score_frequencia = models.PositiveSmallIntegerField(default=1, help_text="1 (poucos pedidos) a 5 (muitos pedidos)")
+    score_monetario = models.PositiveSmallIntegerField(default=1, help_text="1 (gasta pouco) a 5 (gasta muito)")
+    segmento = models.CharField(max_length=15, choices=Segmento.choices, default=Segmento.HIBERNANDO, db_index=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Estatísticas de {self.cliente_id} ({self.get_segmento_display()})'
+
+    class Meta:
+        verbose_name = "Estatística de Cliente"
+        verbose_name_plural = "Estatísticas de Clientes"
+
+
+class VendaProdutoMensal(models.Model):
+    """
+    Fato de vendas por produto e mês (quantidade, m², receita, custo e última venda),
+    mantido pelos sinais de ItemPedido/Pedido. Reconstrução: python manage.py reconstruir_vendas_produtos
+    """
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='vendas_mensais')
+    mes = models.DateField(help_text="Primeiro dia do mês")
+    quantidade = models.PositiveIntegerField(default=0)
+    metros_quadrados = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    receita = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    custo = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ultima_venda = models.DateField(blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.produto_id} em {self.mes.strftime("%m/%Y")}: {self.quantidade} un.'
+
+    class Meta:
+        verbose_name = "Venda Mensal de Produto"
+        verbose_name_plural = "Vendas Mensais de Produtos"
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'mes'], name='venda_produto_mensal_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['mes'], name='venda_produto_mensal_mes'),
+        ]
+
+
+# ---------- EVENTOS EM TEMPO REAL ----------
+class EventoSistema(models.Model):
+    """
+    Evento de mudança (novo pedido, pagamento recebido, status alterado) entregue às telas
+    abertas pelo endpoint SSE /api/eventos/. A tabela é a fila compartilhada entre processos;
+    eventos antigos são apagados automaticamente (ver core/eventos.py).
+    """
+    tipo = models.CharField(max_length=50)
+    dados = models.JSONField(default=dict, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'Evento #{self.id} ({self.tipo})'
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Evento do Sistema"
+        verbose_name_plural = "Eventos do Sistema"
+
+
+# ---------- SINCRONIZAÇÃO INCREMENTAL ----------
+class ExclusaoRegistro(models.Model):
+    """
+    Marca (tombstone) da exclusão de um registro sincronizado, para que /api/sincronizacao/
+    avise os clientes offline. Gravada pelos sinais post_delete; as mais antigas que a
+    retenção são apagadas com: python manage.py limpar_exclusoes
+    """
+    modelo = models.CharField(max_length=20, help_text="Nome do conjunto na sincronização (ex: pedidos)")
+    objeto_id = models.PositiveBigIntegerField()
+    excluido_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.modelo} #{self.objeto_id} excluído em {self.excluido_em:%d/%m/%Y %H:%M}'
+
+    class Meta:
+        verbose_name = "Exclusão de Registro"
+        verbose_name_plural = "Exclusões de Registros"
+        indexes = [
+            # Leitura por cursor (excluido_em, id)
+            models.Index(fields=['excluido_em', 'id'], name='exclusao_registro_cursor'),
+        ]
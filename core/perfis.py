@@ -0,0 +1,236 @@
+# core/perfis.py
+"""
+Perfil sob demanda de uma requisição, para investigar um relatório lento com os
+dados reais de um cliente.
+
+Um usuário staff pede o perfil com o cabeçalho 'X-Perfil' ou o parâmetro
+'?perfil=' e escolhe o modo:
+- 'cprofile': perfil determinístico, gravado como .prof (pstats). Abre no
+  snakeviz ('snakeviz arquivo.prof').
+- 'amostragem': uma thread lê a pilha da requisição a cada
+  'intervalo_amostragem_ms' e grava um .speedscope.json (flamegraph no
+  speedscope.app). Pesa menos que o cProfile em requisições longas.
+Qualquer outro valor usa o 'modo_padrao'.
+
+O perfil inclui o ORM e o WeasyPrint. Enquanto ele roda, as consultas que os
+relatórios fariam em paralelo rodam na thread da requisição (ver
+core/concorrencia.py), para que o perfil veja todo o trabalho. O conteúdo das
+respostas em streaming é gerado depois do perfil e fica de fora.
+
+Os arquivos ficam em 'diretorio', com um .meta.json ao lado de cada perfil.
+Só os 'maximo_perfis' mais recentes são mantidos. A resposta traz o nome do
+perfil no cabeçalho 'X-Perfil'; a listagem e o download ficam em /api/perfis/.
+"""
+import contextvars
+import cProfile
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+logger = logging.getLogger('core.desempenho')
+
+CONFIGURACAO_PADRAO = {
+    'ativo': True,
+    'diretorio': None,
+    'maximo_perfis': 50,
+    'modo_padrao': 'cprofile',
+    'intervalo_amostragem_ms': 2,
+}
+
+MODOS = {'cprofile': '.prof', 'amostragem': '.speedscope.json'}
+SUFIXO_META = '.meta.json'
+NOME_VALIDO = re.compile(r'^[\w-]+$')
+
+_perfilando = contextvars.ContextVar('perfilando', default=False)
+
+
+def configuracao():
+    config = {**CONFIGURACAO_PADRAO, **getattr(settings, 'PERFIS', {})}
+    config['diretorio'] = Path(config['diretorio'] or settings.BASE_DIR / 'perfis')
+    return config
+
+
+def perfilando():
+    """ Verdadeiro enquanto a requisição atual está sendo perfilada. """
+    return _perfilando.get()
+
+
+def _usuario_staff(request):
+    usuario = getattr(request, 'user', None)
+    if usuario is None or not usuario.is_authenticated:
+        try:
+            autenticado = JWTAuthentication().authenticate(request)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+        usuario = autenticado[0] if autenticado else None
+    return usuario if usuario is not None and usuario.is_active and usuario.is_staff else None
+
+
+class Amostrador:
+    """ Amostra a pilha de uma thread em intervalos fixos, no formato 'sampled' do speedscope. """
+
+    def __init__(self, thread_id, intervalo):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.frames = []
+        self.amostras = []
+        self.pesos = []
+        self._indices = {}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='perfil-amostragem', daemon=True)
+
+    def _indice(self, codigo):
+        indice = self._indices.get(codigo)
+        if indice is None:
+            indice = self._indices[codigo] = len(self.frames)
+            self.frames.append({'name': codigo.co_name, 'file': codigo.co_filename, 'line': codigo.co_firstlineno})
+        return indice
+
+    def _executar(self):
+        anterior = time.perf_counter()
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            agora = time.perf_counter()
+            pilha = []
+            while frame is not None:
+                pilha.append(self._indice(frame.f_code))
+                frame = frame.f_back
+            if pilha:
+                self.amostras.append(pilha[::-1])
+                self.pesos.append(agora - anterior)
+            anterior = agora
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *excecao):
+        self._parar.set()
+        self._thread.join()
+
+    def speedscope(self, nome):
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': nome,
+            'exporter': 'core.perfis',
+            'activeProfileIndex': 0,
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': nome,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(self.pesos),
+                'samples': self.amostras,
+                'weights': self.pesos,
+            }],
+        }
+
+
+def listar_perfis(diretorio):
+    """ Metadados dos perfis gravados, do mais recente para o mais antigo. """
+    perfis = []
+    for arquivo in diretorio.glob(f'*{SUFIXO_META}'):
+        try:
+            perfis.append(json.loads(arquivo.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return sorted(perfis, key=lambda perfil: perfil['nome'], reverse=True)
+
+
+def arquivo_do_perfil(diretorio, nome):
+    """ Caminho do arquivo de um perfil pelo nome (None se não existir ou o nome for inválido). """
+    if not NOME_VALIDO.match(nome):
+        return None
+    for sufixo in MODOS.values():
+        caminho = diretorio / f'{nome}{sufixo}'
+        if caminho.is_file():
+            return caminho
+    return None
+
+
+def _descartar_antigos(diretorio, maximo):
+    for meta in sorted(diretorio.glob(f'*{SUFIXO_META}'), reverse=True)[maximo:]:
+        nome = meta.name[:-len(SUFIXO_META)]
+        for sufixo in (*MODOS.values(), SUFIXO_META):
+            (diretorio / f'{nome}{sufixo}').unlink(missing_ok=True)
+
+
+class PerfilMiddleware:
+    """ Fica no fim da lista de middlewares, perto da view, depois do AuthenticationMiddleware. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pedido = request.headers.get('X-Perfil') or request.GET.get('perfil')
+        config = configuracao()
+        if not pedido or not config['ativo']:
+            return self.get_response(request)
+        usuario = _usuario_staff(request)
+        if usuario is None:
+            return self.get_response(request)
+
+        modo = pedido if pedido in MODOS else config['modo_padrao']
+        agora = timezone.localtime()
+        caminho = re.sub(r'[^\w]+', '_', request.path).strip('_')[:60] or 'raiz'
+        nome = f"{agora:%Y%m%d-%H%M%S-%f}-{request.method.lower()}-{caminho}"
+        diretorio = config['diretorio']
+
+        token = _perfilando.set(True)
+        inicio = time.perf_counter()
+        try:
+            if modo == 'cprofile':
+                perfil = cProfile.Profile()
+                perfil.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    perfil.disable()
+            else:
+                with Amostrador(threading.get_ident(), config['intervalo_amostragem_ms'] / 1000) as amostrador:
+                    response = self.get_response(request)
+        finally:
+            _perfilando.reset(token)
+        duracao = time.perf_counter() - inicio
+
+        try:
+            diretorio.mkdir(parents=True, exist_ok=True)
+            arquivo = diretorio / f'{nome}{MODOS[modo]}'
+            if modo == 'cprofile':
+                perfil.dump_stats(arquivo)
+            else:
+                arquivo.write_text(
+                    json.dumps(amostrador.speedscope(f'{request.method} {request.path}')), encoding='utf-8'
+                )
+            meta = {
+                'nome': nome,
+                'modo': modo,
+                'arquivo': arquivo.name,
+                'metodo': request.method,
+                'caminho': request.get_full_path(),
+                'status': response.status_code,
+                'duracao_ms': round(duracao * 1000, 1),
+                'tamanho_bytes': arquivo.stat().st_size,
+                'usuario': usuario.get_username(),
+                'criado_em': agora.isoformat(),
+            }
+            (diretorio / f'{nome}{SUFIXO_META}').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+            _descartar_antigos(diretorio, config['maximo_perfis'])
+        except OSError:
+            logger.exception("Não foi possível gravar o perfil da requisição %s", request.path)
+            return response
+
+        response['X-Perfil'] = nome
+        logger.info(json.dumps({'perfil': nome, 'modo': modo, 'caminho': request.path}, ensure_ascii=False))
+        return response
@@ -0,0 +1,141 @@
+# core/precificacao.py
+"""
+Motor de precificação de itens (por unidade ou por m²).
+
+É a única implementação do cálculo de subtotal: usado pelos modelos
+(ItemOrcamento/ItemPedido) e pela cotação em lote, que precifica N linhas
+em uma passada a partir de uma tabela de preços carregada em memória.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+TIPO_METRO_QUADRADO = 'M2'
+CENTAVOS = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+PrecoProduto = namedtuple('PrecoProduto', ['id', 'nome', 'tipo_precificacao', 'preco', 'custo'])
+
+
+def arredondar(valor):
+    """ Arredonda valores monetários para centavos (meio para cima). """
+    return Decimal(valor).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def para_decimal(valor):
+    if valor is None or valor == '':
+        return None
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor))
+
+
+def carregar_tabela_precos(ids=None):
+    """ Carrega {id: PrecoProduto} com uma única consulta (opcionalmente só alguns ids). """
+    from .models import Produto
+
+    produtos = Produto.objects.all()
+    if ids is not None:
+        produtos = produtos.filter(id__in=set(ids))
+    return {
+        linha[0]: PrecoProduto(*linha)
+        for linha in produtos.values_list('id', 'nome', 'tipo_precificacao', 'preco', 'custo')
+    }
+
+
+def calcular_subtotal(tipo_precificacao, preco, quantidade, largura=None, altura=None, exigir_medidas=False):
+    """
+    Subtotal de um item: preco × quantidade, ou preco × largura × altura × quantidade para m².
+    Sem medidas, um item por m² vale 0 (ou levanta ValueError com exigir_medidas=True).
+    """
+    preco = para_decimal(preco)
+    if tipo_precificacao == TIPO_METRO_QUADRADO:
+        if not largura or not altura:
+            if exigir_medidas:
+                raise ValueError("Largura e Altura são obrigatórias para produtos por m²")
+            return ZERO
+        return arredondar(preco * para_decimal(largura) * para_decimal(altura) * quantidade)
+    return arredondar(preco * quantidade)
+
+
+def subtotal_item(item, exigir_medidas=False):
+    """ Subtotal de um ItemOrcamento/ItemPedido a partir do seu produto (0 para itens manuais). """
+    from .catalogo import catalogo
+
+    produto = catalogo.obter(item.produto_id)
+    if produto is None:
+        return ZERO
+    return calcular_subtotal(
+        produto.tipo_precificacao, produto.preco, item.quantidade,
+        item.largura, item.altura, exigir_medidas=exigir_medidas
+    )
+
+
+def ordenar_faixas(faixas):
+    """
+    Normaliza faixas de desconto por quantidade ([{'quantidade_minima': 100, 'percentual': 5}, ...])
+    em tuplas (minimo, percentual) da maior para a menor quantidade.
+    """
+    return sorted(
+        ((int(faixa['quantidade_minima']), para_decimal(faixa['percentual'])) for faixa in faixas or []),
+        reverse=True
+    )
+
+
+def percentual_desconto(quantidade, faixas_ordenadas):
+    for minimo, percentual in faixas_ordenadas:
+        if quantidade >= minimo:
+            return percentual
+    return ZERO
+
+
+def precificar_linhas(linhas, tabela, faixas=None):
+    """
+    Precifica uma lista de linhas {'produto', 'quantidade', 'largura', 'altura'}
+    usando a tabela de preços em memória (sem consultas ao banco).
+    Cada resultado traz o subtotal bruto, o desconto por faixa e o subtotal final;
+    linhas com produto desconhecido ou sem medidas obrigatórias trazem 'erro'.
+    """
+    faixas_ordenadas = ordenar_faixas(faixas)
+    resultados = []
+    for linha in linhas:
+        quantidade = int(linha.get('quantidade') or 1)
+        largura = para_decimal(linha.get('largura'))
+        altura = para_decimal(linha.get('altura'))
+        resultado = {
+            'produto': linha.get('produto'),
+            'quantidade': quantidade,
+            'largura': largura,
+            'altura': altura,
+        }
+        preco_produto = tabela.get(linha.get('produto'))
+        if preco_produto is None:
+            resultado['erro'] = "Produto inexistente."
+            resultados.append(resultado)
+            continue
+
+        try:
+            bruto = calcular_subtotal(
+                preco_produto.tipo_precificacao, preco_produto.preco, quantidade,
+                largura, altura, exigir_medidas=True
+            )
+        except ValueError as exc:
+            resultado['erro'] = str(exc)
+            resultados.append(resultado)
+            continue
+
+        percentual = percentual_desconto(quantidade, faixas_ordenadas)
+        desconto = arredondar(bruto * percentual / 100)
+        area = None
+        if preco_produto.tipo_precificacao == TIPO_METRO_QUADRADO:
+            area = arredondar(largura * altura * quantidade)
+
+        resultado.update({
+            'nome': preco_produto.nome,
+            'tipo_precificacao': preco_produto.tipo_precificacao,
+            'preco_unitario': preco_produto.preco,
+            'area_m2': area,
+            'subtotal_bruto': bruto,
+            'desconto_percentual': percentual,
+            'desconto': desconto,
+            'subtotal': bruto - desconto,
+        })
+        resultados.append(resultado)
+    return resultados
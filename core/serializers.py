@@ -1,7 +1,17 @@
+import copy
+
 from rest_framework import serializers
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
 from django.contrib.auth.models import User
-from .models import Cliente, Produto, Orcamento, ItemOrcamento, Pedido, ItemPedido, Pagamento, Despesa, Empresa
+from django.utils import timezone
+from .catalogo import catalogo
+from .models import (
+    Cliente, Produto, Orcamento, ItemOrcamento, Pedido, ItemPedido, Pagamento, Despesa, Empresa,
+    ReajustePreco, EstatisticaCliente, normalizar_cpf_cnpj
+)
+from .vendas_mensais import marcar_para_atualizar
+
+MENSAGEM_CPF_CNPJ_DUPLICADO = "Já existe um cliente cadastrado com este CPF/CNPJ."
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,15 +34,35 @@ class ClienteSerializer(serializers.ModelSerializer):
         read_only_fields = ['data_cadastro']
 
     def validate_cpf_cnpj(self, value):
-        if not value:
+        # Checagem antecipada (usa o índice único) só para devolver uma mensagem amigável;
+        # a garantia real contra duplicidade concorrente é a constraint do banco.
+        normalizado = normalizar_cpf_cnpj(value)
+        if not normalizado:
             return value
-        query = Cliente.objects.filter(cpf_cnpj=value)
+        query = Cliente.objects.filter(cpf_cnpj_normalizado=normalizado)
         if self.instance:
             query = query.exclude(pk=self.instance.pk)
         if query.exists():
-            raise serializers.ValidationError("Já existe um cliente cadastrado com este CPF/CNPJ.")
+            raise serializers.ValidationError(MENSAGEM_CPF_CNPJ_DUPLICADO)
         return value
 
+    def _salvar_protegido(self, salvar, *args):
+        try:
+            with transaction.atomic():
+                return salvar(*args)
+        except IntegrityError as exc:
+            # Só a violação do índice único do documento vira erro de validação; o nome da
+            # coluna aparece na mensagem do SQLite, do MySQL (nome da chave) e do PostgreSQL
+            if 'cpf_cnpj_normalizado' not in str(exc):
+                raise
+            raise serializers.ValidationError({'cpf_cnpj': [MENSAGEM_CPF_CNPJ_DUPLICADO]}) from exc
+
+    def create(self, validated_data):
+        return self._salvar_protegido(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        return self._salvar_protegido(super().update, instance, validated_data)
+
 class ProdutoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Produto
@@ -43,9 +73,91 @@ class ProdutoResumidoSerializer(serializers.ModelSerializer):
         model = Produto
         fields = ['id', 'nome']
 
+
+class ProdutoCatalogoField(serializers.Field):
+    """ Produto (resumido) de um item, lido do catálogo em memória em vez de uma consulta por item. """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'produto_id')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, produto_id):
+        produto = catalogo.obter(produto_id)
+        return ProdutoResumidoSerializer(produto).data if produto else None
+
+
+class ProdutoCatalogoRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Valida o id do produto contra o catálogo em memória. Devolve uma cópia: a instância
+    do catálogo é compartilhada entre requisições e não pode ser alterada por uma delas.
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Produto.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            produto = catalogo.obter(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if produto is None:
+            self.fail('does_not_exist', pk_value=data)
+        return copy.copy(produto)
+
+
+def novos_itens(modelo, itens_data, **pai):
+    """
+    Instâncias (ainda não gravadas) dos itens, com o subtotal já calculado, para
+    gravar todos com um único bulk_create. Retorna (itens, soma dos subtotais).
+    """
+    itens = [modelo(**item, **pai) for item in itens_data]
+    for item in itens:
+        item.preencher_subtotal()
+    return itens, sum((item.subtotal for item in itens), 0)
+
+
+def nome_exibido_item(item):
+    if item.descricao_customizada:
+        return item.descricao_customizada
+    produto = catalogo.obter(item.produto_id)
+    return produto.nome if produto else 'Item'
+
+class ReajustePrecoSerializer(serializers.ModelSerializer):
+    """
+    Entrada do reajuste em massa. Filtra por tipo_precificacao e/ou lista de produtos;
+    sem filtros, reajusta o catálogo inteiro. 'simular' apenas devolve a prévia.
+    """
+    produtos_filtrados = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False
+    )
+    simular = serializers.BooleanField(default=False, write_only=True)
+
+    class Meta:
+        model = ReajustePreco
+        fields = [
+            'id', 'data', 'usuario', 'modo', 'ajuste_preco', 'ajuste_custo', 'tipo_precificacao',
+            'produtos_filtrados', 'produtos_afetados', 'motivo', 'simular'
+        ]
+        read_only_fields = ['id', 'data', 'usuario', 'produtos_afetados']
+
+    def validate(self, attrs):
+        if not attrs.get('ajuste_preco') and not attrs.get('ajuste_custo'):
+            raise serializers.ValidationError("Informe ajuste_preco e/ou ajuste_custo.")
+        if attrs.get('modo', ReajustePreco.Modo.PERCENTUAL) == ReajustePreco.Modo.PERCENTUAL:
+            for campo in ('ajuste_preco', 'ajuste_custo'):
+                if attrs.get(campo) is not None and attrs[campo] <= -100:
+                    raise serializers.ValidationError({campo: ["O percentual deve ser maior que -100."]})
+        return attrs
+
+    def create(self, validated_data):
+        validated_data.pop('simular', None)
+        return super().create(validated_data)
+
 # ---------- ITENS DE ORÇAMENTO ----------
 class ItemOrcamentoSerializer(serializers.ModelSerializer):
-    produto = ProdutoResumidoSerializer(read_only=True)
+    produto = ProdutoCatalogoField()
     nome_exibido = serializers.SerializerMethodField()
 
     class Meta:
@@ -53,7 +165,7 @@ class ItemOrcamentoSerializer(serializers.ModelSerializer):
         fields = ['id', 'produto', 'quantidade', 'largura', 'altura', 'descricao_customizada', 'subtotal', 'nome_exibido']
 
     def get_nome_exibido(self, obj):
-        return obj.descricao_customizada or (obj.produto.nome if obj.produto else 'Item')
+        return nome_exibido_item(obj)
 
 class ItemOrcamentoWriteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -61,11 +173,7 @@ class ItemOrcamentoWriteSerializer(serializers.ModelSerializer):
         fields = ['produto', 'quantidade', 'largura', 'altura', 'descricao_customizada', 'subtotal']
         extra_kwargs = {'subtotal': {'required': False}}
 
-    produto = serializers.PrimaryKeyRelatedField(
-        queryset=Produto.objects.all(),
-        required=False,
-        allow_null=True   
-    )
+    produto = ProdutoCatalogoRelatedField(required=False, allow_null=True)
 
 # ---------- ORÇAMENTO ----------
 class ClienteResumidoSerializer(serializers.ModelSerializer):
@@ -85,31 +193,38 @@ class OrcamentoSerializer(serializers.ModelSerializer):
         fields = ['id', 'cliente', 'data_criacao', 'valor_total', 'status', 'itens', 'cliente_id', 'itens_write']
         read_only_fields = ['valor_total', 'data_criacao']
 
+    # Gravação numa transação só: o recálculo do total agendado pela exclusão dos itens antigos
+    # (on_commit, ver core/signals.py) tem que rodar depois do bulk_create dos novos, não entre os dois.
+    # Sem savepoint: uma falha no meio desfaz a requisição inteira
+    @transaction.atomic(savepoint=False)
     def create(self, validated_data):
         itens_data = validated_data.pop('itens', [])
-        orcamento = Orcamento.objects.create(**validated_data)
-        for item in itens_data:
-            ItemOrcamento.objects.create(orcamento=orcamento, **item)
-        orcamento.recalcular_total()
+        orcamento = Orcamento(**validated_data)
+        itens, orcamento.valor_total = novos_itens(ItemOrcamento, itens_data, orcamento=orcamento)
+        orcamento.save()
+        ItemOrcamento.objects.bulk_create(itens)
         return orcamento
 
+    @transaction.atomic(savepoint=False)
     def update(self, instance, validated_data):
         itens_data = validated_data.pop('itens', None)
         # campos simples
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        if itens_data is None:
+            instance.save()
+            instance.recalcular_total()
+            return instance
+        # substitui itens; o total é a soma dos novos itens
+        itens, instance.valor_total = novos_itens(ItemOrcamento, itens_data, orcamento=instance)
         instance.save()
-        # substitui itens
-        if itens_data is not None:
-            instance.itens.all().delete()
-            for item in itens_data:
-                ItemOrcamento.objects.create(orcamento=instance, **item)
-        instance.recalcular_total()
+        instance.itens.all().delete()
+        ItemOrcamento.objects.bulk_create(itens)
         return instance
 
 # ---------- ITENS DE PEDIDO ----------
 class ItemPedidoSerializer(serializers.ModelSerializer):
-    produto = ProdutoResumidoSerializer(read_only=True)
+    produto = ProdutoCatalogoField()
     nome_exibido = serializers.SerializerMethodField()
 
     class Meta:
@@ -117,7 +232,7 @@ class ItemPedidoSerializer(serializers.ModelSerializer):
         fields = ['id', 'produto', 'quantidade', 'largura', 'altura', 'descricao_customizada', 'subtotal', 'nome_exibido']
 
     def get_nome_exibido(self, obj):
-        return obj.descricao_customizada or (obj.produto.nome if obj.produto else 'Item')
+        return nome_exibido_item(obj)
 
 class ItemPedidoWriteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -125,6 +240,8 @@ class ItemPedidoWriteSerializer(serializers.ModelSerializer):
         fields = ['produto', 'quantidade', 'largura', 'altura', 'descricao_customizada', 'subtotal']
         extra_kwargs = {'subtotal': {'required': False}}
 
+    produto = ProdutoCatalogoRelatedField(required=False, allow_null=True)
+
 # ---------- PAGAMENTO ----------
 class PagamentoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -153,37 +270,137 @@ class PedidoSerializer(serializers.ModelSerializer):
         read_only_fields = ['valor_total', 'data_criacao', 'orcamento_origem']
 
     def get_valor_pago(self, obj):
-        total_pago = obj.pagamentos.aggregate(total=Sum('valor'))['total']
-        return total_pago or 0
+        # Soma em memória: com prefetch_related('pagamentos') não há consulta por pedido
+        return sum((pagamento.valor for pagamento in obj.pagamentos.all()), 0)
 
     def get_valor_a_receber(self, obj):
         valor_pago = self.get_valor_pago(obj)
         return (obj.valor_total or 0) - (valor_pago or 0)
 
+    def _gravar_itens(self, pedido, itens):
+        # bulk_create não dispara post_save: marca as vendas mensais dos produtos aqui
+        ItemPedido.objects.bulk_create(itens)
+        for produto_id in {item.produto_id for item in itens if item.produto_id}:
+            marcar_para_atualizar(produto_id, pedido.data_criacao)
+
+    # Como no orçamento: itens, total e sinais numa transação só
+    @transaction.atomic(savepoint=False)
     def create(self, validated_data):
         itens_data = validated_data.pop('itens', [])
-        pedido = Pedido.objects.create(**validated_data)
-        for item in itens_data:
-            ItemPedido.objects.create(pedido=pedido, **item)
-        pedido.recalcular_total()
+        pedido = Pedido(**validated_data)
+        itens, pedido.valor_total = novos_itens(ItemPedido, itens_data, pedido=pedido)
+        pedido.save()
+        self._gravar_itens(pedido, itens)
         return pedido
 
+    @transaction.atomic(savepoint=False)
     def update(self, instance, validated_data):
         itens_data = validated_data.pop('itens', None)
         # atualiza campos simples
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        if itens_data is None:
+            instance.save()
+            instance.recalcular_total()
+            return instance
+
+        # substitui itens (mantendo a descricao_customizada de cada um); o total é a soma dos novos itens
+        itens, instance.valor_total = novos_itens(ItemPedido, itens_data, pedido=instance)
         instance.save()
+        instance.itens.all().delete()
+        self._gravar_itens(instance, itens)
+        return instance
 
-        # substitui itens se enviados
-        if itens_data is not None:
-            instance.itens.all().delete()
-            for item in itens_data:
-                # >>> AQUI GARANTIMOS QUE A DESCRIÇÃO CUSTOMIZADA DO ORÇAMENTO É MANTIDA
-                ItemPedido.objects.create(pedido=instance, **item)
 
-        instance.recalcular_total()
-        return instance
+# ---------- CONVERSÃO EM LOTE ----------
+class ConversaoLoteSerializer(serializers.Serializer):
+    orcamentos = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+
+
+# ---------- QUADRO DE PRODUÇÃO ----------
+class CartaoProducaoSerializer(serializers.ModelSerializer):
+    """ Cartão compacto do quadro de produção (sem itens nem pagamentos). """
+    cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
+
+    class Meta:
+        model = Pedido
+        fields = [
+            'id', 'cliente_id', 'cliente_nome', 'data_criacao', 'previsto_entrega', 'valor_total',
+            'status_producao', 'status_pagamento', 'data_producao', 'forma_envio'
+        ]
+
+
+class TransicaoProducaoSerializer(serializers.Serializer):
+    pedidos = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+    status_producao = serializers.ChoiceField(choices=Pedido.STATUS_PRODUCAO)
+
+
+# ---------- COTAÇÃO EM LOTE (SIMULAÇÃO) ----------
+class CotacaoLinhaSerializer(serializers.Serializer):
+    produto = serializers.IntegerField(min_value=1)
+    quantidade = serializers.IntegerField(min_value=1, default=1)
+    largura = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    altura = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+
+
+class FaixaDescontoSerializer(serializers.Serializer):
+    quantidade_minima = serializers.IntegerField(min_value=1)
+    percentual = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+
+
+class CotacaoSerializer(serializers.Serializer):
+    """ Entrada da cotação em lote. Sem 'faixas', usa FAIXAS_DESCONTO_QUANTIDADE das settings. """
+    linhas = CotacaoLinhaSerializer(many=True, allow_empty=False, max_length=500)
+    aplicar_descontos = serializers.BooleanField(default=True)
+    faixas = FaixaDescontoSerializer(many=True, required=False)
+
+
+# ---------- SIMULAÇÃO DE CENÁRIOS ----------
+class CenarioSimulacaoSerializer(serializers.Serializer):
+    """ Percentuais de ajuste de um cenário (ex: 8 = +8%, -5 = -5%). """
+    nome = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    ajuste_preco_m2 = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=-99, default=0)
+    ajuste_preco_unidade = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=-99, default=0)
+    ajuste_custo = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=-99, default=0)
+    elasticidade = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=10, default=0)
+    # Alvo opcional: os ajustes só valem para estes produtos, e só o período informado é avaliado
+    produtos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=1000
+    )
+    data_inicio = serializers.DateField(required=False)
+    data_fim = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('data_inicio') and attrs.get('data_fim') and attrs['data_inicio'] > attrs['data_fim']:
+            raise serializers.ValidationError({'data_fim': ['Deve ser igual ou posterior a data_inicio.']})
+        return attrs
+
+
+class SimulacaoSerializer(serializers.Serializer):
+    cenarios = CenarioSimulacaoSerializer(many=True, allow_empty=False, max_length=200)
+
+
+# ---------- IMPORTAÇÃO EM MASSA ----------
+class ClienteImportacaoSerializer(serializers.ModelSerializer):
+    """
+    Validação de uma linha do CSV de clientes. Não consulta o banco:
+    a duplicidade de CPF/CNPJ é resolvida por lote em core.importacao.
+    """
+    class Meta:
+        model = Cliente
+        fields = [
+            'nome', 'email', 'telefone', 'cpf_cnpj',
+            'observacao', 'cep', 'endereco', 'numero', 'bairro', 'cidade', 'estado'
+        ]
+
+
+class ProdutoImportacaoSerializer(serializers.ModelSerializer):
+    """ Validação de uma linha do CSV de produtos. 'id' opcional atualiza o produto existente. """
+    id = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+
+    class Meta:
+        model = Produto
+        fields = ['id', 'nome', 'tipo_precificacao', 'preco', 'custo', 'estoque_atual', 'estoque_minimo']
 
 
 # ---------- DESPESAS ----------
@@ -225,12 +442,41 @@ class RelatorioClienteSerializer(serializers.ModelSerializer):
         model = Cliente
         fields = ['id', 'nome', 'telefone', 'cpf_cnpj', 'total_gasto', 'ultimo_pedido', 'dias_inativo']
     
-    # Adicionamos o método getter para extrair os dias
+    # Dias desde o último pedido (calculado aqui para não depender de aritmética de datas no banco)
     def get_dias_inativo(self, obj):
-        if hasattr(obj, 'dias_inativo') and obj.dias_inativo:
-            return obj.dias_inativo.days
+        ultimo_pedido = getattr(obj, 'ultimo_pedido', None)
+        if ultimo_pedido:
+            return (timezone.localdate() - ultimo_pedido).days
         return None
 
+
+class MovimentoExtratoSerializer(serializers.Serializer):
+    """ Linha do extrato do cliente (pedido = débito, pagamento = crédito). """
+    tipo = serializers.CharField()
+    id = serializers.IntegerField()
+    pedido_id = serializers.IntegerField()
+    data = serializers.DateTimeField()
+    descricao = serializers.CharField()
+    forma_pagamento = serializers.CharField(allow_null=True)
+    debito = serializers.DecimalField(max_digits=12, decimal_places=2)
+    credito = serializers.DecimalField(max_digits=12, decimal_places=2)
+    saldo = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class EstatisticaClienteSerializer(serializers.ModelSerializer):
+    """ Linha da segmentação RFM de clientes. """
+    cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
+    telefone = serializers.CharField(source='cliente.telefone', read_only=True)
+    segmento_display = serializers.CharField(source='get_segmento_display', read_only=True)
+
+    class Meta:
+        model = EstatisticaCliente
+        fields = [
+            'cliente', 'cliente_nome', 'telefone', 'primeiro_pedido', 'ultimo_pedido', 'total_pedidos',
+            'total_gasto', 'ticket_medio', 'score_recencia', 'score_frequencia', 'score_monetario',
+            'segmento', 'segmento_display'
+        ]
+
 class RelatorioPedidosAtrasadosSerializer(serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome')
     
@@ -273,10 +519,10 @@ class RelatorioOrcamentoRecenteSerializer(serializers.ModelSerializer):
         fields = ['id', 'cliente_nome', 'produto_principal', 'valor_total', 'data_criacao', 'status']
 
     def get_produto_principal(self, obj):
-        # Pega o nome do primeiro item do orçamento
-        primeiro_item = obj.itens.first()
+        # Pega o nome do primeiro item do orçamento (dos itens pré-carregados, sem consulta extra)
+        primeiro_item = min(obj.itens.all(), key=lambda item: item.pk, default=None)
         if primeiro_item:
-            return primeiro_item.nome_exibido
+            return nome_exibido_item(primeiro_item)
         return "N/A"
     
 
@@ -300,11 +546,16 @@ class RelatorioProdutoLucrativoSerializer(serializers.Serializer):
 class RelatorioProdutoBaixaDemandaSerializer(serializers.ModelSerializer):
     """
     Serializer para a tabela "Produtos em Baixa Demanda".
-    Espera uma instância de Produto anotada com 'ultima_venda' e 'dias_sem_venda'.
+    Espera uma instância de Produto anotada com 'ultima_venda'.
     """
     ultima_venda = serializers.DateField(read_only=True)
-    dias_sem_venda = serializers.IntegerField(read_only=True)
+    dias_sem_venda = serializers.SerializerMethodField()
     
     class Meta:
         model = Produto
-        fields = ['id', 'nome', 'preco', 'ultima_venda', 'dias_sem_venda']
\ No newline at end of file
+        fields = ['id', 'nome', 'preco', 'ultima_venda', 'dias_sem_venda']
+
+    def get_dias_sem_venda(self, obj):
+        if getattr(obj, 'ultima_venda', None):
+            return (timezone.localdate() - obj.ultima_venda).days
+        return None
\ No newline at end of file
@@ -1,8 +1,35 @@
 # core/signals.py
 
+import threading
+
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import ItemOrcamento
+from django.utils import timezone
+from .catalogo import catalogo
+from .estatisticas import atualizar_estatistica_cliente
+from .eventos import PAGAMENTO_RECEBIDO, PEDIDO_CRIADO, PEDIDO_EXCLUIDO, PEDIDO_STATUS, publicar
+from .models import Cliente, ItemOrcamento, ItemPedido, Orcamento, Pagamento, Pedido, Produto
+from .sincronizacao import registrar_exclusao
+from .vendas_mensais import marcar_para_atualizar
+
+_orcamentos_pendentes = threading.local()
+_pedidos_pendentes = threading.local()
+
+
+def _recalcular_orcamentos_pendentes():
+    ids = getattr(_orcamentos_pendentes, 'ids', set())
+    _orcamentos_pendentes.ids = set()
+    if ids:
+        Orcamento.recalcular_totais(ids)
+
+
+def _tocar_pedidos_pendentes():
+    ids = getattr(_pedidos_pendentes, 'ids', set())
+    _pedidos_pendentes.ids = set()
+    if ids:
+        Pedido.objects.filter(id__in=ids).update(atualizado_em=timezone.now())
+
 
 # O decorator @receiver conecta nossa função aos sinais do Django.
 # Esta função será chamada sempre que um ItemOrcamento for salvo ou deletado.
@@ -10,8 +37,146 @@ from .models import ItemOrcamento
 def atualizar_total_orcamento(sender, instance, **kwargs):
     """
     Gatilho para recalcular o valor total de um orçamento sempre que
-    um de seus itens for salvo ou deletado.
+    um de seus itens for salvo ou deletado. O recálculo acontece ao final da
+    transação, uma única vez por orçamento (ex: itens excluídos em lote).
     """
-    # 'instance' é o objeto ItemOrcamento que disparou o sinal.
-    # A partir dele, acessamos o orçamento pai e chamamos o método de recálculo.
-    instance.orcamento.recalcular_total()
\ No newline at end of file
+    if isinstance(kwargs.get('origin'), Orcamento):
+        return  # Exclusão em cascata: o próprio orçamento está sendo excluído
+    if not hasattr(_orcamentos_pendentes, 'ids'):
+        _orcamentos_pendentes.ids = set()
+    _orcamentos_pendentes.ids.add(instance.orcamento_id)
+    transaction.on_commit(_recalcular_orcamentos_pendentes)
+
+
+@receiver([post_save, post_delete], sender=ItemPedido)
+@receiver([post_save, post_delete], sender=Pagamento)
+def tocar_pedido(sender, instance, **kwargs):
+    """
+    Itens e pagamentos fazem parte da resposta do pedido: gravá-los muda o
+    'atualizado_em' do pedido (validador do GET condicional), uma vez por pedido
+    ao final da transação.
+    """
+    if isinstance(kwargs.get('origin'), Pedido):
+        return  # Exclusão em cascata: o próprio pedido está sendo excluído
+    if not hasattr(_pedidos_pendentes, 'ids'):
+        _pedidos_pendentes.ids = set()
+    _pedidos_pendentes.ids.add(instance.pedido_id)
+    transaction.on_commit(_tocar_pedidos_pendentes)
+
+
+@receiver([post_save, post_delete], sender=Produto)
+def invalidar_catalogo_produtos(sender, instance, **kwargs):
+    """
+    Invalida o cache do catálogo de produtos. A versão é trocada de novo após o
+    commit, para que outro processo não recarregue o catálogo antes da gravação valer.
+    """
+    catalogo.invalidar()
+    transaction.on_commit(catalogo.invalidar)
+
+
+@receiver([post_save, post_delete], sender=Pedido)
+def atualizar_estatistica_do_cliente(sender, instance, **kwargs):
+    """
+    Mantém a tabela EstatisticaCliente em dia: recalcula só o cliente do pedido
+    (e o cliente anterior, se o pedido trocou de cliente).
+    """
+    atualizar_estatistica_cliente(instance.cliente_id)
+    cliente_anterior = getattr(instance, '_cliente_id_original', None)
+    if cliente_anterior and cliente_anterior != instance.cliente_id:
+        atualizar_estatistica_cliente(cliente_anterior)
+    instance._cliente_id_original = instance.cliente_id
+
+
+@receiver([post_save, post_delete], sender=ItemPedido)
+def atualizar_venda_mensal_do_item(sender, instance, **kwargs):
+    """
+    Marca a célula (produto, mês do pedido) da tabela VendaProdutoMensal para recálculo
+    e, se o item mudou de pedido ou de produto, também a célula de onde ele saiu.
+    """
+    pedido_anterior = getattr(instance, '_pedido_id_original', None)
+    produto_anterior = getattr(instance, '_produto_id_original', None)
+    if produto_anterior and (pedido_anterior, produto_anterior) != (instance.pedido_id, instance.produto_id):
+        data_anterior = Pedido.objects.filter(pk=pedido_anterior).values_list('data_criacao', flat=True).first()
+        if data_anterior is not None:
+            marcar_para_atualizar(produto_anterior, data_anterior)
+    instance._pedido_id_original = instance.pedido_id
+    instance._produto_id_original = instance.produto_id
+    if instance.produto_id is None:
+        return
+    origem = kwargs.get('origin')
+    if isinstance(origem, Pedido) and origem.pk == instance.pedido_id:
+        # Exclusão em cascata: o pedido já está em memória, sem uma consulta por item
+        data_pedido = origem.data_criacao
+    else:
+        try:
+            data_pedido = instance.pedido.data_criacao
+        except Pedido.DoesNotExist:
+            return
+    marcar_para_atualizar(instance.produto_id, data_pedido)
+
+
+@receiver(post_save, sender=Pedido)
+def atualizar_vendas_mensais_do_pedido(sender, instance, created, **kwargs):
+    """ Se a data do pedido mudou, os itens mudam de mês: recalcula os dois meses. """
+    data_original = getattr(instance, '_data_criacao_original', None)
+    if created or data_original is None or data_original == instance.data_criacao:
+        return
+    for produto_id in instance.itens.exclude(produto__isnull=True).values_list('produto_id', flat=True).distinct():
+        marcar_para_atualizar(produto_id, data_original)
+        marcar_para_atualizar(produto_id, instance.data_criacao)
+    instance._data_criacao_original = instance.data_criacao
+
+
+@receiver(post_save, sender=Pedido)
+def publicar_evento_pedido(sender, instance, created, **kwargs):
+    """ Avisa as telas abertas (SSE) de pedido novo ou de mudança de status. """
+    resumo = {
+        'pedido_id': instance.id,
+        'cliente_id': instance.cliente_id,
+        'status_producao': instance.status_producao,
+        'status_pagamento': instance.status_pagamento,
+    }
+    if created:
+        publicar(PEDIDO_CRIADO, **resumo)
+    else:
+        producao_anterior = getattr(instance, '_status_producao_original', instance.status_producao)
+        pagamento_anterior = getattr(instance, '_status_pagamento_original', instance.status_pagamento)
+        if (producao_anterior, pagamento_anterior) != (instance.status_producao, instance.status_pagamento):
+            atualizar = ['pedidos', 'producao']
+            if pagamento_anterior != instance.status_pagamento:
+                atualizar += ['dashboard', 'contas_a_receber']
+            publicar(
+                PEDIDO_STATUS, atualizar=atualizar,
+                status_producao_anterior=producao_anterior,
+                status_pagamento_anterior=pagamento_anterior,
+                **resumo
+            )
+    instance._status_producao_original = instance.status_producao
+    instance._status_pagamento_original = instance.status_pagamento
+
+
+@receiver(post_delete, sender=Pedido)
+def publicar_evento_pedido_excluido(sender, instance, **kwargs):
+    publicar(PEDIDO_EXCLUIDO, pedido_id=instance.id, cliente_id=instance.cliente_id)
+
+
+@receiver(post_save, sender=Pagamento)
+def publicar_evento_pagamento(sender, instance, created, **kwargs):
+    if created:
+        publicar(
+            PAGAMENTO_RECEBIDO,
+            pagamento_id=instance.id,
+            pedido_id=instance.pedido_id,
+            valor=str(instance.valor),
+            forma_pagamento=instance.forma_pagamento,
+        )
+
+
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Produto)
+@receiver(post_delete, sender=Orcamento)
+@receiver(post_delete, sender=Pedido)
+@receiver(post_delete, sender=Pagamento)
+def marcar_exclusao_sincronizada(sender, instance, **kwargs):
+    """ Deixa a marca da exclusão para a sincronização incremental (inclusive nas exclusões em cascata). """
+    registrar_exclusao(instance)
@@ -0,0 +1,225 @@
+# core/simulacao.py
+"""
+Simulação de cenários de preço e custo ("e se os produtos por m² subirem 8%
+e o custo de produção subir 5%?") sobre os itens vendidos nos últimos 12 meses.
+
+Os itens são carregados uma vez em colunas NumPy, uma posição por ItemPedido e
+ordenadas pela data do pedido: produto, tipo (M2 ou não), dia, subtotal e custo.
+Os valores ficam em centavos inteiros, então os totais do período são exatos e
+não acumulam erro de ponto flutuante. Um cenário pode se restringir a alguns
+produtos e a um período: o período vira uma fatia das colunas (busca binária na
+data) e, sem filtro de produto, as somas saem de somas acumuladas em O(1); com
+filtro, de uma máscara sobre a fatia. Sem consultas ao banco por cenário.
+
+O snapshot é recarregado quando a versão no cache compartilhado muda (comando
+atualizar_snapshot_simulacao, rodado pelo cron ou após importações) ou quando
+fica mais velho que IDADE_MAXIMA_SEGUNDOS.
+
+O custo de cada item usa o custo atual do produto (por unidade, ou por m²).
+"""
+import datetime
+import threading
+import time
+import uuid
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from django.core.cache import caches
+from django.utils import timezone
+
+from .metricas import registrar_cache
+from .precificacao import TIPO_METRO_QUADRADO
+
+ALIAS_CACHE = 'compartilhado'
+CHAVE_VERSAO = 'simulacao_snapshot:versao'
+MESES_HISTORICO = 12
+IDADE_MAXIMA_SEGUNDOS = 60 * 60
+
+CENTAVO = Decimal('0.01')
+# Linhas das somas: subtotal e custo, cada um separado em M2 e por unidade
+SUBTOTAL_M2, SUBTOTAL_UNIDADE, CUSTO_M2, CUSTO_UNIDADE = range(4)
+
+
+def _centavos(valor):
+    return int(Decimal(valor or 0).quantize(CENTAVO, rounding=ROUND_HALF_UP) * 100)
+
+
+def _reais(centavos):
+    return Decimal(int(centavos)).scaleb(-2)
+
+
+class SnapshotItens:
+    """ Colunas dos itens vendidos no período, ordenadas pelo dia do pedido. """
+
+    def __init__(self, linhas, desde, versao):
+        self.desde = desde
+        self.versao = versao
+        self.carregado_em = time.monotonic()
+        self.gerado_em = timezone.now()
+
+        produto, m2, dia, subtotal, custo = [], [], [], [], []
+        for produto_id, tipo, quantidade, largura, altura, valor, custo_unitario, data_criacao in linhas:
+            produto.append(produto_id)
+            m2.append(tipo == TIPO_METRO_QUADRADO)
+            dia.append(timezone.localtime(data_criacao).date())
+            subtotal.append(_centavos(valor))
+            # Custo de produção do item: por m² para produtos M2, senão por unidade
+            base = (custo_unitario or 0) * quantidade
+            if tipo == TIPO_METRO_QUADRADO:
+                base *= (largura or 0) * (altura or 0)
+            custo.append(_centavos(base))
+
+        self.dia = np.array(dia, dtype='datetime64[D]')
+        ordem = np.argsort(self.dia, kind='stable')
+        self.dia = self.dia[ordem]
+        self.produto = np.array(produto, dtype=np.int64)[ordem]
+        self.m2 = np.array(m2, dtype=bool)[ordem]
+        self.subtotal = np.array(subtotal, dtype=np.int64)[ordem]
+        self.custo = np.array(custo, dtype=np.int64)[ordem]
+
+        # Somas acumuladas por linha de soma: a fatia [i, j) custa duas leituras
+        colunas = np.stack([
+            np.where(self.m2, self.subtotal, 0), np.where(self.m2, 0, self.subtotal),
+            np.where(self.m2, self.custo, 0), np.where(self.m2, 0, self.custo),
+        ]) if len(ordem) else np.zeros((4, 0), dtype=np.int64)
+        self._acumulado = np.concatenate([np.zeros((4, 1), dtype=np.int64), colunas.cumsum(axis=1)], axis=1)
+
+    def __len__(self):
+        return len(self.dia)
+
+    def _fatia(self, inicio, fim):
+        i = 0 if inicio is None else int(np.searchsorted(self.dia, np.datetime64(inicio, 'D'), 'left'))
+        j = len(self) if fim is None else int(np.searchsorted(self.dia, np.datetime64(fim, 'D'), 'right'))
+        return i, max(i, j)
+
+    def somas(self, inicio=None, fim=None, produtos=None):
+        """
+        Subtotal e custo em centavos dos itens do período (dias inclusivos), opcionalmente
+        só dos produtos informados: vetor indexado por SUBTOTAL_M2 ... CUSTO_UNIDADE.
+        """
+        i, j = self._fatia(inicio, fim)
+        if produtos is None:
+            return self._acumulado[:, j] - self._acumulado[:, i]
+        mascara = np.isin(self.produto[i:j], np.fromiter(produtos, dtype=np.int64))
+        m2 = self.m2[i:j][mascara]
+        subtotal = self.subtotal[i:j][mascara]
+        custo = self.custo[i:j][mascara]
+        return np.array([subtotal[m2].sum(), subtotal[~m2].sum(), custo[m2].sum(), custo[~m2].sum()], dtype=np.int64)
+
+
+def _carregar_snapshot(versao):
+    from .models import ItemPedido
+
+    hoje = timezone.localdate()
+    desde = (hoje.replace(day=1) - datetime.timedelta(days=31 * (MESES_HISTORICO - 1))).replace(day=1)
+    inicio = timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min))
+    linhas = (
+        ItemPedido.objects.filter(produto__isnull=False, pedido__data_criacao__gte=inicio)
+        .values_list(
+            'produto_id', 'produto__tipo_precificacao', 'quantidade', 'largura', 'altura', 'subtotal',
+            'produto__custo', 'pedido__data_criacao'
+        )
+        .iterator(chunk_size=5000)
+    )
+    return SnapshotItens(linhas, desde, versao)
+
+
+class GerenciadorSnapshot:
+    """ Mantém um snapshot por processo, recarregado por troca de versão ou idade. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _versao_compartilhada(self):
+        cache = caches[ALIAS_CACHE]
+        versao = cache.get(CHAVE_VERSAO)
+        if versao is None:
+            cache.add(CHAVE_VERSAO, uuid.uuid4().hex, None)
+            versao = cache.get(CHAVE_VERSAO)
+        return versao
+
+    def _desatualizado(self, versao):
+        snapshot = self._snapshot
+        return (
+            snapshot is None or snapshot.versao != versao
+            or time.monotonic() - snapshot.carregado_em > IDADE_MAXIMA_SEGUNDOS
+        )
+
+    def obter(self):
+        versao = self._versao_compartilhada()
+        desatualizado = self._desatualizado(versao)
+        registrar_cache('simulacao_snapshot', not desatualizado)
+        if desatualizado:
+            with self._lock:
+                if self._desatualizado(versao):
+                    self._snapshot = _carregar_snapshot(versao)
+        return self._snapshot
+
+    def invalidar(self):
+        """ Troca a versão: todos os processos recarregam o snapshot no próximo uso. """
+        with self._lock:
+            self._snapshot = None
+        caches[ALIAS_CACHE].set(CHAVE_VERSAO, uuid.uuid4().hex, None)
+
+
+snapshot_itens = GerenciadorSnapshot()
+
+
+def simular_cenarios(snapshot, cenarios):
+    """
+    Avalia cada cenário sobre o snapshot. Um cenário traz percentuais ajuste_preco_m2,
+    ajuste_preco_unidade e ajuste_custo, uma elasticidade opcional (a quantidade vendida
+    varia -elasticidade × variação do preço) e, opcionalmente, 'produtos' (os ajustes só
+    valem para esses produtos) e 'data_inicio'/'data_fim' (o período avaliado). Retorna
+    um resultado por cenário, comparado com o realizado no mesmo período.
+    """
+    resultados = []
+    for indice, cenario in enumerate(cenarios):
+        inicio, fim = cenario.get('data_inicio'), cenario.get('data_fim')
+        periodo = snapshot.somas(inicio, fim)
+        produtos = cenario.get('produtos')
+        alvo = periodo if not produtos else snapshot.somas(inicio, fim, produtos)
+
+        preco = 1 + np.array(
+            [float(cenario.get('ajuste_preco_m2') or 0), float(cenario.get('ajuste_preco_unidade') or 0)]
+        ) / 100
+        fator_custo = 1 + float(cenario.get('ajuste_custo') or 0) / 100
+        volume = np.clip(1 - float(cenario.get('elasticidade') or 0) * (preco - 1), 0, None)
+
+        # Só a parte alvo do cenário muda; o resto do período entra como foi realizado
+        receita = np.rint(periodo[:2] + alvo[:2] * (preco * volume - 1)).astype(np.int64)
+        custo = np.rint(periodo[2:] + alvo[2:] * (fator_custo * volume - 1)).astype(np.int64)
+
+        receita_total, custo_total = int(receita.sum()), int(custo.sum())
+        lucro = receita_total - custo_total
+        receita_base = int(periodo[SUBTOTAL_M2] + periodo[SUBTOTAL_UNIDADE])
+        lucro_base = receita_base - int(periodo[CUSTO_M2] + periodo[CUSTO_UNIDADE])
+        resultados.append({
+            'nome': cenario.get('nome') or f'Cenário {indice + 1}',
+            'receita': _reais(receita_total),
+            'custo': _reais(custo_total),
+            'lucro': _reais(lucro),
+            'margem_percentual': round(lucro / receita_total * 100, 2) if receita_total else 0,
+            'variacao_receita': _reais(receita_total - receita_base),
+            'variacao_lucro': _reais(lucro - lucro_base),
+            'por_tipo': {
+                'M2': {'receita': _reais(receita[0]), 'custo': _reais(custo[0])},
+                'UNIDADE': {'receita': _reais(receita[1]), 'custo': _reais(custo[1])},
+            },
+        })
+    return resultados
+
+
+def resumo_base(snapshot):
+    somas = snapshot.somas()
+    receita = int(somas[SUBTOTAL_M2] + somas[SUBTOTAL_UNIDADE])
+    custo = int(somas[CUSTO_M2] + somas[CUSTO_UNIDADE])
+    return {
+        'itens': len(snapshot),
+        'desde': snapshot.desde,
+        'gerado_em': snapshot.gerado_em,
+        'receita': _reais(receita),
+        'custo': _reais(custo),
+        'lucro': _reais(receita - custo),
+    }
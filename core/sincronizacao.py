@@ -0,0 +1,183 @@
+# core/sincronizacao.py
+"""
+Sincronização incremental para as telas que trabalham offline (tablets do balcão).
+
+GET /api/sincronizacao/?cursor=... devolve só o que foi criado, alterado ou
+excluído desde o cursor, em clientes, produtos, orçamentos, pedidos e pagamentos.
+Sem cursor, devolve tudo (carga inicial). O cliente aplica 'alterados' como
+upsert pelo id e remove os ids de 'excluidos'; com 'mais' verdadeiro, chama de
+novo com o cursor recebido até 'mais' voltar falso.
+
+Cada conjunto é lido por keyset sobre (atualizado_em, id), pelo índice de
+'atualizado_em'; as exclusões vêm da tabela ExclusaoRegistro, pelo índice
+(excluido_em, id). Sem mudanças, cada conjunto é uma busca vazia no índice.
+
+O cursor não avança além de agora - 'margem_segundos': uma transação que gravou
+'atualizado_em' antes e fez commit depois da leitura ainda é vista na próxima
+chamada. As linhas dessa margem podem vir de novo (o upsert é idempotente).
+
+O cliente e os produtos aninhados em pedidos e orçamentos são os do momento da
+gravação do pedido/orçamento; o valor atual vem nos conjuntos 'clientes' e 'produtos'.
+
+Cursores com exclusões mais antigas que 'retencao_exclusoes_dias' são recusados
+(CursorExpirado): as marcas já podem ter sido apagadas e o cliente recomeça do zero.
+"""
+import base64
+import datetime
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Cliente, ExclusaoRegistro, Orcamento, Pagamento, Pedido, Produto
+from .serializers import (
+    ClienteSerializer, OrcamentoSerializer, PagamentoSerializer, PedidoSerializer, ProdutoSerializer
+)
+
+CONFIGURACAO_PADRAO = {
+    'limite_padrao': 500,
+    'limite_maximo': 2000,
+    'margem_segundos': 10,
+    'retencao_exclusoes_dias': 90,
+}
+
+# Conjunto -> (model, queryset com os relacionamentos que o serializer usa, serializer)
+CONJUNTOS = {
+    'clientes': (Cliente, lambda: Cliente.objects.all(), ClienteSerializer),
+    'produtos': (Produto, lambda: Produto.objects.all(), ProdutoSerializer),
+    'orcamentos': (
+        Orcamento, lambda: Orcamento.objects.select_related('cliente').prefetch_related('itens'), OrcamentoSerializer
+    ),
+    'pedidos': (
+        Pedido,
+        lambda: Pedido.objects.select_related('cliente').prefetch_related('itens', 'pagamentos'),
+        PedidoSerializer,
+    ),
+    'pagamentos': (Pagamento, lambda: Pagamento.objects.all(), PagamentoSerializer),
+}
+NOME_DO_MODELO = {model: nome for nome, (model, _, _) in CONJUNTOS.items()}
+EXCLUSOES = 'exclusoes'
+
+_pendentes = threading.local()
+
+
+class CursorExpirado(Exception):
+    pass
+
+
+def configuracao():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SINCRONIZACAO', {})}
+
+
+# ---------- Marcas de exclusão ----------
+def _gravar_exclusoes():
+    exclusoes = getattr(_pendentes, 'exclusoes', [])
+    _pendentes.exclusoes = []
+    if exclusoes:
+        # A data é a do commit: a exclusão só é visível (e sincronizável) a partir dele
+        agora = timezone.now()
+        ExclusaoRegistro.objects.bulk_create([
+            ExclusaoRegistro(modelo=modelo, objeto_id=objeto_id, excluido_em=agora) for modelo, objeto_id in exclusoes
+        ])
+
+
+def registrar_exclusao(instance):
+    """ Agenda a marca de exclusão do registro para o final da transação atual. """
+    if not hasattr(_pendentes, 'exclusoes'):
+        _pendentes.exclusoes = []
+    _pendentes.exclusoes.append((NOME_DO_MODELO[type(instance)], instance.pk))
+    transaction.on_commit(_gravar_exclusoes)
+
+
+def limpar_exclusoes(agora=None):
+    """ Apaga as marcas mais antigas que a retenção. Retorna quantas foram apagadas. """
+    limite = (agora or timezone.now()) - datetime.timedelta(days=configuracao()['retencao_exclusoes_dias'])
+    apagadas, _ = ExclusaoRegistro.objects.filter(excluido_em__lt=limite).delete()
+    return apagadas
+
+
+# ---------- Cursor ----------
+def codificar_cursor(posicoes):
+    chave = {nome: [data.isoformat(), ident] for nome, (data, ident) in posicoes.items()}
+    return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """ {conjunto: (data, id)} ou ValueError para cursores inválidos. """
+    try:
+        chave = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        posicoes = {nome: (parse_datetime(data), int(ident)) for nome, (data, ident) in chave.items()}
+    except (TypeError, ValueError, AttributeError, json.JSONDecodeError) as exc:
+        raise ValueError("Cursor inválido.") from exc
+    if EXCLUSOES not in posicoes or any(data is None for data, _ in posicoes.values()):
+        raise ValueError("Cursor inválido.")
+    return posicoes
+
+
+def _depois_de(campo, posicao):
+    """ (campo, id) > posicao, escrito como intervalo no índice de 'campo'. """
+    if posicao is None:
+        return Q()
+    data, ident = posicao
+    return Q(**{f'{campo}__gte': data}) & ~Q(**{campo: data, 'id__lte': ident})
+
+
+def _ler(queryset, campo, posicao, limite):
+    """ Até 'limite' linhas depois da posição, em ordem de (campo, id); e se há mais. """
+    linhas = list(queryset.filter(_depois_de(campo, posicao)).order_by(campo, 'id')[:limite + 1])
+    return linhas[:limite], len(linhas) > limite
+
+
+def _nova_posicao(linhas, campo, mais, corte):
+    """
+    Com mais linhas a ler, continua da última entregue. Se o conjunto terminou, tudo
+    até o corte (agora - margem) foi visto: recomeça dele, e o que foi gravado na
+    margem é lido de novo na próxima vez.
+    """
+    if mais:
+        return getattr(linhas[-1], campo), linhas[-1].id
+    return corte, 0
+
+
+def sincronizar(cursor=None, limite=None):
+    """
+    Mudanças desde o cursor: {'alterados': {conjunto: [...]}, 'excluidos': {conjunto: [ids]},
+    'mais': bool, 'cursor': str}. Levanta ValueError (cursor inválido) ou CursorExpirado.
+    """
+    config = configuracao()
+    limite = min(limite or config['limite_padrao'], config['limite_maximo'])
+    agora = timezone.now()
+    corte = agora - datetime.timedelta(seconds=config['margem_segundos'])
+
+    if cursor:
+        posicoes = decodificar_cursor(cursor)
+        if posicoes[EXCLUSOES][0] < agora - datetime.timedelta(days=config['retencao_exclusoes_dias']):
+            raise CursorExpirado("Cursor mais antigo que a retenção das exclusões; sincronize do zero.")
+    else:
+        # Carga inicial: as exclusões anteriores não interessam
+        posicoes = {EXCLUSOES: (corte, 0)}
+
+    alterados, novas_posicoes, mais = {}, {}, False
+    for nome, (_, queryset, serializer) in CONJUNTOS.items():
+        linhas, restam = _ler(queryset(), 'atualizado_em', posicoes.get(nome), limite)
+        alterados[nome] = serializer(linhas, many=True).data
+        novas_posicoes[nome] = _nova_posicao(linhas, 'atualizado_em', restam, corte)
+        mais = mais or restam
+
+    exclusoes, restam = _ler(ExclusaoRegistro.objects.all(), 'excluido_em', posicoes[EXCLUSOES], limite)
+    excluidos = {nome: [] for nome in CONJUNTOS}
+    for exclusao in exclusoes:
+        if exclusao.modelo in excluidos:
+            excluidos[exclusao.modelo].append(exclusao.objeto_id)
+    novas_posicoes[EXCLUSOES] = _nova_posicao(exclusoes, 'excluido_em', restam, corte)
+
+    return {
+        'alterados': alterados,
+        'excluidos': excluidos,
+        'mais': mais or restam,
+        'cursor': codificar_cursor(novas_posicoes),
+    }
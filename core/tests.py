@@ -1,3 +1,1408 @@
-from django.test import TestCase
+"""
+Limites de consultas SQL por endpoint.
 
-# Create your tests here.
+Cada view declara em `limite_consultas` o número máximo de consultas por ação
+(ViewSets: list, retrieve, create, ... e as @action; APIViews: get, post, ...).
+Estes testes chamam todas as rotas de core/urls.py e as do JWT e verificam que:
+  - toda rota tem limite declarado e é exercitada aqui;
+  - a contagem fica dentro do limite (com os caches frios: catálogo, snapshot, projeção);
+  - a contagem não cresce com o volume: mais registros, páginas maiores e mais itens
+    no corpo da requisição fazem exatamente o mesmo número de consultas.
+
+As demais classes testam comportamentos: CPF/CNPJ, importação CSV, gravação de itens
+fora de transação, eventos SSE e, sobre a base ApiComDadosTestCase, a conversão de
+orçamentos em lote, o RFM dos clientes, a tabela fato de vendas por produto e mês, o
+quadro de produção, o reajuste de preços em massa, o GET condicional
+(core/condicional.py), o catálogo de produtos, o extrato, as contas a receber, a
+instrumentação, as métricas, a sincronização incremental, a compressão e a simulação
+de preços.
+
+Rodam no SQLite: python manage.py test core
+"""
+import asyncio
+import base64
+import datetime
+import gzip
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import zlib
+from collections import namedtuple
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import brotli
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, resolve
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import sincronizacao
+from . import urls as core_urls
+from .catalogo import catalogo
+from .compressao import CompressaoMiddleware, escolher_codificacao
+from .conversao import JA_CONVERTIDO, NAO_ENCONTRADO, SEM_ITENS, STATUS_APROVADO
+from .estatisticas import CAMPOS_ESTATISTICA, reconstruir_estatisticas
+from .eventos import PEDIDO_CRIADO, PEDIDO_STATUS, Transmissor
+from .importacao import ArquivoIlegivel, importar_clientes, importar_produtos
+from .instrumentacao import ColetorRequisicao
+from .metricas import ARQUIVO_ENCERRADOS, CACHE_CONSULTAS, registro as registro_metricas
+from .models import (
+    Cliente, Despesa, Empresa, EstatisticaCliente, EventoSistema, ItemOrcamento, ItemPedido, Orcamento, Pagamento,
+    Pedido, Produto, ReajustePreco, VendaProdutoMensal, normalizar_cpf_cnpj
+)
+from .serializers import MENSAGEM_CPF_CNPJ_DUPLICADO, ClienteSerializer, ProdutoCatalogoRelatedField
+from .simulacao import CHAVE_VERSAO as CHAVE_VERSAO_SIMULACAO, resumo_base, simular_cenarios, snapshot_itens
+from .vendas_mensais import limites_do_mes, mes_de, reconstruir_vendas_produtos
+from .views import RelatorioContasReceberView
+
+MIGRACAO_CPF_CNPJ = importlib.import_module('core.migrations.0005_cliente_cpf_cnpj_normalizado')
+
+USUARIO = 'operador'
+SENHA = 'senha-de-teste'
+
+# Views de terceiros (sem onde declarar o limite ao lado da view), pelo nome da rota
+LIMITES_EXTERNOS = {
+    'api-root': {'get': 1},
+    'token_obtain_pair': {'post': 1},
+    'token_refresh': {'post': 1},
+}
+
+CACHES_DE_TESTE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes-default'},
+    'compartilhado': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes-compartilhado'},
+}
+
+Caso = namedtuple('Caso', ['metodo', 'url', 'corpo', 'status', 'formato', 'autenticado'])
+
+
+def caso(metodo, url, corpo=None, status=200, formato='json', autenticado=True):
+    return Caso(metodo, url, corpo, status, formato, autenticado)
+
+
+def semear(quantidade, itens):
+    """
+    Cria 'quantidade' registros de cada tipo, com 'itens' itens por orçamento e por pedido,
+    e devolve os registros usados nas URLs dos casos.
+    """
+    agora = timezone.now()
+    hoje = timezone.localdate()
+
+    clientes = Cliente.objects.bulk_create([
+        Cliente(nome=f'Cliente {indice}', telefone='11999990000') for indice in range(quantidade)
+    ])
+    produtos = Produto.objects.bulk_create([
+        Produto(
+            nome=f'Produto {indice}',
+            tipo_precificacao=Produto.TipoPrecificacao.METRO_QUADRADO if indice % 2 else Produto.TipoPrecificacao.UNICO,
+            preco=Decimal('50.00'), custo=Decimal('20.00'), estoque_atual=indice, estoque_minimo=5,
+        )
+        for indice in range(quantidade)
+    ])
+
+    orcamentos = Orcamento.objects.bulk_create([
+        Orcamento(cliente=clientes[indice], data_criacao=agora - datetime.timedelta(days=indice))
+        for indice in range(quantidade)
+    ])
+    ItemOrcamento.objects.bulk_create([
+        ItemOrcamento(
+            orcamento=orcamento, produto=produtos[indice % quantidade], quantidade=2,
+            largura=Decimal('1.00'), altura=Decimal('1.50'), subtotal=Decimal('150.00'),
+        )
+        for orcamento in orcamentos for indice in range(itens)
+    ])
+
+    status_producao = Pedido.STATUS_PRODUCAO
+    pedidos = Pedido.objects.bulk_create([
+        Pedido(
+            cliente=clientes[indice],
+            data_criacao=agora - datetime.timedelta(days=20 * indice),
+            valor_total=Decimal('150.00') * itens,
+            custo_producao=Decimal('30.00'),
+            status_producao=status_producao[indice % len(status_producao)],
+            status_pagamento=(Pedido.StatusPagamento.PAGO, Pedido.StatusPagamento.PARCIAL)[indice % 2],
+            previsto_entrega=hoje - datetime.timedelta(days=indice - 1),
+            data_producao=hoje,
+        )
+        for indice in range(quantidade)
+    ])
+    ItemPedido.objects.bulk_create([
+        ItemPedido(
+            pedido=pedido, produto=produtos[indice % quantidade], quantidade=2,
+            largura=Decimal('1.00'), altura=Decimal('1.50'), subtotal=Decimal('150.00'),
+        )
+        for pedido in pedidos for indice in range(itens)
+    ])
+    pagamentos = Pagamento.objects.bulk_create([
+        Pagamento(pedido=pedido, valor=Decimal('50.00'), data=pedido.data_criacao, forma_pagamento=forma)
+        for pedido in pedidos for forma in (Pagamento.FormaPagamento.PIX, Pagamento.FormaPagamento.DINHEIRO)
+    ])
+    despesas = Despesa.objects.bulk_create([
+        Despesa(descricao=f'Aluguel {indice}', valor=Decimal('1000.00'), categoria='Fixas',
+                data=hoje - datetime.timedelta(days=30 * indice))
+        for indice in range(quantidade)
+    ])
+
+    # As tabelas derivadas são mantidas por sinais, que bulk_create não dispara
+    reconstruir_estatisticas()
+    reconstruir_vendas_produtos()
+
+    return SimpleNamespace(
+        cliente=clientes[0],
+        cliente_livre=Cliente.objects.create(nome='Cliente sem movimento'),
+        produto=produtos[0],
+        produto_livre=Produto.objects.create(nome='Produto sem uso', preco=Decimal('10.00')),
+        orcamento=orcamentos[0],
+        orcamentos=[orcamento.id for orcamento in orcamentos],
+        item_orcamento=ItemOrcamento.objects.filter(orcamento=orcamentos[0]).first(),
+        pedido=pedidos[0],
+        pedidos=[pedido.id for pedido in pedidos],
+        item_pedido=ItemPedido.objects.filter(pedido=pedidos[0]).first(),
+        pagamento=pagamentos[0],
+        despesa=despesas[0],
+    )
+
+
+def tabelas_derivadas():
+    """ Linhas de EstatisticaCliente e VendaProdutoMensal, sem as colunas de controle. """
+    campos = [campo for campo in CAMPOS_ESTATISTICA if campo != 'atualizado_em']
+    estatisticas = {
+        linha.pop('cliente_id'): linha for linha in EstatisticaCliente.objects.values('cliente_id', *campos)
+    }
+    vendas = {
+        (linha.pop('produto_id'), linha.pop('mes')): linha
+        for linha in VendaProdutoMensal.objects.values(
+            'produto_id', 'mes', 'quantidade', 'metros_quadrados', 'receita', 'custo', 'ultima_venda'
+        )
+    }
+    return estatisticas, vendas
+
+
+def csv_clientes(linhas):
+    conteudo = 'nome,email,cpf_cnpj\n' + ''.join(
+        f'Importado {indice},importado{indice}@teste.com,{indice:011d}\n' for indice in range(1, linhas + 1)
+    )
+    return SimpleUploadedFile('clientes.csv', conteudo.encode(), content_type='text/csv')
+
+
+def csv_produtos(linhas):
+    conteudo = 'nome,tipo_precificacao,preco,custo\n' + ''.join(
+        f'Importado {indice},UNICO,10.00,4.00\n' for indice in range(linhas)
+    )
+    return SimpleUploadedFile('produtos.csv', conteudo.encode(), content_type='text/csv')
+
+
+def casos(dados, itens, refresh):
+    """ Um caso por rota e método; 'itens' é o tamanho das listas enviadas no corpo. """
+    cliente, produto, orcamento, pedido = dados.cliente, dados.produto, dados.orcamento, dados.pedido
+    hoje = timezone.localdate()
+    periodo = f'data_inicio={hoje - datetime.timedelta(days=400)}&data_fim={hoje}'
+    itens_orcamento = [
+        {'produto': produto.id, 'quantidade': 2, 'largura': '1.00', 'altura': '2.00'} for _ in range(itens)
+    ]
+    itens_pedido = [{'produto': produto.id, 'quantidade': 3} for _ in range(itens)]
+    cliente_dados = {'nome': 'Cliente Novo', 'cpf_cnpj': '123.456.789-09', 'telefone': '11988887777'}
+    produto_dados = {'nome': 'Banner', 'tipo_precificacao': 'M2', 'preco': '80.00', 'custo': '30.00'}
+    item_dados = {'quantidade': 4, 'subtotal': '99.00'}
+    pagamento_dados = {'pedido': pedido.id, 'valor': '10.00', 'forma_pagamento': 'PIX'}
+    despesa_dados = {'descricao': 'Energia', 'valor': '300.00', 'data': str(hoje), 'categoria': 'Fixas'}
+
+    return [
+        caso('get', '/api/'),
+        # Clientes
+        caso('get', '/api/clientes/'),
+        caso('post', '/api/clientes/', cliente_dados, status=201),
+        caso('get', f'/api/clientes/{cliente.id}/'),
+        caso('put', f'/api/clientes/{cliente.id}/', cliente_dados),
+        caso('patch', f'/api/clientes/{cliente.id}/', {'telefone': '11900000000'}),
+        caso('delete', f'/api/clientes/{dados.cliente_livre.id}/', status=204),
+        caso('get', f'/api/clientes/{cliente.id}/extrato/?limite=500'),
+        caso('get', f'/api/clientes/{cliente.id}/extrato/pdf/'),
+        # Produtos
+        caso('get', '/api/produtos/'),
+        caso('post', '/api/produtos/', produto_dados, status=201),
+        caso('get', f'/api/produtos/{produto.id}/'),
+        caso('put', f'/api/produtos/{produto.id}/', produto_dados),
+        caso('patch', f'/api/produtos/{produto.id}/', {'preco': '55.00'}),
+        caso('delete', f'/api/produtos/{dados.produto_livre.id}/', status=204),
+        caso('post', '/api/produtos/reajuste-precos/', {'ajuste_preco': '5.00', 'motivo': 'Teste'}, status=201),
+        caso('get', '/api/produtos/reajustes/'),
+        # Orçamentos
+        caso('get', '/api/orcamentos/'),
+        caso('post', '/api/orcamentos/', {'cliente_id': cliente.id, 'itens_write': itens_orcamento}, status=201),
+        caso('get', f'/api/orcamentos/{orcamento.id}/'),
+        caso('put', f'/api/orcamentos/{orcamento.id}/', {
+            'cliente_id': cliente.id, 'status': 'Em Aberto', 'itens_write': itens_orcamento
+        }),
+        caso('patch', f'/api/orcamentos/{orcamento.id}/', {'status': 'Rejeitado'}),
+        caso('delete', f'/api/orcamentos/{orcamento.id}/', status=204),
+        caso('post', f'/api/orcamentos/{orcamento.id}/converter-para-pedido/', status=201),
+        # Até 8 orçamentos: com 12 itens cada, os itens cabem num único INSERT mesmo com o
+        # limite de 999 parâmetros do SQLite (o bulk_create divide em lotes acima disso)
+        caso('post', '/api/orcamentos/converter-em-lote/', {'orcamentos': dados.orcamentos[:8]}, status=201),
+        caso('get', f'/api/orcamentos/{orcamento.id}/pdf/'),
+        # Itens de orçamento (o item só é criado junto com o orçamento: o POST direto é recusado)
+        caso('get', '/api/itens-orcamento/'),
+        caso('post', '/api/itens-orcamento/', {}, status=400),
+        caso('get', f'/api/itens-orcamento/{dados.item_orcamento.id}/'),
+        caso('put', f'/api/itens-orcamento/{dados.item_orcamento.id}/', item_dados),
+        caso('patch', f'/api/itens-orcamento/{dados.item_orcamento.id}/', {'quantidade': 5}),
+        caso('delete', f'/api/itens-orcamento/{dados.item_orcamento.id}/', status=204),
+        # Pedidos
+        caso('get', '/api/pedidos/'),
+        caso('post', '/api/pedidos/', {'cliente_id': cliente.id, 'itens_write': itens_pedido}, status=201),
+        caso('get', f'/api/pedidos/{pedido.id}/'),
+        caso('put', f'/api/pedidos/{pedido.id}/', {
+            'cliente_id': cliente.id, 'status_producao': 'Em Produção', 'itens_write': itens_pedido
+        }),
+        caso('patch', f'/api/pedidos/{pedido.id}/', {'status_producao': 'Finalizado'}),
+        caso('delete', f'/api/pedidos/{pedido.id}/', status=204),
+        caso('get', '/api/pedidos/producao/?por_coluna=100'),
+        caso('post', '/api/pedidos/transicao-producao/', {
+            'pedidos': dados.pedidos, 'status_producao': 'Finalizado'
+        }),
+        caso('get', f'/api/pedidos/{pedido.id}/pdf/'),
+        # Itens de pedido
+        caso('get', '/api/itens-pedido/'),
+        caso('post', '/api/itens-pedido/', {}, status=400),
+        caso('get', f'/api/itens-pedido/{dados.item_pedido.id}/'),
+        caso('put', f'/api/itens-pedido/{dados.item_pedido.id}/', item_dados),
+        caso('patch', f'/api/itens-pedido/{dados.item_pedido.id}/', {'quantidade': 5}),
+        caso('delete', f'/api/itens-pedido/{dados.item_pedido.id}/', status=204),
+        # Pagamentos
+        caso('get', '/api/pagamentos/'),
+        caso('post', '/api/pagamentos/', pagamento_dados, status=201),
+        caso('get', f'/api/pagamentos/{dados.pagamento.id}/'),
+        caso('put', f'/api/pagamentos/{dados.pagamento.id}/', pagamento_dados),
+        caso('patch', f'/api/pagamentos/{dados.pagamento.id}/', {'valor': '20.00'}),
+        caso('delete', f'/api/pagamentos/{dados.pagamento.id}/', status=204),
+        # Despesas
+        caso('get', '/api/despesas-gerais/'),
+        caso('post', '/api/despesas-gerais/', despesa_dados, status=201),
+        caso('get', f'/api/despesas-gerais/{dados.despesa.id}/'),
+        caso('put', f'/api/despesas-gerais/{dados.despesa.id}/', despesa_dados),
+        caso('patch', f'/api/despesas-gerais/{dados.despesa.id}/', {'valor': '350.00'}),
+        caso('delete', f'/api/despesas-gerais/{dados.despesa.id}/', status=204),
+        caso('get', '/api/despesas/'),
+        # Dashboard
+        caso('get', '/api/public/empresa/', autenticado=False),
+        caso('get', f'/api/dashboard/?{periodo}'),
+        caso('get', '/api/eventos/'),
+        caso('get', f'/api/dashboard-stats/?{periodo}'),
+        caso('get', '/api/fluxo-caixa/projecao/?dias=180'),
+        caso('get', '/api/vendas-recentes/'),
+        caso('get', f'/api/faturamento-por-pagamento/?{periodo}'),
+        caso('get', '/api/relatorios/evolucao-vendas/'),
+        caso('get', '/api/relatorios/pedidos-por-status/'),
+        caso('get', f'/api/relatorios/produtos-mais-vendidos/?{periodo}'),
+        caso('get', '/api/relatorios/clientes-mais-ativos/'),
+        # Relatórios
+        caso('get', f'/api/relatorios/faturamento/?{periodo}'),
+        caso('get', '/api/relatorios/clientes/?page_size=200'),
+        caso('get', '/api/relatorios/clientes/segmentos/?page_size=200'),
+        caso('get', '/api/relatorios/pedidos/'),
+        caso('get', '/api/relatorios/contas-a-receber/?page_size=200'),
+        caso('get', '/api/relatorios/orcamentos/'),
+        caso('get', f'/api/relatorios/produtos/?{periodo}'),
+        # Configurações e perfil
+        caso('get', '/api/empresa-settings/'),
+        caso('put', '/api/empresa-settings/', {'nome_empresa': 'Gráfica Teste'}),
+        caso('get', '/api/profile/'),
+        caso('put', '/api/profile/', {'first_name': 'Teste'}),
+        caso('post', '/api/profile/change-password/', {'old_password': SENHA, 'new_password': 'nova-senha-123'}),
+        # Importação, cotação e simulação
+        caso('post', '/api/importacao/clientes/', {'arquivo': csv_clientes(itens)}, formato='multipart'),
+        caso('post', '/api/importacao/produtos/', {'arquivo': csv_produtos(itens)}, formato='multipart'),
+        caso('post', '/api/cotacao/', {
+            'linhas': [{'produto': produto.id, 'quantidade': indice + 1} for indice in range(itens)]
+        }),
+        caso('get', '/api/simulacao/precos/'),
+        caso('post', '/api/simulacao/precos/', {
+            'cenarios': [{'nome': f'C{indice}', 'ajuste_preco_m2': indice} for indice in range(itens)]
+        }),
+        # Sincronização incremental (carga inicial: todos os conjuntos)
+        caso('get', '/api/sincronizacao/'),
+        # Perfis (só para staff: o operador é recusado)
+        caso('get', '/api/perfis/', status=403),
+        caso('get', '/api/perfis/20250101-000000-000000-get-api_relatorios/', status=403),
+        # JWT
+        caso('post', '/api/token/', {'username': USUARIO, 'password': SENHA}, autenticado=False),
+        caso('post', '/api/token/refresh/', {'refresh': refresh}, autenticado=False),
+    ]
+
+
+def rotas(padroes):
+    for padrao in padroes:
+        if isinstance(padrao, URLResolver):
+            yield from rotas(padrao.url_patterns)
+        else:
+            yield padrao
+
+
+def acoes_da_rota(padrao):
+    """ Nome da rota, classe da view e ações (ViewSet) ou métodos HTTP (APIView/View) da rota. """
+    callback = padrao.callback
+    visao = getattr(callback, 'cls', None) or callback.view_class
+    if getattr(callback, 'actions', None):
+        return padrao.name, visao, set(callback.actions.values())
+    return padrao.name, visao, {
+        metodo for metodo in visao.http_method_names if metodo not in ('head', 'options') and hasattr(visao, metodo)
+    }
+
+
+def limite_do_caso(caso_):
+    """ (view, ação, limite declarado) da rota que atende o caso. """
+    rota = resolve(caso_.url.split('?')[0])
+    visao = getattr(rota.func, 'cls', None) or rota.func.view_class
+    acoes = getattr(rota.func, 'actions', None)
+    acao = acoes[caso_.metodo] if acoes else caso_.metodo
+    limites = LIMITES_EXTERNOS.get(rota.url_name) or getattr(visao, 'limite_consultas', {})
+    return visao, acao, limites.get(acao)
+
+
+@override_settings(
+    CACHES=CACHES_DE_TESTE, INSTRUMENTACAO={'ativa': False}, METRICAS={'ativa': False}, RELATORIOS_THREADS=1
+)
+class LimiteConsultasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(USUARIO, 'operador@teste.com', SENHA)
+        Empresa.objects.create(pk=1)
+        ReajustePreco.objects.create(modo=ReajustePreco.Modo.PERCENTUAL, ajuste_preco=Decimal('3.00'), produtos_afetados=1)
+        cls.dados = semear(quantidade=3, itens=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        tokens = self.client.post('/api/token/', {'username': USUARIO, 'password': SENHA}, format='json').json()
+        self.refresh = tokens['refresh']
+        self.autorizacao = f"Bearer {tokens['access']}"
+
+    def executar(self, caso_):
+        """
+        Faz a requisição com os caches frios, executa o que ficou para o fim da transação
+        (on_commit) e desfaz as gravações. Retorna (resposta, número de consultas).
+        """
+        caches['compartilhado'].clear()
+        self.client.credentials(**({'HTTP_AUTHORIZATION': self.autorizacao} if caso_.autenticado else {}))
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as consultas:
+                with self.captureOnCommitCallbacks(execute=True):
+                    resposta = getattr(self.client, caso_.metodo)(caso_.url, caso_.corpo, format=caso_.formato)
+            transaction.set_rollback(True)
+        return resposta, len(consultas)
+
+    def test_toda_rota_tem_limite_declarado_e_um_caso(self):
+        exercitadas = set()
+        for caso_ in casos(self.dados, 1, self.refresh):
+            visao, acao, _ = limite_do_caso(caso_)
+            exercitadas.add((visao, acao))
+
+        for padrao in rotas(core_urls.urlpatterns):
+            nome, visao, acoes = acoes_da_rota(padrao)
+            limites = LIMITES_EXTERNOS.get(nome) or getattr(visao, 'limite_consultas', {})
+            for acao in acoes:
+                with self.subTest(view=visao.__name__, acao=acao):
+                    self.assertIn(acao, limites, f'{visao.__name__} não declara limite_consultas[{acao!r}]')
+                    self.assertIn((visao, acao), exercitadas, f'{visao.__name__}.{acao} não tem caso de teste')
+
+    def test_consultas_dentro_do_limite(self):
+        for caso_ in casos(self.dados, 3, self.refresh):
+            visao, acao, limite = limite_do_caso(caso_)
+            with self.subTest(metodo=caso_.metodo, url=caso_.url):
+                resposta, total = self.executar(caso_)
+                self.assertEqual(resposta.status_code, caso_.status, getattr(resposta, 'data', None))
+                self.assertLessEqual(total, limite, f'{visao.__name__}.{acao}: {total} consultas, limite {limite}')
+
+    def test_consultas_nao_crescem_com_o_volume(self):
+        pequenos = [self.executar(caso_)[1] for caso_ in casos(self.dados, 1, self.refresh)]
+
+        # Mais registros (páginas cheias), e mais itens em cada orçamento/pedido e no corpo
+        grandes_dados = semear(quantidade=25, itens=12)
+        for caso_, pequeno in zip(casos(grandes_dados, 12, self.refresh), pequenos):
+            with self.subTest(metodo=caso_.metodo, url=caso_.url):
+                resposta, grande = self.executar(caso_)
+                self.assertEqual(resposta.status_code, caso_.status, getattr(resposta, 'data', None))
+                self.assertEqual(grande, pequeno, 'o número de consultas cresceu com o volume de dados')
+
+
+class ClienteCpfCnpjTests(TestCase):
+    """ Normalização, validação e unicidade do CPF/CNPJ dos clientes. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(USUARIO, 'operador@teste.com', SENHA)
+        Cliente.objects.create(nome='Existente', cpf_cnpj='123.456.789-01')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_normalizacao(self):
+        self.assertEqual(normalizar_cpf_cnpj('123.456.789-01'), '12345678901')
+        self.assertEqual(normalizar_cpf_cnpj('12.345.678/0001-90'), '12345678000190')
+        for vazio in (None, '', '  ', '-./'):
+            self.assertIsNone(normalizar_cpf_cnpj(vazio))
+        self.assertEqual(Cliente.objects.get(nome='Existente').cpf_cnpj_normalizado, '12345678901')
+
+    def test_so_aceita_cpf_ou_cnpj_completo(self):
+        for valor in ('1234', '123.456.789-012', '1' * 18, 'sem digitos'):
+            with self.subTest(valor=valor):
+                resposta = self.client.post('/api/clientes/', {'nome': 'Novo', 'cpf_cnpj': valor}, format='json')
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('cpf_cnpj', resposta.json())
+        resposta = self.client.post('/api/clientes/', {'nome': 'Empresa', 'cpf_cnpj': '12.345.678/0001-90'}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+
+        resultado = importar_clientes(io.StringIO('nome,cpf_cnpj\nLongo,1234567890123456\n'))
+        self.assertEqual(resultado.criados, 0)
+        self.assertIn('cpf_cnpj', resultado.erros[0]['erros'])
+
+    def test_cpf_duplicado_com_outra_pontuacao(self):
+        resposta = self.client.post('/api/clientes/', {'nome': 'Repetido', 'cpf_cnpj': '12345678901'}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['cpf_cnpj'], [MENSAGEM_CPF_CNPJ_DUPLICADO])
+        # A garantia é a constraint única da coluna normalizada, não só a checagem do serializer
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cliente.objects.create(nome='Repetido', cpf_cnpj='123 456 789 01')
+
+    def test_so_a_constraint_do_documento_vira_erro_de_duplicidade(self):
+        serializer = ClienteSerializer(data={'nome': 'Novo', 'cpf_cnpj': '987.654.321-00'})
+        serializer.is_valid(raise_exception=True)
+        # Concorrência: outro cliente gravou o mesmo documento depois da validação
+        Cliente.objects.create(nome='Concorrente', cpf_cnpj='98765432100')
+        with self.assertRaises(ValidationError) as erro:
+            serializer.save()
+        self.assertEqual(erro.exception.detail, {'cpf_cnpj': [MENSAGEM_CPF_CNPJ_DUPLICADO]})
+
+        outro = ClienteSerializer(data={'nome': 'Outro', 'cpf_cnpj': '111.222.333-44'})
+        outro.is_valid(raise_exception=True)
+        outra_violacao = IntegrityError('NOT NULL constraint failed: core_cliente.nome')
+        with mock.patch.object(Cliente, 'save', side_effect=outra_violacao), self.assertRaises(IntegrityError):
+            outro.save()
+
+    def test_migracao_separa_duplicados_e_invalidos_para_revisao(self):
+        Cliente.objects.all().delete()
+        # bulk_create não passa pelo save(): como os clientes anteriores à coluna normalizada
+        legados = Cliente.objects.bulk_create([
+            Cliente(nome='Original', cpf_cnpj='123.456.789-01'),
+            Cliente(nome='Duplicado', cpf_cnpj='12345678901'),
+            Cliente(nome='Longo', cpf_cnpj='1234567890123456'),
+        ])
+        with self.assertLogs(MIGRACAO_CPF_CNPJ.__name__, 'WARNING') as log:
+            MIGRACAO_CPF_CNPJ.preencher_cpf_cnpj_normalizado(django_apps, None)
+        self.assertIn('2 cliente(s)', log.output[0])
+
+        original, duplicado, longo = (Cliente.objects.get(pk=cliente.pk) for cliente in legados)
+        self.assertEqual(original.cpf_cnpj_normalizado, '12345678901')
+        self.assertEqual(
+            [(cliente.cpf_cnpj, cliente.cpf_cnpj_normalizado, cliente.cpf_cnpj_pendente, cliente.cpf_cnpj_pendencia)
+             for cliente in (duplicado, longo)],
+            [(None, None, '12345678901', Cliente.PendenciaCpfCnpj.DUPLICADO),
+             (None, None, '1234567890123456', Cliente.PendenciaCpfCnpj.INVALIDO)]
+        )
+
+        # Gravações fora do serializer não esbarram no índice único
+        duplicado.nome = 'Duplicado (revisar)'
+        duplicado.save()
+        # Um documento novo resolve a pendência
+        longo.cpf_cnpj = '98.765.432/0001-10'
+        longo.save(update_fields=['cpf_cnpj'])
+        longo.refresh_from_db()
+        self.assertEqual((longo.cpf_cnpj_normalizado, longo.cpf_cnpj_pendente, longo.cpf_cnpj_pendencia),
+                         ('98765432000110', None, None))
+
+
+class ImportacaoCSVTests(TestCase):
+    """
+    Importação CSV (core/importacao.py): num CSV parcial só as colunas do arquivo são
+    gravadas; erros de linha não interrompem os lotes; um arquivo ilegível não grava nada.
+    """
+
+    def test_csv_parcial_preserva_as_colunas_ausentes(self):
+        cliente = Cliente.objects.create(
+            nome='Maria', email='maria@teste.com', telefone='11999990000', cpf_cnpj='123.456.789-01', cidade='Santos'
+        )
+        resultado = importar_clientes(io.StringIO('nome,cpf_cnpj\nMaria Souza,12345678901\n'))
+        self.assertEqual((resultado.criados, resultado.atualizados, resultado.erros), (0, 1, []))
+        cliente.refresh_from_db()
+        self.assertEqual(
+            (cliente.nome, cliente.email, cliente.telefone, cliente.cidade),
+            ('Maria Souza', 'maria@teste.com', '11999990000', 'Santos'),
+        )
+
+        produto = Produto.objects.create(nome='Banner', preco=Decimal('50.00'), custo=Decimal('20.00'), estoque_atual=7)
+        resultado = importar_produtos(io.StringIO(f'id,preco\n{produto.id},55.00\n999999,10.00\n'))
+        self.assertEqual((resultado.criados, resultado.atualizados), (0, 1))
+        # Produto novo sem a coluna 'nome': erro da linha, não um cadastro em branco
+        self.assertEqual(resultado.erros[0]['linha'], 3)
+        self.assertIn('nome', resultado.erros[0]['erros'])
+        produto.refresh_from_db()
+        self.assertEqual(
+            (produto.nome, produto.preco, produto.custo, produto.estoque_atual),
+            ('Banner', Decimal('55.00'), Decimal('20.00'), 7),
+        )
+
+    def test_erros_de_linha_em_lotes_diferentes(self):
+        conteudo = (
+            'nome,cpf_cnpj\n'
+            'Ana,11111111111\n'      # lote 1
+            'Bruno,1234\n'
+            'Carla,22222222222\n'    # lote 2
+            'Davi,111.111.111-11\n'  # repete a linha 2, de outro lote
+            ',44444444444\n'         # lote 3: cliente novo sem nome
+            'Eva,33333333333\n'
+        )
+        resultado = importar_clientes(io.StringIO(conteudo), tamanho_lote=2)
+        self.assertEqual((resultado.criados, resultado.atualizados), (3, 0))
+        erros = resultado.como_dict()['erros']
+        self.assertEqual([(erro['linha'], list(erro['erros'])) for erro in erros],
+                         [(3, ['cpf_cnpj']), (5, ['cpf_cnpj']), (6, ['nome'])])
+        self.assertEqual(
+            sorted(Cliente.objects.values_list('nome', flat=True)), ['Ana', 'Carla', 'Eva']
+        )
+
+    def test_arquivo_ilegivel_no_meio_nao_grava_nenhum_lote(self):
+        # Maior que o buffer do TextIOWrapper: o byte inválido só é lido depois de vários lotes
+        conteudo = 'nome,cpf_cnpj\n' + ''.join(f'Cliente {indice},{indice:011d}\n' for indice in range(1, 601))
+        conteudo = conteudo.encode() + b'Jos\xe9,99999999999\n'
+        texto = io.TextIOWrapper(io.BytesIO(conteudo), encoding='utf-8-sig', newline='')
+        with self.assertRaisesMessage(ArquivoIlegivel, 'UTF-8'):
+            importar_clientes(texto, tamanho_lote=50)
+        self.assertFalse(Cliente.objects.exists())
+
+        cliente = APIClient()
+        cliente.force_authenticate(User.objects.create_user(USUARIO, password=SENHA))
+        resposta = cliente.post('/api/importacao/clientes/', {
+            'arquivo': SimpleUploadedFile('clientes.csv', conteudo, content_type='text/csv')
+        }, format='multipart')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('UTF-8', resposta.json()['error'])
+        self.assertFalse(Cliente.objects.exists())
+
+
+@override_settings(CACHES=CACHES_DE_TESTE, INSTRUMENTACAO={'ativa': False}, METRICAS={'ativa': False})
+class GravacaoItensTests(TransactionTestCase):
+    """
+    Substituição dos itens fora de qualquer transação externa, como em produção: os
+    callbacks on_commit rodam de verdade (LimiteConsultasTests roda tudo num atomic).
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(USUARIO, 'operador@teste.com', SENHA))
+        self.cliente = Cliente.objects.create(nome='Cliente')
+        self.produto = Produto.objects.create(nome='Produto', preco=Decimal('25.00'))
+
+    def test_total_gravado_e_a_soma_dos_novos_itens(self):
+        itens = [{'produto': self.produto.id, 'quantidade': 1, 'subtotal': '10.00'}]
+        novos_itens = [{'produto': self.produto.id, 'quantidade': 2, 'subtotal': '50.00'}]
+        for rota, modelo in (('/api/orcamentos/', Orcamento), ('/api/pedidos/', Pedido)):
+            with self.subTest(rota=rota):
+                criado = self.client.post(
+                    rota, {'cliente_id': self.cliente.id, 'itens_write': itens}, format='json'
+                ).json()
+                resposta = self.client.put(
+                    f"{rota}{criado['id']}/", {'cliente_id': self.cliente.id, 'itens_write': novos_itens}, format='json'
+                )
+                self.assertEqual(Decimal(resposta.json()['valor_total']), Decimal('50.00'))
+                registro = modelo.objects.get(pk=criado['id'])
+                self.assertEqual(registro.valor_total, Decimal('50.00'))
+                self.assertEqual([item.subtotal for item in registro.itens.all()], [Decimal('50.00')])
+
+
+@override_settings(EVENTOS_INTERVALO_SEGUNDOS=0.01)
+class TransmissorTests(TestCase):
+    """ Repasse dos eventos às conexões SSE (core/eventos.py). """
+
+    async def test_reinicio_sem_conexoes_nao_reenvia_eventos_antigos(self):
+        transmissor = Transmissor()
+        fila, _ = await transmissor.assinar()
+        transmissor.cancelar(fila)
+        await transmissor._tarefa  # sem conexões, o transmissor para
+
+        antigo = await EventoSistema.objects.acreate(tipo=PEDIDO_CRIADO, dados={})
+        fila, ultimo_id = await transmissor.assinar()
+        self.assertEqual(ultimo_id, antigo.id)
+        novo = await EventoSistema.objects.acreate(tipo=PEDIDO_CRIADO, dados={})
+        self.assertEqual((await asyncio.wait_for(fila.get(), timeout=5)).id, novo.id)
+        transmissor.cancelar(fila)
+        await transmissor._tarefa
+
+
+@override_settings(CACHES=CACHES_DE_TESTE, INSTRUMENTACAO={'ativa': False}, METRICAS={'ativa': False})
+class ApiComDadosTestCase(TestCase):
+    """
+    Base dos testes de comportamento da API: um usuário autenticado no APIClient e os
+    registros de semear() em self.dados ('quantidade' e 'itens' de cada subclasse).
+    """
+    quantidade = 3
+    itens = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(USUARIO, 'operador@teste.com', SENHA)
+        Empresa.objects.create(pk=1)
+        cls.dados = semear(quantidade=cls.quantidade, itens=cls.itens)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def assertDerivadosIguaisAReconstrucao(self):
+        """ As tabelas mantidas incrementalmente batem com a reconstrução completa. """
+        incrementais = tabelas_derivadas()
+        reconstruir_estatisticas()
+        reconstruir_vendas_produtos()
+        self.assertEqual(incrementais, tabelas_derivadas())
+
+
+class ConversaoLoteTests(ApiComDadosTestCase):
+    """ Conversão de orçamentos em pedidos, em lote (core/conversao.py). """
+
+    def converter(self, orcamentos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/orcamentos/converter-em-lote/', {'orcamentos': orcamentos}, format='json')
+
+    def test_pedidos_iguais_aos_orcamentos_e_derivados_atualizados(self):
+        origem = self.dados.orcamentos[:2]
+        ItemOrcamento.objects.create(
+            orcamento_id=origem[1], produto=None, quantidade=1, descricao_customizada='Arte', subtotal=Decimal('35.00')
+        )
+        resposta = self.converter(origem)
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json()['recusados'], [])
+
+        campos = ('produto_id', 'quantidade', 'largura', 'altura', 'descricao_customizada', 'subtotal')
+        for convertido in resposta.json()['convertidos']:
+            pedido = Pedido.objects.get(pk=convertido['pedido'])
+            orcamento = Orcamento.objects.get(pk=convertido['orcamento'])
+            itens_orcamento = sorted(orcamento.itens.values_list(*campos), key=str)
+            self.assertEqual(sorted(pedido.itens.values_list(*campos), key=str), itens_orcamento)
+            self.assertEqual(pedido.valor_total, sum(item[-1] for item in itens_orcamento))
+            self.assertEqual(Decimal(str(convertido['valor_total'])), pedido.valor_total)
+            self.assertEqual((pedido.orcamento_origem_id, orcamento.status), (orcamento.id, STATUS_APROVADO))
+
+        # bulk_create não dispara sinais: a conversão atualiza as tabelas derivadas
+        clientes = Orcamento.objects.filter(pk__in=origem).values_list('cliente_id', flat=True)
+        estatisticas, vendas = tabelas_derivadas()
+        for cliente_id in clientes:
+            self.assertEqual(estatisticas[cliente_id]['total_pedidos'], Pedido.objects.filter(cliente_id=cliente_id).count())
+        self.assertIn((self.dados.produto.id, timezone.localdate().replace(day=1)), vendas)
+        self.assertDerivadosIguaisAReconstrucao()
+
+    def test_ja_convertidos_inexistentes_e_sem_itens_sao_recusados(self):
+        primeiro, segundo, terceiro = self.dados.orcamentos
+        ItemOrcamento.objects.filter(orcamento_id=terceiro).delete()
+        self.assertEqual(self.converter([primeiro]).status_code, 201)
+        pedidos = Pedido.objects.count()
+
+        resposta = self.converter([primeiro, segundo, terceiro, 999999, segundo])
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual([linha['orcamento'] for linha in resposta.json()['convertidos']], [segundo])
+        self.assertEqual(
+            {linha['orcamento']: linha['motivo'] for linha in resposta.json()['recusados']},
+            {primeiro: JA_CONVERTIDO, terceiro: SEM_ITENS, 999999: NAO_ENCONTRADO},
+        )
+        self.assertEqual(Pedido.objects.count(), pedidos + 1)
+
+        # Nada convertido: 200, sem pedidos novos; seleção vazia é erro de validação
+        resposta = self.converter([primeiro, segundo])
+        self.assertEqual((resposta.status_code, resposta.json()['convertidos']), (200, []))
+        self.assertEqual(self.converter([]).status_code, 400)
+        self.assertEqual(Pedido.objects.count(), pedidos + 1)
+        self.assertEqual(Pedido.objects.filter(orcamento_origem_id=primeiro).count(), 1)
+
+
+class EstatisticaClienteTests(ApiComDadosTestCase):
+    """ RFM mantido pedido a pedido (core/estatisticas.py e core/signals.py). """
+
+    def test_incremental_igual_ao_recalculo_completo(self):
+        novo, antigo = self.dados.cliente_livre, self.dados.cliente
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post('/api/pedidos/', {
+                'cliente_id': novo.id, 'itens_write': [{'produto': self.dados.produto.id, 'quantidade': 3}],
+            }, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(EstatisticaCliente.objects.get(cliente=novo).total_pedidos, 1)
+        self.assertDerivadosIguaisAReconstrucao()
+
+        pedido = Pedido.objects.get(pk=resposta.json()['id'])
+        pedido.valor_total = Decimal('2500.00')
+        pedido.data_criacao = timezone.now() - datetime.timedelta(days=200)
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido.save()
+        self.assertEqual(EstatisticaCliente.objects.get(cliente=novo).score_monetario, 3)
+        self.assertDerivadosIguaisAReconstrucao()
+
+        # Troca de cliente: os dois são recalculados
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(f'/api/pedidos/{pedido.id}/', {'cliente_id': antigo.id}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(EstatisticaCliente.objects.filter(cliente=novo).exists())
+        self.assertDerivadosIguaisAReconstrucao()
+
+        for pedido_id in Pedido.objects.filter(cliente=antigo).values_list('id', flat=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.delete(f'/api/pedidos/{pedido_id}/').status_code, 204)
+            self.assertDerivadosIguaisAReconstrucao()
+        self.assertFalse(EstatisticaCliente.objects.filter(cliente=antigo).exists())
+
+
+class VendaProdutoMensalTests(ApiComDadosTestCase):
+    """ Tabela fato produto × mês (core/vendas_mensais.py) e o relatório de produtos. """
+
+    def vendido_no_mes(self, produto_id, data_hora):
+        return VendaProdutoMensal.objects.filter(produto_id=produto_id, mes=mes_de(data_hora))\
+            .values_list('quantidade', flat=True).first() or 0
+
+    def test_mudar_de_mes_e_excluir_atualizam_as_duas_celulas(self):
+        primeiro, segundo = Pedido.objects.filter(pk__in=self.dados.pedidos[:2]).order_by('-data_criacao')
+        produto_id = self.dados.produto.id
+        longe = timezone.now() - datetime.timedelta(days=100)
+
+        # Pedido muda de data: os itens saem do mês antigo e entram no novo
+        antes = self.vendido_no_mes(produto_id, segundo.data_criacao)
+        data_original, segundo.data_criacao = segundo.data_criacao, longe
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.save()
+        self.assertEqual(self.vendido_no_mes(produto_id, data_original), antes - 2)
+        self.assertEqual(self.vendido_no_mes(produto_id, longe), 2)
+        self.assertDerivadosIguaisAReconstrucao()
+
+        # Item muda de pedido (e de mês)
+        item = ItemPedido.objects.get(pedido=primeiro, produto_id=produto_id)
+        antes = self.vendido_no_mes(produto_id, primeiro.data_criacao)
+        item.pedido = segundo
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertEqual(self.vendido_no_mes(produto_id, primeiro.data_criacao), antes - 2)
+        self.assertEqual(self.vendido_no_mes(produto_id, longe), 4)
+        self.assertDerivadosIguaisAReconstrucao()
+
+        # Exclusão do pedido: a célula do mês dele fica vazia e é removida
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/pedidos/{segundo.id}/').status_code, 204)
+        self.assertFalse(VendaProdutoMensal.objects.filter(mes=mes_de(longe)).exists())
+        self.assertDerivadosIguaisAReconstrucao()
+
+    def test_relatorio_por_periodo_igual_a_agregacao_dos_itens(self):
+        # Um pedido fora do período, para que o filtro faça diferença
+        Pedido.objects.filter(pk=self.dados.pedidos[-1]).update(data_criacao=timezone.now() - datetime.timedelta(days=200))
+        reconstruir_vendas_produtos()
+        data_inicio = timezone.localdate() - datetime.timedelta(days=45)
+        data_fim = timezone.localdate()
+
+        resposta = self.client.get('/api/relatorios/produtos/', {'data_inicio': data_inicio, 'data_fim': data_fim})
+        self.assertEqual(resposta.status_code, 200)
+
+        # O período cobre meses inteiros: do mês de data_inicio ao fim do mês de data_fim
+        inicio = limites_do_mes(data_inicio.replace(day=1))[0]
+        fim = limites_do_mes(data_fim.replace(day=1))[1]
+        itens = ItemPedido.objects.filter(pedido__data_criacao__gte=inicio, pedido__data_criacao__lt=fim)\
+            .select_related('produto')
+        vendidos, lucro = {}, {}
+        for item in itens:
+            nome, produto = item.produto.nome, item.produto
+            area = item.largura * item.altura if produto.tipo_precificacao == Produto.TipoPrecificacao.METRO_QUADRADO else 1
+            vendidos[nome] = vendidos.get(nome, 0) + item.quantidade
+            lucro[nome] = lucro.get(nome, 0) + item.subtotal - produto.custo * area * item.quantidade
+
+        self.assertEqual(ItemPedido.objects.count() - itens.count(), self.itens)
+        self.assertEqual(
+            {linha['name']: linha['value'] for linha in resposta.json()['grafico_mais_vendidos']}, vendidos
+        )
+        self.assertEqual(
+            {linha['name']: Decimal(linha['total_lucro']) for linha in resposta.json()['lista_mais_lucrativos']}, lucro
+        )
+
+
+class QuadroProducaoTests(ApiComDadosTestCase):
+    """ Quadro (kanban) de produção e a transição de status em lote. """
+
+    def transicao(self, pedidos, status_producao):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/pedidos/transicao-producao/', {
+                'pedidos': pedidos, 'status_producao': status_producao,
+            }, format='json')
+
+    def test_transicao_invalida_nao_altera_nada(self):
+        antes = list(Pedido.objects.order_by('id').values_list('status_producao', 'atualizado_em'))
+        for pedidos, status_producao in ((self.dados.pedidos, 'Entregue'), ([], 'Finalizado'), ([0], 'Finalizado')):
+            with self.subTest(pedidos=pedidos, status_producao=status_producao):
+                self.assertEqual(self.transicao(pedidos, status_producao).status_code, 400)
+        self.assertEqual(list(Pedido.objects.order_by('id').values_list('status_producao', 'atualizado_em')), antes)
+        self.assertFalse(EventoSistema.objects.filter(tipo=PEDIDO_STATUS).exists())
+
+    def test_finalizar_grava_data_producao(self):
+        Pedido.objects.update(data_producao=None)
+        primeiro, segundo, terceiro = self.dados.pedidos
+
+        resposta = self.transicao([primeiro, segundo, 999999], 'Em Produção')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['atualizados'], [primeiro, segundo])
+        self.assertEqual(resposta.json()['nao_encontrados'], [999999])
+        self.assertFalse(Pedido.objects.filter(data_producao__isnull=False).exists())
+
+        resposta = self.transicao([primeiro, terceiro], Pedido.STATUS_FINALIZADO)
+        self.assertEqual(resposta.json()['atualizados'], [primeiro, terceiro])
+        self.assertEqual(
+            dict(Pedido.objects.values_list('id', 'data_producao')),
+            {primeiro: timezone.localdate(), segundo: None, terceiro: timezone.localdate()},
+        )
+        # Quem já está no status não muda nem gera evento
+        resposta = self.transicao([primeiro], Pedido.STATUS_FINALIZADO)
+        self.assertEqual((resposta.json()['atualizados'], resposta.json()['ja_no_status']), ([], [primeiro]))
+        self.assertEqual(EventoSistema.objects.filter(tipo=PEDIDO_STATUS).count(), 4)
+
+    def test_limite_de_cartoes_por_coluna(self):
+        hoje = timezone.localdate()
+        Pedido.objects.bulk_create([
+            Pedido(cliente=self.dados.cliente, status_producao='Aguardando',
+                   previsto_entrega=hoje + datetime.timedelta(days=dias) if dias is not None else None)
+            for dias in (5, None, -3, 5, 1)
+        ])
+        resposta = self.client.get('/api/pedidos/producao/', {'por_coluna': 2})
+        self.assertEqual(resposta.status_code, 200)
+        colunas = {coluna['status']: coluna for coluna in resposta.json()['colunas']}
+        self.assertEqual(list(colunas), list(Pedido.STATUS_PRODUCAO))
+
+        for status_producao, coluna in colunas.items():
+            pedidos = Pedido.objects.filter(status_producao=status_producao)\
+                .order_by(F('previsto_entrega').asc(nulls_last=True), 'data_criacao', 'id')
+            with self.subTest(status_producao=status_producao):
+                self.assertEqual(coluna['total'], pedidos.count())
+                self.assertEqual([cartao['id'] for cartao in coluna['cartoes']], list(pedidos.values_list('id', flat=True)[:2]))
+        self.assertEqual(colunas['Aguardando']['total'], 6)
+
+
+class ReajustePrecosTests(ApiComDadosTestCase):
+    """ Reajuste de preços em massa: prévia, aplicação e auditoria. """
+
+    def reajustar(self, **corpo):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/produtos/reajuste-precos/', corpo, format='json')
+
+    def test_previa_igual_ao_gravado_nos_dois_modos(self):
+        Produto.objects.create(nome='Produto Quebrado', preco=Decimal('33.33'), custo=Decimal('7.77'))
+        casos = [
+            {'modo': ReajustePreco.Modo.PERCENTUAL, 'ajuste_preco': '7.50', 'ajuste_custo': '-3.00'},
+            {'modo': ReajustePreco.Modo.VALOR, 'ajuste_preco': '2.35', 'ajuste_custo': '-10.00',
+             'tipo_precificacao': Produto.TipoPrecificacao.UNICO},
+        ]
+        for caso in casos:
+            with self.subTest(modo=caso['modo']):
+                filtrados = Produto.objects.all()
+                if caso.get('tipo_precificacao'):
+                    filtrados = filtrados.filter(tipo_precificacao=caso['tipo_precificacao'])
+                antes = dict(Produto.objects.values_list('id', 'preco'))
+                reajustes = ReajustePreco.objects.count()
+
+                simulacao = self.reajustar(simular=True, **caso).json()
+                self.assertEqual(dict(Produto.objects.values_list('id', 'preco')), antes)
+                self.assertEqual(ReajustePreco.objects.count(), reajustes)
+
+                resposta = self.reajustar(**caso)
+                self.assertEqual(resposta.status_code, 201)
+                previa = {
+                    linha['id']: (Decimal(str(linha['novo_preco'])), Decimal(str(linha['novo_custo'])))
+                    for linha in resposta.json()['produtos']
+                }
+                self.assertEqual(previa, {
+                    linha['id']: (Decimal(str(linha['novo_preco'])), Decimal(str(linha['novo_custo'])))
+                    for linha in simulacao['produtos']
+                })
+                self.assertEqual(previa, {
+                    produto_id: (preco, custo) for produto_id, preco, custo in filtrados.values_list('id', 'preco', 'custo')
+                })
+                # Custo nunca fica negativo
+                self.assertTrue(all(custo >= 0 for _, custo in previa.values()))
+
+                reajuste = ReajustePreco.objects.get(pk=resposta.json()['reajuste']['id'])
+                self.assertEqual(reajuste.produtos_afetados, filtrados.count())
+                self.assertEqual(resposta.json()['reajuste']['produtos_afetados'], filtrados.count())
+                self.assertEqual((reajuste.modo, reajuste.usuario), (caso['modo'], self.usuario))
+
+        # Arredondamento a 2 casas: 33,33 × 1,075 e depois + 2,35
+        self.assertEqual(Produto.objects.get(nome='Produto Quebrado').preco, Decimal('38.18'))
+
+
+class GetCondicionalTests(ApiComDadosTestCase):
+    """ ETag/Last-Modified e 304 nas rotas com GET condicional (core/condicional.py). """
+
+    def revalidar(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_304_sem_serializar_e_nova_etag_apos_mudanca(self):
+        for url in ('/api/pedidos/', f'/api/pedidos/{self.dados.pedido.id}/', '/api/orcamentos/',
+                    f'/api/orcamentos/{self.dados.orcamento.id}/', '/api/produtos/',
+                    f'/api/produtos/{self.dados.produto.id}/', '/api/empresa-settings/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as consultas:
+                    resposta = self.revalidar(url, etag)
+                self.assertEqual(resposta.status_code, 304)
+                self.assertEqual(resposta.content, b'')
+                self.assertEqual(resposta['ETag'], etag)
+                self.assertLessEqual(len(consultas), 1)
+
+    def test_itens_pagamentos_e_cliente_mudam_a_etag_do_pedido(self):
+        url = f'/api/pedidos/{self.dados.pedido.id}/'
+        mudancas = [
+            lambda: self.client.post('/api/pagamentos/', {'pedido': self.dados.pedido.id, 'valor': '5.00'}, format='json'),
+            lambda: self.client.patch(f'/api/itens-pedido/{self.dados.item_pedido.id}/', {'quantidade': 9}, format='json'),
+            lambda: self.client.patch(f'/api/clientes/{self.dados.cliente.id}/', {'nome': 'Outro Nome'}, format='json'),
+            lambda: self.client.patch(f'/api/produtos/{self.dados.produto.id}/', {'nome': 'Outro Produto'}, format='json'),
+        ]
+        for mudanca in mudancas:
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                mudanca()
+            self.assertEqual(self.revalidar(url, etag).status_code, 200)
+
+    def test_exclusao_muda_a_etag_da_lista(self):
+        etag = self.client.get('/api/orcamentos/')['ETag']
+        Orcamento.objects.filter(pk=self.dados.orcamentos[-1]).delete()
+        self.assertEqual(self.revalidar('/api/orcamentos/', etag).status_code, 200)
+
+
+class CatalogoProdutosTests(ApiComDadosTestCase):
+    """ Cache em memória do catálogo de produtos (core/catalogo.py). """
+
+    def setUp(self):
+        super().setUp()
+        catalogo.invalidar()
+
+    def orcar(self):
+        resposta = self.client.post('/api/orcamentos/', {
+            'cliente_id': self.dados.cliente.id, 'itens_write': [{'produto': self.dados.produto.id, 'quantidade': 2}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        return Decimal(resposta.json()['valor_total'])
+
+    def test_gravar_produto_invalida_o_catalogo_para_a_proxima_requisicao(self):
+        self.assertEqual(self.orcar(), Decimal('100.00'))
+        produto = Produto.objects.get(pk=self.dados.produto.pk)
+        produto.preco = Decimal('80.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            produto.save()
+        self.assertEqual(self.orcar(), Decimal('160.00'))
+
+    def test_validacao_devolve_copia_e_id_novo_entra_na_versao_atual(self):
+        campo = ProdutoCatalogoRelatedField()
+        compartilhado = catalogo.obter(self.dados.produto.id)
+        validado = campo.to_internal_value(self.dados.produto.id)
+        self.assertEqual(validado.pk, compartilhado.pk)
+        self.assertIsNot(validado, compartilhado)
+
+        # Produto gravado sem passar pelos sinais (outro processo, antes da troca de versão chegar)
+        novo = Produto.objects.bulk_create([Produto(nome='Novo', preco=Decimal('5.00'))])[0]
+        antes = catalogo.produtos()
+        self.assertEqual(catalogo.obter(novo.id).nome, 'Novo')
+        self.assertNotIn(novo.id, antes, 'o dicionário já entregue não muda')
+        with CaptureQueriesContext(connection) as consultas:
+            catalogo.obter(novo.id)
+        self.assertEqual(len(consultas), 0)
+
+
+class InstrumentacaoTests(ApiComDadosTestCase):
+    """ Coletor de consultas e log por requisição (core/instrumentacao.py). """
+
+    def test_local_so_das_consultas_que_entram_entre_as_mais_lentas(self):
+        duracoes = [5, 1, 1, 1, 1, 1, 4, 1, 1, 6, 1]
+        relogio = iter([valor for duracao in duracoes for valor in (0, duracao / 1000)])
+        coletor = ColetorRequisicao(consultas_lentas=3)
+        with mock.patch('core.instrumentacao.time.perf_counter', lambda: next(relogio)), \
+                mock.patch('core.instrumentacao.local_da_chamada', return_value='core/x.py:1') as local:
+            for _ in duracoes:
+                coletor(lambda *args: None, 'SELECT 1', None, False, {})
+        # As três primeiras enchem o heap; depois só a de 4 ms e a de 6 ms entram
+        self.assertEqual(local.call_count, 5)
+        self.assertEqual([consulta['ms'] for consulta in coletor.mais_lentas(3)], [6.0, 5.0, 4.0])
+        self.assertTrue(all(consulta['local'] for consulta in coletor.mais_lentas(3)))
+
+        completo = ColetorRequisicao(consultas_lentas=3, locais_de_todas=True)
+        with connection.execute_wrapper(completo):
+            for _ in range(4):
+                Cliente.objects.count()
+        self.assertTrue(all(local.startswith('core/tests.py') for _, _, local in completo.consultas))
+
+    def test_linha_por_requisicao_em_debug_e_lentas_em_info(self):
+        with override_settings(INSTRUMENTACAO={'ativa': True}):
+            with self.assertNoLogs('core.desempenho', 'INFO'), self.assertLogs('core.desempenho', 'DEBUG') as log:
+                resposta = self.client.get('/api/clientes/')
+            self.assertIn('Server-Timing', resposta)
+            self.assertEqual(log.records[0].levelname, 'DEBUG')
+        with override_settings(INSTRUMENTACAO={'ativa': True, 'log_lentas_ms': 0}):
+            with self.assertLogs('core.desempenho', 'INFO') as log:
+                self.client.get('/api/clientes/')
+        self.assertEqual(json.loads(log.records[0].getMessage())['caminho'], '/api/clientes/')
+
+
+class MetricasTests(ApiComDadosTestCase):
+    """ Acesso ao /metrics e soma dos arquivos por processo (core/metricas.py). """
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.diretorio = Path(pasta.name)
+        ajuste = override_settings(METRICAS={'ativa': False, 'diretorio': pasta.name})
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def metricas(self, **cabecalhos):
+        return Client().get('/metrics', **cabecalhos)
+
+    def bearer(self, usuario):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(usuario)}'}
+
+    def test_exige_token_ou_staff(self):
+        self.assertEqual(self.metricas().status_code, 401)
+        self.assertEqual(self.metricas(HTTP_AUTHORIZATION='Bearer invalido').status_code, 401)
+        self.assertEqual(self.metricas(**self.bearer(self.usuario)).status_code, 403)
+        staff = User.objects.create_user('admin', is_staff=True)
+        self.assertEqual(self.metricas(**self.bearer(staff)).status_code, 200)
+
+        with override_settings(METRICAS={'diretorio': str(self.diretorio), 'token': 'segredo'}):
+            self.assertEqual(self.metricas(HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+            self.assertEqual(self.metricas(HTTP_AUTHORIZATION='Bearer outro').status_code, 401)
+        with override_settings(METRICAS={'diretorio': str(self.diretorio), 'publica': True}):
+            self.assertEqual(self.metricas().status_code, 200)
+
+    def test_arquivo_de_processo_encerrado_e_arquivado_sem_perder_contagens(self):
+        processo = subprocess.Popen([sys.executable, '-c', ''])
+        processo.wait()
+        serie = [[['cache', 'teste'], ['resultado', 'acerto']], 7]
+        (self.diretorio / f'{processo.pid}.json').write_text(json.dumps({CACHE_CONSULTAS.nome: [serie]}))
+        linha = 'cache_consultas_total{cache="teste",resultado="acerto"} 7'
+
+        for _ in range(2):
+            self.assertIn(linha, registro_metricas.exportar(self.diretorio).splitlines())
+            self.assertFalse((self.diretorio / f'{processo.pid}.json').exists())
+        self.assertTrue((self.diretorio / ARQUIVO_ENCERRADOS).exists())
+        self.assertTrue((self.diretorio / f'{os.getpid()}.json').exists(), 'o processo vivo mantém o arquivo')
+
+
+class ExtratoClienteTests(ApiComDadosTestCase):
+    """ Extrato do cliente com saldo acumulado e paginação por cursor (core/extrato.py). """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cliente = cls.dados.cliente_livre
+        momento = timezone.now().replace(microsecond=0) - datetime.timedelta(days=10)
+        # Dois pedidos no mesmo instante, com pagamentos no mesmo instante deles e um dia depois
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(cliente=cliente, data_criacao=momento, valor_total=Decimal('100.00')),
+            Pedido(cliente=cliente, data_criacao=momento, valor_total=Decimal('40.00')),
+            Pedido(cliente=cliente, data_criacao=momento + datetime.timedelta(days=2), valor_total=Decimal('75.50')),
+        ])
+        Pagamento.objects.bulk_create([
+            Pagamento(pedido=pedidos[1], valor=Decimal('40.00'), data=momento),
+            Pagamento(pedido=pedidos[0], valor=Decimal('30.00'), data=momento),
+            Pagamento(pedido=pedidos[0], valor=Decimal('70.00'), data=momento + datetime.timedelta(days=1)),
+            Pagamento(pedido=pedidos[2], valor=Decimal('25.50'), data=momento + datetime.timedelta(days=2)),
+        ])
+        cls.cliente = cliente
+
+    def pagina(self, limite, cursor=None):
+        parametros = {'limite': limite, **({'cursor': cursor} if cursor else {})}
+        resposta = self.client.get(f'/api/clientes/{self.cliente.id}/extrato/', parametros)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def paginas(self, limite):
+        linhas, cursor = [], None
+        while True:
+            corpo = self.pagina(limite, cursor)
+            linhas += corpo['movimentos']
+            cursor = corpo['proximo_cursor']
+            if not cursor:
+                return linhas
+
+    def test_saldo_continua_entre_paginas(self):
+        completo = self.pagina(500)['movimentos']
+        chave = lambda linhas: [(linha['tipo'], linha['id'], Decimal(str(linha['saldo']))) for linha in linhas]
+        for limite in (1, 2, 3):
+            with self.subTest(limite=limite):
+                self.assertEqual(chave(self.paginas(limite)), chave(completo))
+        self.assertEqual(len(completo), 7)
+        self.assertEqual(Decimal(str(completo[-1]['saldo'])), Decimal('50.00'))
+
+    def test_no_mesmo_instante_debitos_antes_dos_creditos(self):
+        linhas = self.paginas(1)
+        primeiros = [(linha['tipo'], Decimal(str(linha['saldo']))) for linha in linhas[:4]]
+        # Pedidos do instante (por id) e depois os pagamentos do mesmo instante (por id)
+        self.assertEqual(primeiros, [
+            ('PEDIDO', Decimal('100.00')), ('PEDIDO', Decimal('140.00')),
+            ('PAGAMENTO', Decimal('100.00')), ('PAGAMENTO', Decimal('70.00')),
+        ])
+        self.assertEqual([linha['tipo'] for linha in linhas[-2:]], ['PEDIDO', 'PAGAMENTO'])
+
+    def test_cursor_invalido(self):
+        antigo = base64.urlsafe_b64encode(json.dumps([timezone.now().isoformat(), 0, 1]).encode()).decode()
+        for cursor in ('nao-e-cursor', antigo):
+            resposta = self.client.get(f'/api/clientes/{self.cliente.id}/extrato/', {'cursor': cursor})
+            self.assertEqual(resposta.status_code, 400)
+
+
+class ContasReceberTests(ApiComDadosTestCase):
+    """ Faixas de atraso do relatório de contas a receber (RelatorioContasReceberView). """
+
+    def test_faixas_nos_limites_com_pagamentos_parciais(self):
+        hoje = timezone.localdate()
+        cliente = self.dados.cliente_livre
+        pendente, parcial, pago = (
+            Pedido.StatusPagamento.PENDENTE, Pedido.StatusPagamento.PARCIAL, Pedido.StatusPagamento.PAGO
+        )
+
+        def pedido(valor, dias_atraso, status=pendente, **campos):
+            previsto = None if dias_atraso is None else hoje - datetime.timedelta(days=dias_atraso)
+            return Pedido(cliente=cliente, valor_total=Decimal(valor), previsto_entrega=previsto,
+                          status_pagamento=status, **campos)
+
+        # Valores em potências de 2: cada soma de faixa só fecha com os pedidos certos
+        pedidos = Pedido.objects.bulk_create([
+            pedido(1, -1),                                   # a vencer
+            pedido(2, 0), pedido(4, 30),                     # 0-30
+            pedido(8, 31), pedido(16, 60),                   # 31-60
+            pedido(32, None, data_criacao=timezone.now() - datetime.timedelta(days=45)),  # 31-60 pela criação
+            pedido(64, 61), pedido(128, 90),                 # 61-90
+            pedido(256, 91, parcial),                        # 90+, 56 já pagos
+            pedido(512, 91, parcial),                        # pago por inteiro: fora do relatório
+            pedido(1024, 91, pago),
+        ])
+        Pagamento.objects.bulk_create([
+            Pagamento(pedido=pedidos[8], valor=Decimal('20.00')), Pagamento(pedido=pedidos[8], valor=Decimal('36.00')),
+            Pagamento(pedido=pedidos[9], valor=Decimal('512.00')),
+        ])
+
+        resposta = self.client.get('/api/relatorios/contas-a-receber/', {'page_size': 200})
+        self.assertEqual(resposta.status_code, 200)
+        linha = next(linha for linha in resposta.json()['results'] if linha['cliente_id'] == cliente.id)
+        faixas = {faixa: Decimal(str(linha[faixa])) for faixa in RelatorioContasReceberView.FAIXAS + ('total',)}
+        self.assertEqual(faixas, {
+            'a_vencer': Decimal('1'), 'dias_0_30': Decimal('6'), 'dias_31_60': Decimal('56'),
+            'dias_61_90': Decimal('192'), 'dias_90_mais': Decimal('200'), 'total': Decimal('455'),
+        })
+        self.assertEqual(linha['pedidos_em_aberto'], 9)
+
+
+@override_settings(SINCRONIZACAO={'margem_segundos': 0})
+class SincronizacaoTests(ApiComDadosTestCase):
+    """ Sincronização incremental por cursor (core/sincronizacao.py). """
+
+    def sincronizar(self, cursor=None, **parametros):
+        if cursor:
+            parametros['cursor'] = cursor
+        return self.client.get('/api/sincronizacao/', parametros)
+
+    def test_carga_inicial_paginada_e_sem_mudancas(self):
+        vistos, cursor, mais = {}, None, True
+        while mais:
+            corpo = self.sincronizar(cursor, limite=2).json()
+            for nome, linhas in corpo['alterados'].items():
+                vistos.setdefault(nome, set()).update(linha['id'] for linha in linhas)
+            cursor, mais = corpo['cursor'], corpo['mais']
+        self.assertEqual(vistos['pedidos'], set(Pedido.objects.values_list('id', flat=True)))
+        self.assertEqual(vistos['pagamentos'], set(Pagamento.objects.values_list('id', flat=True)))
+
+        with CaptureQueriesContext(connection) as consultas:
+            corpo = self.sincronizar(cursor).json()
+        self.assertFalse(any(corpo['alterados'].values()) or any(corpo['excluidos'].values()))
+        self.assertLessEqual(len(consultas), 6)
+
+    def test_alteracoes_e_exclusoes_desde_o_cursor(self):
+        cursor = self.sincronizar().json()['cursor']
+        pagamentos = sorted(Pagamento.objects.filter(pedido=self.dados.pedido).values_list('id', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/clientes/{self.dados.cliente.id}/', {'nome': 'Renomeado'}, format='json')
+            self.client.delete(f'/api/pedidos/{self.dados.pedido.id}/')
+
+        corpo = self.sincronizar(cursor).json()
+        self.assertEqual([cliente['nome'] for cliente in corpo['alterados']['clientes']], ['Renomeado'])
+        self.assertEqual(corpo['excluidos']['pedidos'], [self.dados.pedido.id])
+        # Os pagamentos saíram junto, na exclusão em cascata
+        self.assertEqual(sorted(corpo['excluidos']['pagamentos']), pagamentos)
+
+    def test_margem_rele_gravacoes_com_commit_atrasado(self):
+        cliente = Cliente.objects.filter(pk=self.dados.cliente.pk)
+        # Simula uma transação que gravou 'atualizado_em' antes da sincronização e fez commit depois
+        atrasar = lambda: cliente.update(atualizado_em=timezone.now() - datetime.timedelta(seconds=30))
+
+        cursor = self.sincronizar().json()['cursor']
+        atrasar()
+        self.assertEqual(self.sincronizar(cursor).json()['alterados']['clientes'], [])
+
+        with override_settings(SINCRONIZACAO={'margem_segundos': 60}):
+            cursor = self.sincronizar().json()['cursor']
+            atrasar()
+            corpo = self.sincronizar(cursor).json()
+            # Tudo o que está dentro da margem vem de novo; o upsert do cliente é idempotente
+            self.assertIn(self.dados.cliente.id, [linha['id'] for linha in corpo['alterados']['clientes']])
+            self.assertEqual(
+                len(corpo['alterados']['pedidos']), Pedido.objects.count(), 'a margem relê o que foi gravado nela'
+            )
+
+        # Sem margem, a chamada seguinte relê só a janela da margem anterior; depois dela nada se repete
+        cursor = self.sincronizar(corpo['cursor']).json()['cursor']
+        self.assertFalse(any(self.sincronizar(cursor).json()['alterados'].values()))
+
+    def test_cursor_invalido_e_expirado(self):
+        self.assertEqual(self.sincronizar('nao-e-um-cursor').status_code, 400)
+        with override_settings(SINCRONIZACAO={'retencao_exclusoes_dias': 0}):
+            cursor = self.sincronizar().json()['cursor']
+            resposta = self.sincronizar(cursor)
+        self.assertEqual(resposta.status_code, 410)
+        self.assertTrue(resposta.json()['reiniciar'])
+
+        agora = timezone.now()
+        # Retenção padrão de 90 dias: a posição das exclusões decide se o cursor ainda vale
+        antigo = sincronizacao.codificar_cursor({sincronizacao.EXCLUSOES: (agora - datetime.timedelta(days=91), 0)})
+        with self.assertRaises(sincronizacao.CursorExpirado):
+            sincronizacao.sincronizar(antigo)
+        recente = sincronizacao.codificar_cursor({sincronizacao.EXCLUSOES: (agora - datetime.timedelta(days=89), 0)})
+        self.assertIn('cursor', sincronizacao.sincronizar(recente))
+
+
+@override_settings(COMPRESSAO={'tamanho_minimo': 1024})
+class CompressaoTests(ApiComDadosTestCase):
+    """ Negociação e compressão das respostas (core/compressao.py). """
+    # Lista de pedidos acima do tamanho mínimo
+    quantidade = 10
+    itens = 3
+
+    def setUp(self):
+        super().setUp()
+        self.fabrica = RequestFactory()
+
+    def aplicar(self, resposta, accept_encoding):
+        request = self.fabrica.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressaoMiddleware(lambda request: resposta)(request)
+
+    def test_escolhe_a_codificacao_pelo_q(self):
+        self.assertEqual(escolher_codificacao('gzip, deflate, br'), 'br')
+        self.assertEqual(escolher_codificacao('gzip;q=1.0, br;q=0.5'), 'gzip')
+        self.assertEqual(escolher_codificacao('*;q=0.1, br;q=0'), 'gzip')
+        self.assertIsNone(escolher_codificacao('identity'))
+        self.assertIsNone(escolher_codificacao(''))
+
+    def test_lista_comprimida_decodifica_no_mesmo_json(self):
+        original = self.client.get('/api/pedidos/')
+        self.assertFalse(original.has_header('Content-Encoding'))
+        for codificacao, descomprimir in (('br', brotli.decompress), ('gzip', gzip.decompress)):
+            with self.subTest(codificacao=codificacao):
+                resposta = self.client.get('/api/pedidos/', HTTP_ACCEPT_ENCODING=codificacao)
+                self.assertEqual(resposta['Content-Encoding'], codificacao)
+                self.assertIn('Accept-Encoding', resposta['Vary'])
+                self.assertLess(len(resposta.content), len(original.content))
+                self.assertEqual(descomprimir(resposta.content), original.content)
+
+    def test_nao_comprime_pequeno_ja_comprimido_ou_no_transform(self):
+        pequeno = self.aplicar(HttpResponse(b'{}', content_type='application/json'), 'br')
+        imagem = self.aplicar(HttpResponse(b'x' * 5000, content_type='image/png'), 'br')
+        ja_codificado = HttpResponse(b'x' * 5000, content_type='application/json')
+        ja_codificado['Content-Encoding'] = 'gzip'
+        sem_transformacao = HttpResponse(b'x' * 5000, content_type='application/json')
+        sem_transformacao['Cache-Control'] = 'no-transform'
+        for resposta in (pequeno, imagem, self.aplicar(sem_transformacao, 'br')):
+            self.assertFalse(resposta.has_header('Content-Encoding'))
+        self.assertEqual(self.aplicar(ja_codificado, 'br')['Content-Encoding'], 'gzip')
+
+    def test_streaming_comprime_e_descarrega_cada_evento(self):
+        eventos = [f'data: {{"evento": {indice}}}\n\n'.encode() for indice in range(50)]
+        resposta = self.aplicar(StreamingHttpResponse(iter(eventos), content_type='text/event-stream'), 'gzip')
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        descompressor = zlib.decompressobj(31)
+        for pedaco, evento in zip(resposta.streaming_content, eventos):
+            # Cada pedaço já traz o evento inteiro (flush), sem esperar o próximo
+            self.assertEqual(descompressor.decompress(pedaco), evento)
+
+
+class SimulacaoPrecosTests(ApiComDadosTestCase):
+    """ Cenários de preço e custo sobre o snapshot de itens (core/simulacao.py). """
+    # Pedidos de hoje, de 20 e de 40 dias atrás; em cada um, um item do produto UNICO e um do M2
+    quantidade = 3
+    itens = 2
+
+    def setUp(self):
+        super().setUp()
+        snapshot_itens.invalidar()
+        self.produto_m2 = Produto.objects.get(nome='Produto 1')
+
+    def simular(self, **cenario):
+        return simular_cenarios(snapshot_itens.obter(), [cenario])[0]
+
+    def test_base_em_centavos_exatos(self):
+        base = resumo_base(snapshot_itens.obter())
+        # Subtotal 150 por item; custo 20 × 2 no UNICO e 20 × 1,00 × 1,50 × 2 no M2
+        self.assertEqual((base['itens'], base['receita'], base['custo']), (6, Decimal('900.00'), Decimal('300.00')))
+
+    def test_cenarios_por_tipo_produto_e_periodo(self):
+        todos = self.simular(ajuste_preco_m2=Decimal('10'), ajuste_custo=Decimal('5'))
+        self.assertEqual((todos['receita'], todos['custo']), (Decimal('945.00'), Decimal('315.00')))
+        self.assertEqual(todos['por_tipo']['M2'], {'receita': Decimal('495.00'), 'custo': Decimal('189.00')})
+        self.assertEqual(todos['variacao_lucro'], Decimal('30.00'))
+
+        # Só o produto M2 recebe os ajustes; o UNICO entra como foi vendido
+        produto = self.simular(produtos=[self.produto_m2.id], ajuste_preco_unidade=Decimal('10'),
+                               ajuste_preco_m2=Decimal('10'), ajuste_custo=Decimal('5'))
+        self.assertEqual((produto['receita'], produto['custo']), (Decimal('945.00'), Decimal('309.00')))
+        self.assertEqual(produto['por_tipo']['UNIDADE'], {'receita': Decimal('450.00'), 'custo': Decimal('120.00')})
+
+        # Só os pedidos dos últimos 30 dias, comparados com o realizado nesse período
+        hoje = timezone.localdate()
+        periodo = self.simular(data_inicio=hoje - datetime.timedelta(days=30), data_fim=hoje,
+                               ajuste_preco_unidade=Decimal('-10'), elasticidade=Decimal('1'))
+        # UNICO: preço 0,9 e volume 1,1 -> receita 2 × 150 × 0,99 e custo 2 × 40 × 1,1
+        self.assertEqual((periodo['receita'], periodo['custo']), (Decimal('597.00'), Decimal('208.00')))
+        self.assertEqual(periodo['variacao_receita'], Decimal('-3.00'))
+
+        vazio = self.simular(data_inicio=hoje + datetime.timedelta(days=1), ajuste_preco_m2=Decimal('10'))
+        self.assertEqual((vazio['receita'], vazio['margem_percentual']), (Decimal('0.00'), 0))
+
+    def test_snapshot_recarrega_quando_a_versao_muda(self):
+        snapshot = snapshot_itens.obter()
+        self.assertIs(snapshot_itens.obter(), snapshot)
+
+        ItemPedido.objects.create(pedido=self.dados.pedido, produto=self.produto_m2, quantidade=1,
+                                  largura=Decimal('2.00'), altura=Decimal('1.00'), subtotal=Decimal('100.00'))
+        self.assertIs(snapshot_itens.obter(), snapshot, 'sem troca de versão o snapshot é reaproveitado')
+
+        # Outro processo (o comando do cron) trocou a versão no cache compartilhado
+        caches['compartilhado'].set(CHAVE_VERSAO_SIMULACAO, 'outra-versao', None)
+        novo = snapshot_itens.obter()
+        self.assertIsNot(novo, snapshot)
+        self.assertEqual(len(novo), len(snapshot) + 1)
+        self.assertEqual(resumo_base(novo)['receita'], Decimal('1000.00'))
+
+    def test_cenario_pela_api(self):
+        hoje = timezone.localdate()
+        resposta = self.client.post('/api/simulacao/precos/', {'cenarios': [
+            {'nome': 'M2', 'ajuste_preco_m2': '10', 'produtos': [self.produto_m2.id]},
+        ]}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['cenarios'][0]['receita'], 945.0)
+
+        invalido = self.client.post('/api/simulacao/precos/', {'cenarios': [
+            {'data_inicio': str(hoje), 'data_fim': str(hoje - datetime.timedelta(days=1))},
+        ]}, format='json')
+        self.assertEqual(invalido.status_code, 400)
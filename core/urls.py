@@ -8,7 +8,9 @@ from .views import (
     RelatorioFaturamentoView, OrcamentoPDFView, PedidoPDFView, EmpresaSettingsView, UserProfileView, 
     ChangePasswordView, EmpresaPublicaView, EvolucaoVendasView, PedidosPorStatusView,
     ProdutosMaisVendidosView, ClientesMaisAtivosView, RelatorioClientesView, RelatorioPedidosView, RelatorioOrcamentosView,
-    RelatorioProdutosView
+    RelatorioProdutosView, ImportacaoCSVView, CotacaoLoteView, SegmentacaoClientesView,
+    RelatorioContasReceberView, ExtratoClientePDFView, ProjecaoFluxoCaixaView,
+    SimulacaoPrecosView, DashboardView, EventosView, PerfilListView, PerfilArquivoView, SincronizacaoView
 ) 
 
 router = DefaultRouter()
@@ -25,13 +27,17 @@ router.register(r'despesas-gerais', DespesaViewSet, basename='despesa')
 urlpatterns = [
     path('', include(router.urls)),
     path('public/empresa/', EmpresaPublicaView.as_view(), name='empresa-publica'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('eventos/', EventosView.as_view(), name='eventos'),
     path('dashboard-stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
     path('despesas/', DespesaConsolidadaView.as_view(), name='despesa-consolidada'),
+    path('fluxo-caixa/projecao/', ProjecaoFluxoCaixaView.as_view(), name='projecao-fluxo-caixa'),
     path('vendas-recentes/', VendasRecentesView.as_view(), name='vendas-recentes'),
     path('faturamento-por-pagamento/', FaturamentoPorPagamentoView.as_view(), name='faturamento-por-pagamento'),
     path('relatorios/faturamento/', RelatorioFaturamentoView.as_view(), name='relatorio-faturamento'),
     path('orcamentos/<int:pk>/pdf/', OrcamentoPDFView.as_view(), name='orcamento-pdf'),
     path('pedidos/<int:pk>/pdf/', PedidoPDFView.as_view(), name='pedido-pdf'),
+    path('clientes/<int:pk>/extrato/pdf/', ExtratoClientePDFView.as_view(), name='extrato-cliente-pdf'),
     path('empresa-settings/', EmpresaSettingsView.as_view(), name='empresa-settings'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('profile/change-password/', ChangePasswordView.as_view(), name='change-password'),
@@ -40,8 +46,16 @@ urlpatterns = [
     path('relatorios/produtos-mais-vendidos/', ProdutosMaisVendidosView.as_view(), name='produtos-mais-vendidos'),
     path('relatorios/clientes-mais-ativos/', ClientesMaisAtivosView.as_view(), name='clientes-mais-ativos'),
     path('relatorios/clientes/', RelatorioClientesView.as_view(), name='relatorio-clientes'),
+    path('relatorios/clientes/segmentos/', SegmentacaoClientesView.as_view(), name='segmentacao-clientes'),
     path('relatorios/pedidos/', RelatorioPedidosView.as_view(), name='relatorio-pedidos'),
+    path('relatorios/contas-a-receber/', RelatorioContasReceberView.as_view(), name='relatorio-contas-receber'),
     path('relatorios/orcamentos/', RelatorioOrcamentosView.as_view(), name='relatorio-orcamentos'),
     path('relatorios/produtos/', RelatorioProdutosView.as_view(), name='relatorio-produtos'),
+    path('importacao/<str:tipo>/', ImportacaoCSVView.as_view(), name='importacao-csv'),
+    path('cotacao/', CotacaoLoteView.as_view(), name='cotacao-lote'),
+    path('simulacao/precos/', SimulacaoPrecosView.as_view(), name='simulacao-precos'),
+    path('sincronizacao/', SincronizacaoView.as_view(), name='sincronizacao'),
+    path('perfis/', PerfilListView.as_view(), name='perfis'),
+    path('perfis/<str:nome>/', PerfilArquivoView.as_view(), name='perfil-arquivo'),
     
 ]
\ No newline at end of file
@@ -0,0 +1,164 @@
+# core/vendas_mensais.py
+"""
+Manutenção da tabela fato VendaProdutoMensal (produto × mês).
+
+Gravações de ItemPedido/Pedido marcam as células (produto, mês) afetadas; ao final
+da transação as células marcadas são recalculadas juntas, com uma consulta agrupada
+restrita aos produtos e meses marcados. A reconstrução completa usa a mesma agregação
+sobre a tabela inteira.
+
+Custo: não há custo gravado no item; a célula usa o custo de produção atual do
+produto no momento em que é recalculada, por unidade ou, para produtos M2, por m²
+(custo × largura × altura × quantidade). Consequências:
+- um mês passado muda de custo (e de lucro) quando o custo do produto é
+  reajustado e a célula é recalculada depois disso (uma venda, exclusão ou
+  mudança de data no mês, ou a reconstrução completa). Até lá, meses do mesmo
+  produto podem refletir custos de épocas diferentes; rodar
+  reconstruir_vendas_produtos depois de um reajuste de custo alinha todos ao atual;
+- o relatório de produtos calculava o custo ao vivo como custo × quantidade para
+  todos os produtos, também com o custo atual. Para produtos M2 o valor agora é
+  por área, que é como o custo desses produtos é cadastrado (Produto.custo: "por unidade
+  ou por metro quadrado").
+Guardar o custo histórico exigiria gravar o custo no ItemPedido na venda.
+"""
+import datetime
+import threading
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, DateField, DecimalField, ExpressionWrapper, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .db import bulk_upsert
+from .models import ItemPedido, Produto, VendaProdutoMensal
+from .precificacao import arredondar
+
+CAMPOS_FATO = ['quantidade', 'metros_quadrados', 'receita', 'custo', 'ultima_venda', 'atualizado_em']
+
+_pendentes = threading.local()
+
+
+def mes_de(data_hora):
+    """ Primeiro dia do mês (no fuso local) de uma data/hora. """
+    return timezone.localtime(data_hora).date().replace(day=1)
+
+
+def limites_do_mes(mes):
+    inicio = timezone.make_aware(datetime.datetime.combine(mes, datetime.time.min))
+    proximo = (mes + datetime.timedelta(days=32)).replace(day=1)
+    fim = timezone.make_aware(datetime.datetime.combine(proximo, datetime.time.min))
+    return inicio, fim
+
+
+def _agregacoes():
+    decimal = DecimalField(max_digits=16, decimal_places=4)
+    eh_m2 = Q(produto__tipo_precificacao=Produto.TipoPrecificacao.METRO_QUADRADO)
+    area = ExpressionWrapper(F('largura') * F('altura') * F('quantidade'), output_field=decimal)
+    return {
+        'total_quantidade': Sum('quantidade'),
+        'total_m2': Coalesce(Sum(Case(When(eh_m2, then=area), output_field=decimal)), Value(0), output_field=decimal),
+        'total_receita': Coalesce(Sum('subtotal'), Value(0), output_field=decimal),
+        'total_custo': Coalesce(Sum(Case(
+            When(eh_m2, then=F('produto__custo') * area),
+            default=F('produto__custo') * F('quantidade'),
+            output_field=decimal,
+        )), Value(0), output_field=decimal),
+        'ultima_venda': Max('pedido__data_criacao'),
+    }
+
+
+def _montar_fato(produto_id, mes, agregado):
+    return VendaProdutoMensal(
+        produto_id=produto_id,
+        mes=mes,
+        quantidade=agregado['total_quantidade'],
+        metros_quadrados=arredondar(agregado['total_m2']),
+        receita=arredondar(agregado['total_receita']),
+        custo=arredondar(agregado['total_custo']),
+        ultima_venda=timezone.localtime(agregado['ultima_venda']).date() if agregado['ultima_venda'] else None,
+    )
+
+
+def atualizar_celulas(celulas):
+    """
+    Recalcula as células {(produto, mês)} com uma única consulta agrupada
+    (restrita aos produtos e ao intervalo de meses marcados).
+    """
+    if not celulas:
+        return
+    meses = {mes for _, mes in celulas}
+    inicio, _ = limites_do_mes(min(meses))
+    _, fim = limites_do_mes(max(meses))
+    agregados = (
+        ItemPedido.objects.filter(
+            produto_id__in={produto_id for produto_id, _ in celulas},
+            pedido__data_criacao__gte=inicio,
+            pedido__data_criacao__lt=fim,
+        )
+        .annotate(mes=TruncMonth('pedido__data_criacao', output_field=DateField()))
+        .order_by()
+        .values('produto_id', 'mes')
+        .annotate(**_agregacoes())
+    )
+    fatos = [
+        _montar_fato(agregado['produto_id'], agregado['mes'], agregado)
+        for agregado in agregados
+        if (agregado['produto_id'], agregado['mes']) in celulas and agregado['total_quantidade']
+    ]
+    if fatos:
+        bulk_upsert(VendaProdutoMensal, fatos, ['produto', 'mes'], CAMPOS_FATO)
+
+    # Células que ficaram sem vendas (itens excluídos ou movidos de mês)
+    vazias = set(celulas) - {(fato.produto_id, fato.mes) for fato in fatos}
+    if vazias:
+        VendaProdutoMensal.objects.filter(
+            reduce(or_, (Q(produto_id=produto_id, mes=mes) for produto_id, mes in vazias))
+        ).delete()
+
+
+def _processar_pendentes():
+    celulas = getattr(_pendentes, 'celulas', set())
+    _pendentes.celulas = set()
+    atualizar_celulas(celulas)
+
+
+def marcar_para_atualizar(produto_id, data_hora):
+    """
+    Marca a célula (produto, mês da data) para recálculo ao final da transação.
+    Várias gravações do mesmo pedido (ex: itens recriados) geram um único recálculo.
+    """
+    if produto_id is None or data_hora is None:
+        return
+    if not hasattr(_pendentes, 'celulas'):
+        _pendentes.celulas = set()
+    _pendentes.celulas.add((produto_id, mes_de(data_hora)))
+    transaction.on_commit(_processar_pendentes)
+
+
+def reconstruir_vendas_produtos(tamanho_lote=2000):
+    """ Refaz a tabela inteira com uma consulta agrupada. Retorna o número de células. """
+    inicio = timezone.now()
+    agregados = (
+        ItemPedido.objects.filter(produto__isnull=False)
+        .annotate(mes=TruncMonth('pedido__data_criacao', output_field=DateField()))
+        .order_by()
+        .values('produto_id', 'mes')
+        .annotate(**_agregacoes())
+    )
+
+    total = 0
+    lote = []
+    for agregado in agregados.iterator(chunk_size=tamanho_lote):
+        lote.append(_montar_fato(agregado['produto_id'], agregado['mes'], agregado))
+        if len(lote) >= tamanho_lote:
+            bulk_upsert(VendaProdutoMensal, lote, ['produto', 'mes'], CAMPOS_FATO)
+            total += len(lote)
+            lote = []
+    if lote:
+        bulk_upsert(VendaProdutoMensal, lote, ['produto', 'mes'], CAMPOS_FATO)
+        total += len(lote)
+
+    VendaProdutoMensal.objects.filter(atualizado_em__lt=inicio).delete()
+    return total
@@ -1,24 +1,38 @@
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, status, filters, generics
+from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
 from .models import Pedido, Despesa
 from django.db import transaction
 import datetime
-from django.http import HttpResponse
+import io
+import time
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from django.template.loader import render_to_string
 from weasyprint import HTML, CSS
 from django.shortcuts import get_object_or_404
-from rest_framework.permissions import AllowAny
+from django.urls import reverse
+from rest_framework.permissions import AllowAny, IsAdminUser
 from django.db.models import Avg, Sum, Q, Value, CharField, Max, F, ExpressionWrapper, fields, Count, DecimalField, Case, When
+from django.db.models import OuterRef, Subquery
 from django.utils import timezone
-from django.db.models.functions import TruncMonth, Coalesce
+from django.db.models.functions import TruncMonth, TruncDate, Coalesce, Greatest, Round, RowNumber
+from django.db.models import Window
+from decimal import Decimal
 
 from .models import (
-    Cliente, Produto, Orcamento, ItemOrcamento, Pedido, ItemPedido, Pagamento, Empresa
+    Cliente, Produto, Orcamento, ItemOrcamento, Pedido, ItemPedido, Pagamento, Empresa, ReajustePreco,
+    EstatisticaCliente, VendaProdutoMensal
 )
 from .serializers import (
     ClienteSerializer, ProdutoSerializer, OrcamentoSerializer,
@@ -26,14 +40,41 @@ from .serializers import (
     DespesaSerializer, EmpresaSerializer, UserSerializer, ChangePasswordSerializer, EmpresaPublicaSerializer, RelatorioClienteSerializer,
     RelatorioPedidosAtrasadosSerializer, FormaPagamentoAgrupadoSerializer, StatusOrcamentoAgrupadoSerializer, 
     ProdutosOrcadosAgrupadoSerializer, RelatorioOrcamentoRecenteSerializer, RelatorioProdutoVendidoSerializer,
-    RelatorioProdutoLucrativoSerializer, RelatorioProdutoBaixaDemandaSerializer
+    RelatorioProdutoLucrativoSerializer, RelatorioProdutoBaixaDemandaSerializer, ReajustePrecoSerializer,
+    CotacaoSerializer, EstatisticaClienteSerializer, MovimentoExtratoSerializer, SimulacaoSerializer,
+    CartaoProducaoSerializer, TransicaoProducaoSerializer, ConversaoLoteSerializer
 )
+from .importacao import IMPORTADORES, ArquivoIlegivel, importar_clientes
+from .precificacao import carregar_tabela_precos, precificar_linhas
+from .catalogo import catalogo
+from .extrato import movimentos_cliente
+from .fluxo_caixa import DIAS_MAXIMO, DIAS_PADRAO, projecao_fluxo_caixa
+from .simulacao import resumo_base, simular_cenarios, snapshot_itens
+from .concorrencia import executar_em_paralelo
+from .condicional import GetCondicionalMixin, calcular_etag, responder_condicional
+from .instrumentacao import medir
+from .metricas import medir_relatorio, registrar_pdf
+from .perfis import arquivo_do_perfil, listar_perfis, configuracao as configuracao_perfis
+from .conversao import JA_CONVERTIDO, converter_orcamentos
+from .sincronizacao import CursorExpirado, sincronizar
+from .eventos import PEDIDO_STATUS, fluxo_eventos, publicar
+from .dashboard import (
+    WIDGETS, ContextoDashboard, widget_stats, widget_vendas_recentes, widget_faturamento_por_pagamento,
+    widget_evolucao_vendas, widget_pedidos_por_status, widget_produtos_mais_vendidos, widget_clientes_mais_ativos
+)
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 from django.db.models.functions import TruncMonth
 from django.db.models import Count
 
 
+class PaginacaoRelatorio(PageNumberPagination):
+    """ Paginação das listas de relatórios (?page=2&page_size=50). """
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 def get_date_range(request):
     """
     Pega 'data_inicio' e 'data_fim' dos parâmetros da URL.
@@ -56,21 +97,82 @@ def get_date_range(request):
     return start_of_month, today
 
 
+def renderizar_pdf(html_string, documento):
+    """ Gera o PDF com o WeasyPrint, registrando tempo e tamanho nas métricas do tipo de documento. """
+    inicio = time.perf_counter()
+    with medir('weasyprint'):
+        pdf = HTML(string=html_string).write_pdf()
+    registrar_pdf(documento, time.perf_counter() - inicio, len(pdf))
+    return pdf
+
+
+# limite_consultas: máximo de consultas SQL por ação (ViewSets) ou por método HTTP
+# (APIViews), com os caches frios. Não pode depender do tamanho da página nem do
+# número de itens; core/tests.py verifica cada rota.
+
 class ClienteViewSet(viewsets.ModelViewSet):
     queryset = Cliente.objects.all().order_by('-data_cadastro')
     serializer_class = ClienteSerializer
+    limite_consultas = {'list': 3, 'create': 5, 'retrieve': 2, 'update': 6, 'partial_update': 5, 'destroy': 7, 'extrato': 3}
     
     # --- A MÁGICA ESTÁ AQUI ---
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     # Define os campos pelos quais podemos fazer uma busca textual
-    search_fields = ['nome', 'cpf_cnpj', 'email']
+    search_fields = ['nome', 'cpf_cnpj', 'cpf_cnpj_normalizado', 'email']
+
+    @action(detail=True, methods=['get'])
+    def extrato(self, request, pk=None):
+        """
+        Extrato do cliente: pedidos e pagamentos em ordem de data, com saldo acumulado.
+        Paginação por cursor: ?limite=50&cursor=<valor de 'proximo_cursor' da página anterior>.
+        """
+        cliente = self.get_object()
+        try:
+            limite = min(max(int(request.query_params.get('limite', 50)), 1), 500)
+        except ValueError:
+            limite = 50
+
+        try:
+            movimentos, proximo_cursor = movimentos_cliente(
+                cliente.pk, cursor=request.query_params.get('cursor'), limite=limite
+            )
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'cliente': {'id': cliente.id, 'nome': cliente.nome},
+            'movimentos': MovimentoExtratoSerializer(movimentos, many=True).data,
+            'proximo_cursor': proximo_cursor,
+        })
 
-class ProdutoViewSet(viewsets.ModelViewSet):
+def expressao_reajuste(campo, modo, ajuste):
+    """
+    Expressão SQL (F()) com o novo valor de 'campo' após o reajuste,
+    arredondada a 2 casas e nunca negativa.
+    """
+    if not ajuste:
+        return F(campo)
+    if modo == ReajustePreco.Modo.PERCENTUAL:
+        novo_valor = F(campo) * Value(1 + ajuste / 100)
+    else:
+        novo_valor = F(campo) + Value(ajuste)
+    return Round(
+        Greatest(novo_valor, Value(Decimal('0'))), 2,
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+class ProdutoViewSet(GetCondicionalMixin, viewsets.ModelViewSet):
     """
     Endpoint da API que permite aos produtos serem visualizados ou editados.
     Permite filtrar por tipo_precificacao (ex: /api/produtos/?tipo_precificacao=M2)
+    Lista e detalhe respondem 304 com If-None-Match (ver core/condicional.py).
     """
     serializer_class = ProdutoSerializer
+    limite_consultas = {
+        'list': 4, 'create': 2, 'retrieve': 3, 'update': 3, 'partial_update': 3, 'destroy': 7,
+        'reajuste_precos': 6, 'historico_reajustes': 3,
+    }
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['nome']
 
@@ -81,10 +183,70 @@ class ProdutoViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(tipo_precificacao=tipo)
         return queryset
 
+    @action(detail=False, methods=['post'], url_path='reajuste-precos')
+    def reajuste_precos(self, request):
+        """
+        Reajusta preço e custo de vários produtos com um único UPDATE (expressões F()).
+        A prévia (novo_preco/novo_custo) sai de um único SELECT com as mesmas expressões;
+        com "simular": true nada é gravado. Cada reajuste aplicado gera um ReajustePreco.
+
+        Ao aplicar, o SELECT da prévia bloqueia as linhas (select_for_update) na mesma
+        transação do UPDATE: os valores devolvidos são exatamente os gravados. A simulação
+        não bloqueia nada e é só indicativa: se preços ou custos mudarem antes de aplicar,
+        o reajuste aplicado parte dos valores do momento da aplicação.
+        """
+        serializer = ReajustePrecoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+
+        produtos = Produto.objects.all()
+        if dados.get('tipo_precificacao'):
+            produtos = produtos.filter(tipo_precificacao=dados['tipo_precificacao'])
+        if dados.get('produtos_filtrados'):
+            produtos = produtos.filter(id__in=dados['produtos_filtrados'])
+
+        modo = dados.get('modo', ReajustePreco.Modo.PERCENTUAL)
+        novo_preco = expressao_reajuste('preco', modo, dados.get('ajuste_preco'))
+        novo_custo = expressao_reajuste('custo', modo, dados.get('ajuste_custo'))
 
-class OrcamentoViewSet(viewsets.ModelViewSet):
+        with transaction.atomic():
+            consulta = produtos if dados['simular'] else produtos.select_for_update()
+            previa = list(
+                consulta.annotate(novo_preco=novo_preco, novo_custo=novo_custo)
+                .order_by('nome')
+                .values('id', 'nome', 'tipo_precificacao', 'preco', 'novo_preco', 'custo', 'novo_custo')
+            )
+            if dados['simular']:
+                return Response({'simulacao': True, 'produtos_afetados': len(previa), 'produtos': previa})
+
+            afetados = produtos.update(preco=novo_preco, custo=novo_custo, atualizado_em=timezone.now())
+            # update() não dispara post_save: invalida o catálogo manualmente
+            transaction.on_commit(catalogo.invalidar)
+            reajuste = serializer.save(usuario=request.user, produtos_afetados=afetados)
+
+        return Response(
+            {'simulacao': False, 'reajuste': ReajustePrecoSerializer(reajuste).data, 'produtos': previa},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get'], url_path='reajustes')
+    def historico_reajustes(self, request):
+        """ Histórico (auditoria) dos reajustes em massa aplicados. """
+        page = self.paginate_queryset(ReajustePreco.objects.all())
+        serializer = ReajustePrecoSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class OrcamentoViewSet(GetCondicionalMixin, viewsets.ModelViewSet):
     queryset = Orcamento.objects.all().order_by('-data_criacao')
     serializer_class = OrcamentoSerializer
+    # GET condicional: o cliente e os produtos dos itens aparecem na resposta
+    campos_versao = ('atualizado_em', 'cliente__atualizado_em')
+    usa_catalogo = True
+    limite_consultas = {
+        'list': 6, 'create': 6, 'retrieve': 5, 'update': 11, 'partial_update': 8, 'destroy': 8,
+        'converter_para_pedido': 22, 'converter_em_lote': 14,
+    }
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['cliente__nome', 'id']
 
@@ -94,7 +256,8 @@ class OrcamentoViewSet(viewsets.ModelViewSet):
         """
         return (
             Orcamento.objects
-            .all()
+            .select_related('cliente')
+            .prefetch_related('itens')
             .order_by('-data_criacao')
             .exclude(status='Aprovado')
         )
@@ -120,6 +283,8 @@ class OrcamentoViewSet(viewsets.ModelViewSet):
             print(serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         self.perform_update(serializer)
+        # Os itens pré-carregados (prefetch_related) foram substituídos: descarta o cache
+        instance._prefetched_objects_cache = {}
         return Response(serializer.data)
 
     # ---------------------------------------------------------
@@ -132,85 +297,159 @@ class OrcamentoViewSet(viewsets.ModelViewSet):
         a descricao_customizada de cada item.
         """
         orcamento = self.get_object()
+        pedidos, recusados = converter_orcamentos([orcamento.id])
 
-        # Evita conversão duplicada: OneToOneField cria o reverse accessor "pedido"
-        if hasattr(orcamento, 'pedido'):
-            return Response(
-                {'error': 'Este orçamento já foi convertido em um pedido.'},
-                status=status.HTTP_409_CONFLICT
-            )
-
-        itens_orc = list(orcamento.itens.all())
-        if not itens_orc:
-            return Response(
-                {'error': 'Este orçamento não possui itens para converter.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        with transaction.atomic():
-            novo_pedido = Pedido.objects.create(
-                cliente=orcamento.cliente,
-                orcamento_origem=orcamento,
-                valor_total=0,  # será recalculado depois
-                status_producao='Aguardando',
-                status_pagamento=Pedido.StatusPagamento.PENDENTE,
-            )
-
-            itens_para_criar = []
-            for io in itens_orc:
-                itens_para_criar.append(
-                    ItemPedido(
-                        pedido=novo_pedido,
-                        produto=io.produto,  # pode ser None se for item manual
-                        quantidade=io.quantidade,
-                        largura=io.largura,
-                        altura=io.altura,
-                        descricao_customizada=io.descricao_customizada,
-                        subtotal=io.subtotal,
-                    )
-                )
-
-            ItemPedido.objects.bulk_create(itens_para_criar)
+        if recusados:
+            motivo = recusados[orcamento.id]
+            codigo = status.HTTP_409_CONFLICT if motivo == JA_CONVERTIDO else status.HTTP_400_BAD_REQUEST
+            return Response({'error': motivo}, status=codigo)
 
-            # Atualiza status do orçamento e recalcula total do pedido
-            orcamento.status = 'Aprovado'
-            orcamento.save(update_fields=['status'])
-
-            if hasattr(novo_pedido, 'recalcular_total'):
-                novo_pedido.recalcular_total()
-
-        serializer = PedidoSerializer(novo_pedido)
+        serializer = PedidoSerializer(pedidos[0])
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], url_path='converter-em-lote')
+    def converter_em_lote(self, request):
+        """
+        Converte vários orçamentos em pedidos numa única transação, com os pedidos e
+        itens criados em lote. Body: {"orcamentos": [1, 2, 3]}. Orçamentos já convertidos,
+        sem itens ou inexistentes são devolvidos em "recusados" com o motivo.
+        """
+        serializer = ConversaoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        pedidos, recusados = converter_orcamentos(serializer.validated_data['orcamentos'])
+        return Response({
+            'convertidos': [
+                {'orcamento': pedido.orcamento_origem_id, 'pedido': pedido.id, 'valor_total': pedido.valor_total}
+                for pedido in pedidos
+            ],
+            'recusados': [{'orcamento': orcamento_id, 'motivo': motivo} for orcamento_id, motivo in recusados.items()],
+        }, status=status.HTTP_201_CREATED if pedidos else status.HTTP_200_OK)
+
 class ItemOrcamentoViewSet(viewsets.ModelViewSet):
     queryset = ItemOrcamento.objects.all()
     serializer_class = ItemOrcamentoSerializer
+    limite_consultas = {'list': 4, 'create': 1, 'retrieve': 3, 'update': 5, 'partial_update': 5, 'destroy': 4}
 
 
-class PedidoViewSet(viewsets.ModelViewSet):
+class PedidoViewSet(GetCondicionalMixin, viewsets.ModelViewSet):
     """
     Endpoint da API que permite aos pedidos serem visualizados ou editados.
     A lista é ordenada pelos pedidos mais recentes.
+    Lista e detalhe respondem 304 com If-None-Match (ver core/condicional.py).
     """
     serializer_class = PedidoSerializer
-    queryset = Pedido.objects.all().order_by('-data_criacao')
+    campos_versao = ('atualizado_em', 'cliente__atualizado_em')
+    usa_catalogo = True
+    limite_consultas = {
+        'list': 7, 'create': 14, 'retrieve': 6, 'update': 21, 'partial_update': 16, 'destroy': 15,
+        'quadro_producao': 3, 'transicao_producao': 6,
+    }
+    queryset = Pedido.objects.select_related('cliente')\
+        .prefetch_related('itens', 'pagamentos')\
+        .order_by('-data_criacao')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['cliente__nome', 'id']
 
+    @action(detail=False, methods=['get'], url_path='producao')
+    def quadro_producao(self, request):
+        """
+        Quadro (kanban) de produção: contagem por status_producao e os N primeiros cartões
+        de cada coluna (?por_coluna=20), por previsão de entrega. Sempre duas consultas:
+        uma agrupada para as contagens e uma com ROW_NUMBER() por coluna para os cartões.
+        """
+        try:
+            por_coluna = min(max(int(request.query_params.get('por_coluna', 20)), 1), 100)
+        except ValueError:
+            por_coluna = 20
+
+        contagens = dict(
+            Pedido.objects.order_by().values_list('status_producao').annotate(total=Count('id'))
+        )
+        cartoes = Pedido.objects.select_related('cliente').annotate(
+            posicao=Window(
+                RowNumber(),
+                partition_by=[F('status_producao')],
+                order_by=[F('previsto_entrega').asc(nulls_last=True), F('data_criacao').asc(), F('id').asc()],
+            )
+        ).filter(posicao__lte=por_coluna).order_by('status_producao', 'posicao')
+
+        por_status = {}
+        for pedido in cartoes:
+            por_status.setdefault(pedido.status_producao, []).append(pedido)
+
+        # Colunas conhecidas na ordem do fluxo; status fora do padrão vão ao final
+        nomes = list(Pedido.STATUS_PRODUCAO) + sorted(set(contagens) - set(Pedido.STATUS_PRODUCAO))
+        colunas = [
+            {
+                'status': nome,
+                'total': contagens.get(nome, 0),
+                'cartoes': CartaoProducaoSerializer(por_status.get(nome, []), many=True).data,
+            }
+            for nome in nomes
+        ]
+        return Response({'por_coluna': por_coluna, 'colunas': colunas})
+
+    @action(detail=False, methods=['post'], url_path='transicao-producao')
+    def transicao_producao(self, request):
+        """
+        Move vários pedidos para um status_producao com um único UPDATE, sem tocar nos
+        itens nem recalcular totais. Ao chegar em 'Finalizado' grava data_producao = hoje.
+        Body: {"pedidos": [1, 2, 3], "status_producao": "Em Produção"}
+        """
+        serializer = TransicaoProducaoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['pedidos'])
+        novo_status = serializer.validated_data['status_producao']
+
+        campos = {'status_producao': novo_status, 'atualizado_em': timezone.now()}
+        if novo_status == Pedido.STATUS_FINALIZADO:
+            campos['data_producao'] = timezone.localdate()
+
+        with transaction.atomic():
+            encontrados = list(
+                Pedido.objects.select_for_update().filter(id__in=ids)
+                .values_list('id', 'cliente_id', 'status_producao', 'status_pagamento')
+            )
+            movidos = [linha for linha in encontrados if linha[2] != novo_status]
+            Pedido.objects.filter(id__in=[linha[0] for linha in movidos]).update(**campos)
+
+            # update() não dispara post_save: publica os eventos de status manualmente
+            for pedido_id, cliente_id, status_anterior, status_pagamento in movidos:
+                publicar(
+                    PEDIDO_STATUS,
+                    pedido_id=pedido_id,
+                    cliente_id=cliente_id,
+                    status_producao=novo_status,
+                    status_pagamento=status_pagamento,
+                    status_producao_anterior=status_anterior,
+                    status_pagamento_anterior=status_pagamento,
+                )
+
+        return Response({
+            'status_producao': novo_status,
+            'atualizados': sorted(linha[0] for linha in movidos),
+            'ja_no_status': sorted(linha[0] for linha in encontrados if linha[2] == novo_status),
+            'nao_encontrados': sorted(ids - {linha[0] for linha in encontrados}),
+        })
+
 class ItemPedidoViewSet(viewsets.ModelViewSet):
     queryset = ItemPedido.objects.all()
     serializer_class = ItemPedidoSerializer
+    limite_consultas = {'list': 4, 'create': 1, 'retrieve': 3, 'update': 8, 'partial_update': 8, 'destroy': 7}
 
 
 class DespesaViewSet(viewsets.ModelViewSet):
     queryset = Despesa.objects.all().order_by('-data')
     serializer_class = DespesaSerializer
+    limite_consultas = {'list': 3, 'create': 2, 'retrieve': 2, 'update': 3, 'partial_update': 3, 'destroy': 3}
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['descricao', 'categoria']
 
 # --- VIEW CUSTOMIZADA PARA LISTAGEM UNIFICADA ---
 class DespesaConsolidadaView(APIView):
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 3}
     def get(self, request, *args, **kwargs):
         despesas_gerais = Despesa.objects.annotate(tipo=Value('Geral', output_field=CharField())).values('id', 'descricao', 'valor', 'data', 'categoria', 'tipo')
         custos_producao = Pedido.objects.filter(custo_producao__gt=0).annotate(tipo=Value('Produção', output_field=CharField())).values('id', 'custo_producao', 'data_criacao', 'tipo', 'cliente__nome')
@@ -222,29 +461,74 @@ class DespesaConsolidadaView(APIView):
 
 class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 5}
     def get(self, request, *args, **kwargs):
-        data_inicio, data_fim = get_date_range(request)
+        return Response(widget_stats(ContextoDashboard(*get_date_range(request))))
 
-        # Filtra os pedidos e despesas pelo período selecionado
-        pedidos_no_periodo = Pedido.objects.filter(data_criacao__date__range=[data_inicio, data_fim])
-        despesas_gerais_no_periodo = Despesa.objects.filter(data__range=[data_inicio, data_fim])
 
-        faturamento = pedidos_no_periodo.aggregate(total=Sum('valor_total'))['total'] or 0
-        despesas_operacionais = despesas_gerais_no_periodo.aggregate(total=Sum('valor'))['total'] or 0
-        custo_producao_pedidos = pedidos_no_periodo.aggregate(total=Sum('custo_producao'))['total'] or 0
-        despesas_totais = despesas_operacionais + custo_producao_pedidos
-        lucro = faturamento - custo_producao_pedidos
-        
-        # Valor a Receber continua sendo global, não depende do filtro de data
-        pedidos_nao_quitados = Pedido.objects.filter(Q(status_pagamento='PENDENTE') | Q(status_pagamento='PARCIAL'))
-        total_devido = pedidos_nao_quitados.aggregate(total=Sum('valor_total'))['total'] or 0
-        total_pago_parcialmente = Pagamento.objects.filter(pedido__in=pedidos_nao_quitados).aggregate(total=Sum('valor'))['total'] or 0
-        a_receber = total_devido - total_pago_parcialmente
+class DashboardView(APIView):
+    """
+    Dashboard composto: calcula vários widgets em uma única requisição
+    (?widgets=stats,vendas_recentes,...; sem o parâmetro, todos) para o período
+    de ?data_inicio=&data_fim=. Os widgets rodam em paralelo e o tempo de cada um
+    vai no cabeçalho Server-Timing.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 14}
 
-        data = {'faturamento': faturamento, 'despesas': despesas_totais, 'lucro': lucro, 'valor_a_receber': a_receber}
-        return Response(data)
+    @medir_relatorio('dashboard')
+    def get(self, request, *args, **kwargs):
+        nomes = [nome.strip() for nome in request.query_params.get('widgets', '').split(',') if nome.strip()]
+        nomes = nomes or list(WIDGETS)
+        desconhecidos = [nome for nome in nomes if nome not in WIDGETS]
+        if desconhecidos:
+            return Response(
+                {'error': f"Widgets desconhecidos: {', '.join(desconhecidos)}.", 'widgets_disponiveis': list(WIDGETS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        contexto = ContextoDashboard(*get_date_range(request))
+        tempos = {}
+
+        def medido(nome):
+            def executar():
+                inicio = time.perf_counter()
+                try:
+                    return WIDGETS[nome](contexto)
+                finally:
+                    tempos[nome] = (time.perf_counter() - inicio) * 1000
+            return executar
+
+        dados = executar_em_paralelo({nome: medido(nome) for nome in dict.fromkeys(nomes)})
+        response = Response({
+            'periodo': {'data_inicio': contexto.data_inicio, 'data_fim': contexto.data_fim},
+            'widgets': dados,
+        })
+        response['Server-Timing'] = ', '.join(
+            f'widget-{nome.replace("_", "-")};dur={tempo:.1f}' for nome, tempo in tempos.items()
+        )
+        return response
     
 
+class ProjecaoFluxoCaixaView(APIView):
+    """
+    Projeção do fluxo de caixa dia a dia (?dias=30, máximo 180): recebimentos esperados
+    dos pedidos em aberto e despesas recorrentes. Calculada uma vez por dia;
+    ?recalcular=true força o recálculo.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 5}
+
+    @medir_relatorio('fluxo_caixa')
+    def get(self, request, *args, **kwargs):
+        try:
+            dias = min(max(int(request.query_params.get('dias', DIAS_PADRAO)), 1), DIAS_MAXIMO)
+        except ValueError:
+            dias = DIAS_PADRAO
+        recalcular = request.query_params.get('recalcular', '').lower() in ('1', 'true')
+        return Response(projecao_fluxo_caixa(dias, recalcular=recalcular))
+
+
 class PagamentoViewSet(viewsets.ModelViewSet):
     """
     Endpoint da API para gerenciar pagamentos.
@@ -252,6 +536,7 @@ class PagamentoViewSet(viewsets.ModelViewSet):
     """
     queryset = Pagamento.objects.all()
     serializer_class = PagamentoSerializer
+    limite_consultas = {'list': 3, 'create': 9, 'retrieve': 2, 'update': 5, 'partial_update': 4, 'destroy': 5}
 
     def perform_create(self, serializer):
         """
@@ -284,41 +569,22 @@ class VendasRecentesView(APIView):
     View customizada que retorna os 5 pedidos mais recentes.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 5}
 
     def get(self, request, *args, **kwargs):
-        # 1. Busca todos os pedidos no banco de dados
-        # 2. Ordena pelos mais recentes (data de criação decrescente)
-        # 3. Pega apenas os 5 primeiros resultados
-        ultimos_pedidos = Pedido.objects.all().order_by('-data_criacao')[:5]
-        
-        # 4. Usa o PedidoSerializer que já temos para formatar os dados
-        serializer = PedidoSerializer(ultimos_pedidos, many=True)
-        
-        # 5. Retorna os dados formatados
-        return Response(serializer.data)
+        return Response(widget_vendas_recentes(ContextoDashboard()))
     
 
 class FaturamentoPorPagamentoView(APIView):
     """
-    View customizada que retorna o faturamento total do mês,
-    agrupado por forma de pagamento.
+    View customizada que retorna o faturamento total do mês
+    (ou do período ?data_inicio=&data_fim=), agrupado por forma de pagamento.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2}
 
     def get(self, request, *args, **kwargs):
-        today = datetime.date.today()
-        start_of_month = today.replace(day=1)
-
-        # 1. Busca todos os pagamentos do mês atual
-        # 2. Usa .values() para agrupar por 'forma_pagamento'
-        # 3. Usa .annotate() para criar um novo campo 'total' com a soma dos valores de cada grupo
-        # 4. Ordena do maior para o menor total
-        faturamento_agrupado = Pagamento.objects.filter(data__gte=start_of_month)\
-            .values('forma_pagamento')\
-            .annotate(total=Sum('valor'))\
-            .order_by('-total')
-
-        return Response(faturamento_agrupado)
+        return Response(widget_faturamento_por_pagamento(ContextoDashboard(*get_date_range(request))))
     
 
 
@@ -327,6 +593,7 @@ class RelatorioFaturamentoView(APIView):
     View para gerar e retornar um relatório de faturamento em PDF.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 3}
 
     def get(self, request, *args, **kwargs):
         data_inicio_str = request.query_params.get('data_inicio')
@@ -342,7 +609,7 @@ class RelatorioFaturamentoView(APIView):
         data_fim = datetime.datetime.strptime(data_fim_str, '%Y-%m-%d').date()
 
         # Busca os pedidos pagos dentro do período especificado
-        pedidos = Pedido.objects.filter(
+        pedidos = Pedido.objects.select_related('cliente').filter(
             data_criacao__date__range=[data_inicio, data_fim],
             status_pagamento='PAGO'
         ).order_by('data_criacao')
@@ -362,7 +629,7 @@ class RelatorioFaturamentoView(APIView):
         html_string = render_to_string('relatorios/faturamento.html', context)
         
         # Gera o PDF a partir do HTML
-        pdf = HTML(string=html_string).write_pdf()
+        pdf = renderizar_pdf(html_string, 'faturamento')
 
         # Cria a resposta HTTP com o conteúdo do PDF
         response = HttpResponse(pdf, content_type='application/pdf')
@@ -373,9 +640,10 @@ class RelatorioFaturamentoView(APIView):
 
 class OrcamentoPDFView(APIView):
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 4}
 
     def get(self, request, pk, *args, **kwargs):
-        orcamento = get_object_or_404(Orcamento, pk=pk)
+        orcamento = get_object_or_404(Orcamento.objects.select_related('cliente'), pk=pk)
         empresa = Empresa.objects.first()
 
         logo_url = None
@@ -383,7 +651,7 @@ class OrcamentoPDFView(APIView):
             logo_url = request.build_absolute_uri(empresa.logo_orcamento_pdf.url)
         
         # --- A LÓGICA DE CÁLCULO ESTÁ AQUI ---
-        itens = orcamento.itens.all()
+        itens = orcamento.itens.select_related('produto')
         for item in itens:
             # Calcula o valor unitário em Python e o anexa ao objeto do item
             if item.quantidade > 0:
@@ -399,7 +667,7 @@ class OrcamentoPDFView(APIView):
         }
         
         html_string = render_to_string('documentos/orcamento_pdf.html', context)
-        pdf = HTML(string=html_string).write_pdf()
+        pdf = renderizar_pdf(html_string, 'orcamento')
         
         response = HttpResponse(pdf, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="orcamento_{pk}.pdf"'
@@ -407,9 +675,10 @@ class OrcamentoPDFView(APIView):
 
 class PedidoPDFView(APIView):
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 4}
 
     def get(self, request, pk, *args, **kwargs):
-        pedido = get_object_or_404(Pedido, pk=pk)
+        pedido = get_object_or_404(Pedido.objects.select_related('cliente'), pk=pk)
         empresa = Empresa.objects.first()
 
         logo_url = None
@@ -417,7 +686,7 @@ class PedidoPDFView(APIView):
             logo_url = request.build_absolute_uri(empresa.logo_orcamento_pdf.url)
 
         # --- A LÓGICA DE CÁLCULO ESTÁ AQUI ---
-        itens = pedido.itens.all()
+        itens = pedido.itens.select_related('produto')
         for item in itens:
             if item.quantidade > 0:
                 item.valor_unitario = item.subtotal / item.quantidade
@@ -432,24 +701,60 @@ class PedidoPDFView(APIView):
         }
 
         html_string = render_to_string('documentos/pedido_os_pdf.html', context)
-        pdf = HTML(string=html_string).write_pdf()
+        pdf = renderizar_pdf(html_string, 'pedido')
         
         response = HttpResponse(pdf, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="pedido_os_{pk}.pdf"'
         return response
     
 
+class ExtratoClientePDFView(APIView):
+    """ Extrato completo do cliente (pedidos, pagamentos e saldo acumulado) em PDF. """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 4}
+
+    def get(self, request, pk, *args, **kwargs):
+        cliente = get_object_or_404(Cliente, pk=pk)
+        empresa = Empresa.objects.first()
+
+        logo_url = None
+        if empresa and empresa.logo_orcamento_pdf:
+            logo_url = request.build_absolute_uri(empresa.logo_orcamento_pdf.url)
+
+        movimentos, _ = movimentos_cliente(cliente.pk)
+        context = {
+            'cliente': cliente,
+            'movimentos': movimentos,
+            'total_debitos': sum((m['debito'] for m in movimentos), Decimal('0')),
+            'total_creditos': sum((m['credito'] for m in movimentos), Decimal('0')),
+            'saldo_final': movimentos[-1]['saldo'] if movimentos else Decimal('0'),
+            'empresa': empresa,
+            'logo_url': logo_url
+        }
+
+        html_string = render_to_string('documentos/extrato_cliente_pdf.html', context)
+        pdf = renderizar_pdf(html_string, 'extrato_cliente')
+
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="extrato_cliente_{pk}.pdf"'
+        return response
+
+
 class EmpresaSettingsView(APIView):
     """
     View para buscar e atualizar as configurações da empresa (Singleton).
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2, 'put': 3}
 
     def get(self, request, *args, **kwargs):
         # Tenta pegar a primeira (e única) instância, ou cria uma se não existir
         empresa, created = Empresa.objects.get_or_create(pk=1)
-        serializer = EmpresaSerializer(empresa)
-        return Response(serializer.data)
+        # A linha já está carregada: 304 sem serializar se a ETag bater
+        return responder_condicional(
+            request, calcular_etag(request, empresa.atualizado_em), empresa.atualizado_em,
+            lambda: Response(EmpresaSerializer(empresa).data)
+        )
 
     def put(self, request, *args, **kwargs):
         empresa, created = Empresa.objects.get_or_create(pk=1)
@@ -465,6 +770,7 @@ class UserProfileView(APIView):
     View para o usuário logado ver e atualizar seu próprio perfil.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 1, 'put': 2}
 
     def get(self, request, *args, **kwargs):
         # 'request.user' é o usuário logado (graças ao token)
@@ -483,6 +789,7 @@ class ChangePasswordView(APIView):
     View para o usuário logado alterar sua senha.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'post': 2}
 
     def post(self, request, *args, **kwargs):
         serializer = ChangePasswordSerializer(data=request.data)
@@ -507,6 +814,7 @@ class EmpresaPublicaView(APIView):
     como a logo para a tela de login.
     """
     permission_classes = [AllowAny] # Permite o acesso sem token
+    limite_consultas = {'get': 1}
 
     def get(self, request, *args, **kwargs):
         empresa, created = Empresa.objects.get_or_create(pk=1)
@@ -519,159 +827,200 @@ class EvolucaoVendasView(APIView):
     Retorna a receita dos últimos 6 meses para o gráfico de evolução.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2}
 
     def get(self, request, *args, **kwargs):
-        seis_meses_atras = now().date().replace(day=1) - datetime.timedelta(days=30*5)
-        
-        vendas = Pedido.objects.filter(
-            data_criacao__gte=seis_meses_atras,
-            status_pagamento='PAGO'
-        ).annotate(
-            mes=TruncMonth('data_criacao') # Agrupa por mês
-        ).values('mes').annotate(
-            total=Sum('valor_total') # Soma o total para cada mês
-        ).order_by('mes')
-        
-        # Formata os dados para o gráfico
-        data_formatada = [
-            {"name": item['mes'].strftime('%b/%y'), "Receita": item['total']}
-            for item in vendas
-        ]
-        return Response(data_formatada)
+        return Response(widget_evolucao_vendas(ContextoDashboard()))
 
 class PedidosPorStatusView(APIView):
     """
     Retorna a contagem de pedidos agrupados por status de produção.
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2}
 
     def get(self, request, *args, **kwargs):
-        status_counts = Pedido.objects.values('status_producao').annotate(
-            value=Count('id')
-        ).order_by('-value') # Ordena pelos status mais comuns
-        
-        # Renomeia a chave para o gráfico
-        data_formatada = [
-            {"name": item['status_producao'], "value": item['value']}
-            for item in status_counts
-        ]
-        return Response(data_formatada)
+        return Response(widget_pedidos_por_status(ContextoDashboard()))
     
 
 class ProdutosMaisVendidosView(APIView):
     """
-    Retorna os 5 produtos mais vendidos (em quantidade) do mês atual.
+    Retorna os 5 produtos mais vendidos (em quantidade) do mês atual
+    (ou do período ?data_inicio=&data_fim=).
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2}
 
     def get(self, request, *args, **kwargs):
-        today = datetime.date.today()
-        start_of_month = today.replace(day=1)
-
-        # Agrupa os itens de PEDIDOS por produto, soma as quantidades
-        # e ordena pela maior quantidade
-        produtos = ItemPedido.objects.filter(pedido__data_criacao__gte=start_of_month)\
-            .values('produto__nome')\
-            .annotate(total_vendido=Sum('quantidade'))\
-            .order_by('-total_vendido')[:5] # Pega os Top 5
-
-        # Formata os dados para o gráfico de barras
-        data_formatada = [
-            {"name": item['produto__nome'], "value": item['total_vendido']}
-            for item in produtos
-        ]
-        return Response(data_formatada)
+        return Response(widget_produtos_mais_vendidos(ContextoDashboard(*get_date_range(request))))
 
 class ClientesMaisAtivosView(APIView):
     """
     Retorna os 5 clientes que mais geraram faturamento (valor total em pedidos).
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2}
 
     def get(self, request, *args, **kwargs):
-        # Agrupa os PEDIDOS por cliente, soma o valor total de cada cliente
-        # e ordena pelo maior valor
-        clientes = Pedido.objects.values('cliente__nome')\
-            .annotate(
-                total_gasto=Sum('valor_total'),
-                total_pedidos=Count('id')
-            )\
-            .order_by('-total_gasto')[:5] # Pega os Top 5
-
-        # Formata os dados para a lista
-        data_formatada = [
-            {
-                "name": item['cliente__nome'],
-                "total_pedidos": item['total_pedidos'],
-                "total_gasto": item['total_gasto']
-            }
-            for item in clientes
-        ]
-        return Response(data_formatada)
+        return Response(widget_clientes_mais_ativos(ContextoDashboard()))
     
 
 class RelatorioClientesView(APIView):
     """
     View para fornecer dados agregados para a aba de relatórios de clientes.
+    Os números de pedidos vêm da tabela EstatisticaCliente (mantida por sinais).
+    As consultas independentes rodam em paralelo (ver core/concorrencia.py).
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 6}
+    ORDENACOES_INATIVOS = {'total_gasto', '-total_gasto', 'ultimo_pedido', '-ultimo_pedido', 'nome', '-nome'}
 
+    @medir_relatorio('clientes')
     def get(self, request, *args, **kwargs):
         hoje = timezone.now().date()
         data_30_dias_atras = hoje - datetime.timedelta(days=30)
         data_90_dias_atras = hoje - datetime.timedelta(days=90)
 
-        # 1. Total de Clientes
-        total_clientes = Cliente.objects.count()
-
-        # 2. Novos Clientes (cadastrados nos últimos 30 dias)
-        novos_clientes_30d = Cliente.objects.filter(data_cadastro__gte=data_30_dias_atras).count()
-
-        # 3. Clientes Ativos (com pedidos nos últimos 90 dias)
-        clientes_ativos_ids = Pedido.objects.filter(
-            data_criacao__gte=data_90_dias_atras
-        ).values_list('cliente_id', flat=True).distinct()
-        clientes_ativos_90d = len(clientes_ativos_ids)
-        
-        # 4. Clientes Inativos (sem pedidos nos últimos 90 dias)
-        clientes_inativos = Cliente.objects.exclude(id__in=clientes_ativos_ids).annotate(
-            total_gasto=Coalesce(Sum('pedidos__valor_total'), 0.0, output_field=DecimalField()),
-            ultimo_pedido=Max('pedidos__data_criacao__date'),
-            dias_inativo=ExpressionWrapper(
-                hoje - F('ultimo_pedido'),
-                output_field=fields.IntegerField()
-            )
-        ).order_by('-total_gasto')
-
-        # Serializa a lista de inativos
-        inativos_serializer = RelatorioClienteSerializer(clientes_inativos, many=True)
+        # 4. Clientes Inativos (sem pedidos nos últimos 90 dias), paginados e ordenáveis (?ordering=)
+        ordenacao = request.query_params.get('ordering', '-total_gasto')
+        if ordenacao not in self.ORDENACOES_INATIVOS:
+            ordenacao = '-total_gasto'
+        clientes_inativos = Cliente.objects.exclude(
+            estatistica__ultimo_pedido__gte=data_90_dias_atras
+        ).annotate(
+            total_gasto=Coalesce('estatistica__total_gasto', Value(Decimal('0')), output_field=DecimalField()),
+            ultimo_pedido=TruncDate('estatistica__ultimo_pedido'),
+        ).order_by(ordenacao, 'id')
+
+        paginador = PaginacaoRelatorio()
+
+        def inativos():
+            pagina = paginador.paginate_queryset(clientes_inativos, request, view=self)
+            return RelatorioClienteSerializer(pagina, many=True).data
+
+        resultados = executar_em_paralelo({
+            # 1. Total de Clientes
+            'total_clientes': Cliente.objects.count,
+            # 2. Novos Clientes (cadastrados nos últimos 30 dias)
+            'novos_clientes_30d': Cliente.objects.filter(data_cadastro__gte=data_30_dias_atras).count,
+            # 3. Clientes Ativos (com pedidos nos últimos 90 dias), lidos da tabela de estatísticas
+            'clientes_ativos_90d': EstatisticaCliente.objects.filter(ultimo_pedido__gte=data_90_dias_atras).count,
+            'lista_inativos': inativos,
+        })
 
         # Monta o objeto de resposta final
         data = {
-            'total_clientes': total_clientes,
-            'novos_clientes_30d': novos_clientes_30d,
-            'clientes_ativos_90d': clientes_ativos_90d,
-            'clientes_inativos_90d': clientes_inativos.count(),
-            'lista_inativos': inativos_serializer.data
+            'total_clientes': resultados['total_clientes'],
+            'novos_clientes_30d': resultados['novos_clientes_30d'],
+            'clientes_ativos_90d': resultados['clientes_ativos_90d'],
+            'clientes_inativos_90d': paginador.page.paginator.count,
+            'lista_inativos': resultados['lista_inativos'],
+            'paginacao_inativos': {
+                'pagina': paginador.page.number,
+                'total_paginas': paginador.page.paginator.num_pages,
+                'next': paginador.get_next_link(),
+                'previous': paginador.get_previous_link(),
+            },
         }
         
         return Response(data)
+
+
+class SegmentacaoClientesView(generics.ListAPIView):
+    """
+    Segmentação RFM dos clientes, lida da tabela EstatisticaCliente.
+    Filtros: ?segmento=CAMPEOES, ?search=<nome>; ordenação: ?ordering=-total_gasto.
+    A resposta traz também a contagem de clientes por segmento.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 4}
+    serializer_class = EstatisticaClienteSerializer
+    queryset = EstatisticaCliente.objects.select_related('cliente')
+    pagination_class = PaginacaoRelatorio
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['segmento']
+    search_fields = ['cliente__nome']
+    ordering_fields = ['total_gasto', 'ticket_medio', 'total_pedidos', 'ultimo_pedido', 'primeiro_pedido']
+    ordering = ['-total_gasto']
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data['segmentos'] = list(
+            EstatisticaCliente.objects.order_by().values('segmento').annotate(value=Count('cliente'))
+        )
+        return response
     
 
+class RelatorioContasReceberView(APIView):
+    """
+    Aging de contas a receber: saldo em aberto de cada cliente por faixa de atraso,
+    contado a partir do previsto_entrega (ou da data de criação, se não houver).
+    As faixas saem de uma única consulta agrupada por cliente (agregação condicional
+    sobre o saldo de cada pedido = valor_total - pagamentos). Paginado (?page, ?page_size).
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 4}
+    FAIXAS = ('a_vencer', 'dias_0_30', 'dias_31_60', 'dias_61_90', 'dias_90_mais')
+
+    @medir_relatorio('contas_a_receber')
+    def get(self, request, *args, **kwargs):
+        hoje = timezone.localdate()
+        decimal = DecimalField(max_digits=12, decimal_places=2)
+
+        pagos = Pagamento.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido')\
+            .annotate(total=Sum('valor')).values('total')
+        referencia = Coalesce('previsto_entrega', TruncDate('data_criacao'))
+
+        def faixa(condicao):
+            return Coalesce(Sum(Case(When(condicao, then=F('saldo')), output_field=decimal)), Value(Decimal('0')), output_field=decimal)
+
+        em_aberto = Pedido.objects.filter(
+            status_pagamento__in=[Pedido.StatusPagamento.PENDENTE, Pedido.StatusPagamento.PARCIAL]
+        ).annotate(
+            referencia=referencia,
+            saldo=ExpressionWrapper(
+                F('valor_total') - Coalesce(Subquery(pagos, output_field=decimal), Value(Decimal('0'))),
+                output_field=decimal
+            ),
+        ).filter(saldo__gt=0)
+
+        limite_30 = hoje - datetime.timedelta(days=30)
+        limite_60 = hoje - datetime.timedelta(days=60)
+        limite_90 = hoje - datetime.timedelta(days=90)
+        agregacoes = {
+            'a_vencer': faixa(Q(referencia__gt=hoje)),
+            'dias_0_30': faixa(Q(referencia__lte=hoje, referencia__gte=limite_30)),
+            'dias_31_60': faixa(Q(referencia__lt=limite_30, referencia__gte=limite_60)),
+            'dias_61_90': faixa(Q(referencia__lt=limite_60, referencia__gte=limite_90)),
+            'dias_90_mais': faixa(Q(referencia__lt=limite_90)),
+            'total': Coalesce(Sum('saldo'), Value(Decimal('0')), output_field=decimal),
+        }
+
+        por_cliente = em_aberto.order_by().values('cliente_id', 'cliente__nome')\
+            .annotate(pedidos_em_aberto=Count('id'), **agregacoes)\
+            .order_by('-total', 'cliente_id')
+
+        paginador = PaginacaoRelatorio()
+        pagina = paginador.paginate_queryset(por_cliente, request, view=self)
+        resposta = paginador.get_paginated_response(pagina)
+        resposta.data['totais'] = em_aberto.aggregate(**agregacoes)
+        return resposta
+
+
 class RelatorioPedidosView(APIView):
     """
     Fornece todos os dados agregados para a aba de relatórios de pedidos.
+    As consultas independentes rodam em paralelo (ver core/concorrencia.py).
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 6}
 
+    @medir_relatorio('pedidos')
     def get(self, request, *args, **kwargs):
         hoje = timezone.now().date()
-        
-        # 1. Total de Pedidos
-        total_pedidos = Pedido.objects.count()
 
         # 2. Pedidos Atrasados (count e lista)
-        pedidos_atrasados_query = Pedido.objects.filter(
+        pedidos_atrasados_query = Pedido.objects.select_related('cliente').filter(
             previsto_entrega__lt=hoje,
             status_producao__in=['Aguardando', 'Aguardando Arte', 'Em Produção']
         ).annotate(
@@ -680,36 +1029,48 @@ class RelatorioPedidosView(APIView):
                 output_field=fields.DurationField()
             )
         )
-        pedidos_atrasados_count = pedidos_atrasados_query.count()
-        lista_atrasados = RelatorioPedidosAtrasadosSerializer(pedidos_atrasados_query, many=True).data
 
         # 3. Lucro Médio por Pedido
-        lucro_medio = Pedido.objects.filter(status_pagamento='PAGO').aggregate(
-            lucro_avg=Avg(F('valor_total') - F('custo_producao'))
-        )['lucro_avg'] or 0
+        def lucro_medio():
+            return Pedido.objects.filter(status_pagamento='PAGO').aggregate(
+                lucro_avg=Avg(F('valor_total') - F('custo_producao'))
+            )['lucro_avg'] or 0
 
         # 4. Tempo Médio de Produção (calcula de 'criado' até 'finalizado')
-        pedidos_finalizados = Pedido.objects.filter(status_producao='Finalizado')
-        tempo_medio = pedidos_finalizados.annotate(
-            tempo_producao=ExpressionWrapper(F('data_producao') - F('data_criacao'), output_field=fields.DurationField())
-        ).aggregate(
-            avg_tempo=Avg('tempo_producao')
-        )['avg_tempo']
-        
+        def tempo_medio():
+            pedidos_finalizados = Pedido.objects.filter(status_producao='Finalizado')
+            return pedidos_finalizados.annotate(
+                tempo_producao=ExpressionWrapper(F('data_producao') - F('data_criacao'), output_field=fields.DurationField())
+            ).aggregate(
+                avg_tempo=Avg('tempo_producao')
+            )['avg_tempo']
+
         # 5. Pedidos por Forma de Pagamento (CONTAGEM de pagamentos)
-        pedidos_por_pagamento = Pagamento.objects.values('forma_pagamento').annotate(
-            value=Count('id')
-        ).order_by('-value')
-        pedidos_por_pagamento_data = FormaPagamentoAgrupadoSerializer(pedidos_por_pagamento, many=True).data
+        def pedidos_por_pagamento():
+            agrupados = Pagamento.objects.values('forma_pagamento').annotate(
+                value=Count('id')
+            ).order_by('-value')
+            return FormaPagamentoAgrupadoSerializer(agrupados, many=True).data
+
+        resultados = executar_em_paralelo({
+            # 1. Total de Pedidos
+            'total_pedidos': Pedido.objects.count,
+            # A lista já traz todos os atrasados: a contagem sai do tamanho dela
+            'lista_atrasados': lambda: RelatorioPedidosAtrasadosSerializer(pedidos_atrasados_query, many=True).data,
+            'lucro_medio': lucro_medio,
+            'tempo_medio': tempo_medio,
+            'pedidos_por_pagamento': pedidos_por_pagamento,
+        })
+        tempo_medio = resultados['tempo_medio']
 
         # Monta o objeto de resposta final
         data = {
-            'total_pedidos': total_pedidos,
-            'pedidos_atrasados_count': pedidos_atrasados_count,
-            'lucro_medio_pedido': lucro_medio,
+            'total_pedidos': resultados['total_pedidos'],
+            'pedidos_atrasados_count': len(resultados['lista_atrasados']),
+            'lucro_medio_pedido': resultados['lucro_medio'],
             'tempo_medio_producao_dias': tempo_medio.days if tempo_medio else 0,
-            'lista_pedidos_atrasados': lista_atrasados,
-            'pedidos_por_forma_pagamento': pedidos_por_pagamento_data,
+            'lista_pedidos_atrasados': resultados['lista_atrasados'],
+            'pedidos_por_forma_pagamento': resultados['pedidos_por_pagamento'],
         }
         
         return Response(data)
@@ -718,34 +1079,46 @@ class RelatorioPedidosView(APIView):
 class RelatorioOrcamentosView(APIView):
     """
     Fornece todos os dados agregados para a aba de relatórios de orçamentos.
+    As consultas independentes rodam em paralelo (ver core/concorrencia.py).
     """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 7}
 
+    @medir_relatorio('orcamentos')
     def get(self, request, *args, **kwargs):
         orcamentos = Orcamento.objects.all()
-        
-        # --- 1. Cálculos para os Cards ---
-        total_orcamentos = orcamentos.count()
-        aprovados = orcamentos.filter(status='Aprovado').count()
-        recusados = orcamentos.filter(status='Rejeitado').count()
-        pendentes = orcamentos.filter(status='Em Aberto').count()
-        
+        aprovado = Q(status='Aprovado')
+
+        resultados = executar_em_paralelo({
+            # --- 1. Cálculos para os Cards (uma única agregação condicional) ---
+            'cards': lambda: orcamentos.aggregate(
+                total_orcamentos=Count('id'),
+                aprovados=Count('id', filter=aprovado),
+                recusados=Count('id', filter=Q(status='Rejeitado')),
+                valor_total_orcado=Sum('valor_total'),
+                valor_total_aprovado=Sum('valor_total', filter=aprovado),
+            ),
+            # --- 2. Dados para o Gráfico de Pizza (Status) ---
+            'status': lambda: StatusOrcamentoAgrupadoSerializer(
+                orcamentos.values('status').annotate(value=Count('id')), many=True
+            ).data,
+            # --- 3. Dados para o Gráfico de Barras (Top Produtos Orçados) ---
+            'produtos': lambda: ProdutosOrcadosAgrupadoSerializer(
+                ItemOrcamento.objects.values('produto__nome').annotate(value=Count('id')).order_by('-value')[:5], many=True
+            ).data,
+            # --- 4. Dados para a Tabela (Orçamentos Recentes) ---
+            'recentes': lambda: RelatorioOrcamentoRecenteSerializer(
+                orcamentos.select_related('cliente').prefetch_related('itens').order_by('-data_criacao')[:6], many=True
+            ).data,
+        })
+
+        cards = resultados['cards']
+        total_orcamentos = cards['total_orcamentos']
+        aprovados = cards['aprovados']
+        recusados = cards['recusados']
         taxa_conversao = (aprovados / total_orcamentos * 100) if total_orcamentos > 0 else 0
-        
-        valor_total_orcado = orcamentos.aggregate(total=Sum('valor_total'))['total'] or 0
-        valor_total_aprovado = orcamentos.filter(status='Aprovado').aggregate(total=Sum('valor_total'))['total'] or 0
-        
-        # --- 2. Dados para o Gráfico de Pizza (Status) ---
-        status_data = orcamentos.values('status').annotate(value=Count('id'))
-        status_serializer = StatusOrcamentoAgrupadoSerializer(status_data, many=True)
-
-        # --- 3. Dados para o Gráfico de Barras (Top Produtos Orçados) ---
-        produtos_data = ItemOrcamento.objects.values('produto__nome').annotate(value=Count('id')).order_by('-value')[:5]
-        produtos_serializer = ProdutosOrcadosAgrupadoSerializer(produtos_data, many=True)
-        
-        # --- 4. Dados para a Tabela (Orçamentos Recentes) ---
-        recentes_data = orcamentos.order_by('-data_criacao')[:6]
-        recentes_serializer = RelatorioOrcamentoRecenteSerializer(recentes_data, many=True)
+        valor_total_orcado = cards['valor_total_orcado'] or 0
+        valor_total_aprovado = cards['valor_total_aprovado'] or 0
         
         # Monta o objeto de resposta final
         data = {
@@ -758,50 +1131,63 @@ class RelatorioOrcamentosView(APIView):
                 'aprovados_count': aprovados,
                 'recusados_count': recusados,
             },
-            'grafico_status': status_serializer.data,
-            'grafico_produtos': produtos_serializer.data,
-            'tabela_recentes': recentes_serializer.data,
+            'grafico_status': resultados['status'],
+            'grafico_produtos': resultados['produtos'],
+            'tabela_recentes': resultados['recentes'],
         }
         
         return Response(data)
     
 
 class RelatorioProdutosView(APIView):
+    """
+    Dados da aba de relatórios de produtos. As vendas vêm da tabela fato
+    VendaProdutoMensal (granularidade mensal). Com ?data_inicio=&data_fim=
+    os gráficos de vendidos e lucrativos usam os meses do período; sem eles,
+    mais vendidos = mês atual e mais lucrativos = todo o histórico.
+    As consultas independentes rodam em paralelo (ver core/concorrencia.py).
+    """
     permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 6}
+    @medir_relatorio('produtos')
     def get(self, request, *args, **kwargs):
         hoje = timezone.now().date()
         data_60_dias_atras = hoje - datetime.timedelta(days=60)
         start_of_month = hoje.replace(day=1)
 
-        agregados_produto = Produto.objects.aggregate(
-            total_produtos=Count('id'),
-            custo_medio=Avg('custo'),
-            preco_medio=Avg('preco')
-        )
+        vendas = VendaProdutoMensal.objects.all()
+        if request.query_params.get('data_inicio') and request.query_params.get('data_fim'):
+            data_inicio, data_fim = get_date_range(request)
+            vendas_periodo = vendas.filter(mes__gte=data_inicio.replace(day=1), mes__lte=data_fim)
+            vendas_lucrativas = vendas_periodo
+        else:
+            vendas_periodo = vendas.filter(mes=start_of_month)
+            vendas_lucrativas = vendas
+
+        def agregados_produto():
+            return Produto.objects.aggregate(
+                total_produtos=Count('id'),
+                custo_medio=Avg('custo'),
+                preco_medio=Avg('preco')
+            )
+
         alertas_estoque = Produto.objects.filter(
             estoque_atual__isnull=False, 
             estoque_minimo__gt=0, 
             estoque_atual__lt=F('estoque_minimo')
-        ).count()
-        cards_data = {
-            "total_produtos": agregados_produto['total_produtos'] or 0,
-            "custo_medio": agregados_produto['custo_medio'] or 0,
-            "preco_medio_venda": agregados_produto['preco_medio'] or 0,
-            "alertas_estoque": alertas_estoque,
-        }
+        ).count
 
-        produtos_vendidos = ItemPedido.objects.filter(pedido__data_criacao__gte=start_of_month)\
+        produtos_vendidos = vendas_periodo\
             .values('produto__nome')\
             .annotate(total_vendido=Sum('quantidade'))\
             .order_by('-total_vendido')[:5]
-        grafico_vendidos_serializer = RelatorioProdutoVendidoSerializer(produtos_vendidos, many=True)
 
-        produtos_lucrativos = ItemPedido.objects.filter(produto__custo__gt=0, produto__preco__gt=0)\
+        produtos_lucrativos = vendas_lucrativas.filter(produto__custo__gt=0, produto__preco__gt=0)\
             .values('produto__nome')\
             .annotate(
-                total_lucro=Sum(F('subtotal') - (F('produto__custo') * F('quantidade'))),
-                receita_total=Sum('subtotal'),
-                custo_total=Sum(F('produto__custo') * F('quantidade'))
+                total_lucro=Sum(F('receita') - F('custo')),
+                receita_total=Sum('receita'),
+                custo_total=Sum('custo')
             )\
             .annotate(
                 # AQUI ESTÁ A CORREÇÃO:
@@ -815,24 +1201,211 @@ class RelatorioProdutosView(APIView):
                 )
             )\
             .order_by('-total_lucro')[:6]
-        lucrativos_serializer = RelatorioProdutoLucrativoSerializer(produtos_lucrativos, many=True)
         
         produtos_baixa_demanda = Produto.objects.annotate(
-            ultima_venda=Max('itempedido__pedido__data_criacao__date')
+            ultima_venda=Max('vendas_mensais__ultima_venda')
         ).filter(
             Q(ultima_venda__lt=data_60_dias_atras) | Q(ultima_venda__isnull=True)
-        ).annotate(
-            dias_sem_venda=ExpressionWrapper(
-                hoje - F('ultima_venda'),
-                output_field=fields.DurationField()
-            )
         ).order_by('ultima_venda')[:6]
-        baixa_demanda_serializer = RelatorioProdutoBaixaDemandaSerializer(produtos_baixa_demanda, many=True)
+
+        resultados = executar_em_paralelo({
+            'agregados_produto': agregados_produto,
+            'alertas_estoque': alertas_estoque,
+            'vendidos': lambda: RelatorioProdutoVendidoSerializer(produtos_vendidos, many=True).data,
+            'lucrativos': lambda: RelatorioProdutoLucrativoSerializer(produtos_lucrativos, many=True).data,
+            'baixa_demanda': lambda: RelatorioProdutoBaixaDemandaSerializer(produtos_baixa_demanda, many=True).data,
+        })
+        agregados = resultados['agregados_produto']
+        cards_data = {
+            "total_produtos": agregados['total_produtos'] or 0,
+            "custo_medio": agregados['custo_medio'] or 0,
+            "preco_medio_venda": agregados['preco_medio'] or 0,
+            "alertas_estoque": resultados['alertas_estoque'],
+        }
 
         data = {
             'cards': cards_data,
-            'grafico_mais_vendidos': grafico_vendidos_serializer.data,
-            'lista_mais_lucrativos': lucrativos_serializer.data,
-            'tabela_baixa_demanda': baixa_demanda_serializer.data,
+            'grafico_mais_vendidos': resultados['vendidos'],
+            'lista_mais_lucrativos': resultados['lucrativos'],
+            'tabela_baixa_demanda': resultados['baixa_demanda'],
         }
-        return Response(data)
\ No newline at end of file
+        return Response(data)
+
+class ImportacaoCSVView(APIView):
+    """
+    Importação em massa de clientes ou produtos a partir de um CSV enviado
+    no campo 'arquivo' (multipart). Retorna os totais e os erros por linha.
+    Para clientes, '?somente_novos=true' não atualiza CPF/CNPJ já cadastrados.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'post': 5}
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, tipo, *args, **kwargs):
+        importador = IMPORTADORES.get(tipo)
+        if importador is None:
+            return Response({'error': 'Tipo de importação inválido.'}, status=status.HTTP_404_NOT_FOUND)
+
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            return Response({'error': 'Envie o arquivo CSV no campo "arquivo".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        opcoes = {}
+        if importador is importar_clientes:
+            opcoes['atualizar_existentes'] = request.query_params.get('somente_novos') != 'true'
+
+        texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+        try:
+            resultado = importador(texto, **opcoes)
+        except ArquivoIlegivel as exc:
+            # Conferido antes do primeiro lote: nada foi gravado
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            texto.detach()
+
+        return Response(resultado.como_dict())
+
+
+class CotacaoLoteView(APIView):
+    """
+    Cotação sem estado: precifica várias combinações de produto, medidas e quantidade
+    de uma vez (fluxo de "simular" do comercial). Nada é gravado; uma única consulta
+    carrega os preços dos produtos envolvidos.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'post': 2}
+
+    def post(self, request, *args, **kwargs):
+        serializer = CotacaoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+
+        faixas = []
+        if dados['aplicar_descontos']:
+            faixas = dados.get('faixas', getattr(settings, 'FAIXAS_DESCONTO_QUANTIDADE', []))
+
+        linhas = dados['linhas']
+        tabela = carregar_tabela_precos(ids=[linha['produto'] for linha in linhas])
+        resultados = precificar_linhas(linhas, tabela, faixas)
+
+        validas = [resultado for resultado in resultados if 'erro' not in resultado]
+        return Response({
+            'linhas': resultados,
+            'total_bruto': sum((resultado['subtotal_bruto'] for resultado in validas), Decimal('0.00')),
+            'total_desconto': sum((resultado['desconto'] for resultado in validas), Decimal('0.00')),
+            'total': sum((resultado['subtotal'] for resultado in validas), Decimal('0.00')),
+        })
+
+
+class SimulacaoPrecosView(APIView):
+    """
+    Simulação "e se" de reajustes de preço e custo sobre os itens vendidos nos últimos
+    12 meses. GET mostra a base do snapshot; POST avalia vários cenários de uma vez.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 2, 'post': 2}
+
+    def get(self, request, *args, **kwargs):
+        return Response(resumo_base(snapshot_itens.obter()))
+
+    def post(self, request, *args, **kwargs):
+        serializer = SimulacaoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        snapshot = snapshot_itens.obter()
+        return Response({
+            'base': resumo_base(snapshot),
+            'cenarios': simular_cenarios(snapshot, serializer.validated_data['cenarios']),
+        })
+
+
+# ---------- SINCRONIZAÇÃO INCREMENTAL ----------
+class SincronizacaoView(APIView):
+    """
+    Criados, alterados e excluídos desde o cursor (ver core/sincronizacao.py).
+    Sem ?cursor= devolve a carga inicial; ?limite= por conjunto (padrão 500).
+    Cursor expirado responde 410: o cliente descarta os dados locais e recomeça.
+    """
+    permission_classes = [IsAuthenticated]
+    limite_consultas = {'get': 11}
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limite = max(int(request.query_params.get('limite', 0)), 0) or None
+        except ValueError:
+            limite = None
+        try:
+            return Response(sincronizar(cursor=request.query_params.get('cursor'), limite=limite))
+        except CursorExpirado as exc:
+            return Response({'error': str(exc), 'reiniciar': True}, status=status.HTTP_410_GONE)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# ---------- PERFIS SOB DEMANDA ----------
+class PerfilListView(APIView):
+    """ Perfis de requisição gravados pelo PerfilMiddleware, do mais recente para o mais antigo. """
+    permission_classes = [IsAdminUser]
+    limite_consultas = {'get': 1}
+
+    def get(self, request, *args, **kwargs):
+        perfis = listar_perfis(configuracao_perfis()['diretorio'])
+        for perfil in perfis:
+            perfil['url'] = request.build_absolute_uri(reverse('perfil-arquivo', args=[perfil['nome']]))
+        return Response(perfis)
+
+
+class PerfilArquivoView(APIView):
+    """ Download do arquivo de um perfil (.prof para o snakeviz, .speedscope.json para o speedscope). """
+    permission_classes = [IsAdminUser]
+    limite_consultas = {'get': 1}
+
+    def get(self, request, nome, *args, **kwargs):
+        arquivo = arquivo_do_perfil(configuracao_perfis()['diretorio'], nome)
+        if arquivo is None:
+            raise Http404
+        return FileResponse(arquivo.open('rb'), as_attachment=True, filename=arquivo.name)
+
+
+# ---------- EVENTOS EM TEMPO REAL (SSE) ----------
+def usuario_do_token(request):
+    """
+    Autentica pelo JWT do cabeçalho Authorization ou de ?token= (o EventSource
+    do navegador não envia cabeçalhos). Retorna None se o token for inválido.
+    """
+    autenticador = JWTAuthentication()
+    token = request.GET.get('token')
+    if not token:
+        cabecalho = autenticador.get_header(request)
+        token = cabecalho and autenticador.get_raw_token(cabecalho)
+    if not token:
+        return None
+    try:
+        return autenticador.get_user(autenticador.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+class EventosView(View):
+    """
+    Stream SSE com os eventos de mudança (pedido_criado, pedido_status, pedido_excluido,
+    pagamento_recebido). Cada evento traz em 'atualizar' quais telas devem buscar os
+    dados de novo, no lugar do polling dos relatórios. Requer servidor ASGI.
+    """
+    limite_consultas = {'get': 1}
+
+    async def get(self, request, *args, **kwargs):
+        usuario = await sync_to_async(usuario_do_token)(request)
+        if usuario is None or not usuario.is_active:
+            return JsonResponse({'detail': 'Token inválido ou ausente.'}, status=401)
+
+        ultimo_id = request.headers.get('Last-Event-ID') or request.GET.get('ultimo_id')
+        try:
+            ultimo_id = int(ultimo_id) if ultimo_id else None
+        except ValueError:
+            ultimo_id = None
+
+        response = StreamingHttpResponse(fluxo_eventos(ultimo_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Desliga o buffer do nginx
+        return response